@@ -0,0 +1,232 @@
+import math
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+# ==========================================
+# ADMISSION CONTROL FOR GEMINI CALLS
+# ==========================================
+# Chat and ingestion share one Gemini quota. Every embed/generate call
+# first takes a slot from the model's AdmissionController:
+#   - a token bucket refilled at the quota's requests-per-minute,
+#   - a cap on calls in flight, part of which is reserved for interactive
+#     calls so a bulk run can never hold every slot,
+#   - priority lanes: waiting "interactive" calls (chat) are always
+#     admitted before "bulk" ones (ingestion, /chat/batch), and the bulk
+#     lane has its own, smaller bucket so it can never use the whole quota,
+#   - a bounded queue per lane with a maximum wait. A full queue or an
+#     expired wait raises Overloaded at once, which the API turns into
+#     503 + Retry-After instead of letting calls pile up into 429s.
+# The lane comes from a ContextVar, so tasks started by an ingest job or a
+# batch request inherit it.
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+current_lane: ContextVar[str] = ContextVar("miv_admission_lane", default=INTERACTIVE)
+
+class Overloaded(Exception):
+    """No slot could be granted in time; retry_after is a hint in seconds"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TokenBucket:
+    def __init__(self, rate_per_s: float, burst: float):
+        self.rate_per_s = rate_per_s
+        self.burst = burst
+        self.tokens = burst
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate_per_s)
+        self._updated = now
+
+    def wait_time(self, cost: float = 1.0) -> float:
+        """Seconds until `cost` tokens are available (0 if they are now)"""
+        self._refill()
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate_per_s
+
+    def take(self, cost: float = 1.0):
+        self._refill()
+        self.tokens -= cost
+
+class _Lane:
+    def __init__(self, name: str, max_queued: int, max_wait_s: float, bucket: Optional[TokenBucket]):
+        self.name = name
+        self.max_queued = max_queued
+        self.max_wait_s = max_wait_s
+        self.bucket = bucket          # Lane-specific cap on top of the shared bucket
+        self.waiters = deque()        # Futures, first come first served
+        self.in_flight = 0
+        self.max_in_flight = None     # Lane-specific cap on top of the shared one
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+
+class AdmissionController:
+    def __init__(self, name: str, requests_per_minute: float, max_in_flight: int,
+                 interactive_queue: int = 100, interactive_wait_s: float = 5.0,
+                 bulk_queue: int = 64, bulk_wait_s: float = 300.0, bulk_share: float = 0.5,
+                 interactive_reserved_share: float = 0.25):
+        self.name = name
+        rate = requests_per_minute / 60.0
+        # One second of burst, but always at least one call
+        self.bucket = TokenBucket(rate, max(1.0, rate))
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.lanes: Dict[str, _Lane] = {
+            INTERACTIVE: _Lane(INTERACTIVE, interactive_queue, interactive_wait_s, None),
+            BULK: _Lane(BULK, bulk_queue, bulk_wait_s,
+                        TokenBucket(rate * bulk_share, max(1.0, rate * bulk_share))),
+        }
+        # Slots bulk calls may never take (at least one, but bulk keeps one too)
+        reserved = max(1, round(max_in_flight * interactive_reserved_share)) if max_in_flight > 1 else 0
+        self.lanes[BULK].max_in_flight = max_in_flight - reserved
+        self._timer = None
+
+    # -----------------------------
+    # Public API
+    # -----------------------------
+    @asynccontextmanager
+    async def slot(self, lane: Optional[str] = None):
+        """Hold one admitted call for the duration of the block"""
+        lane = lane or current_lane.get()
+        await self.acquire(lane)
+        try:
+            yield
+        finally:
+            self._release(self.lanes[lane])
+
+    def check(self, lane: Optional[str] = None):
+        """Raise Overloaded now if the lane's queue is already full"""
+        lane = self.lanes[lane or current_lane.get()]
+        if len(lane.waiters) >= lane.max_queued:
+            lane.rejected += 1
+            raise Overloaded(f"{self.name}: {lane.name} queue is full", self._retry_after(lane))
+
+    async def acquire(self, lane_name: str):
+        lane = self.lanes[lane_name]
+        self.check(lane_name)
+
+        future = asyncio.get_running_loop().create_future()
+        lane.waiters.append(future)
+        queued_at = time.monotonic()
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=lane.max_wait_s)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # Admitted just as the wait ran out: keep the slot
+                pass
+            else:
+                future.cancel()
+                self._discard(lane, future)
+                lane.rejected += 1
+                raise Overloaded(
+                    f"{self.name}: waited {lane.max_wait_s:.0f}s for a {lane.name} slot",
+                    self._retry_after(lane)
+                )
+        except BaseException:
+            # Caller cancelled: give back a slot granted in the meantime
+            if future.done() and not future.cancelled():
+                self._release(lane)
+            else:
+                future.cancel()
+                self._discard(lane, future)
+            raise
+        lane.admitted += 1
+        lane.wait_seconds += time.monotonic() - queued_at
+
+    # -----------------------------
+    # Scheduling
+    # -----------------------------
+    def _release(self, lane: _Lane):
+        self.in_flight -= 1
+        lane.in_flight -= 1
+        self._dispatch()
+
+    def _discard(self, lane: _Lane, future):
+        try:
+            lane.waiters.remove(future)
+        except ValueError:
+            pass
+
+    def _dispatch(self):
+        """Admit waiters in priority order while capacity and tokens allow"""
+        retry_in = None
+        for lane in self.lanes.values():  # INTERACTIVE first
+            while lane.waiters:
+                head = lane.waiters[0]
+                if head.done():
+                    lane.waiters.popleft()
+                    continue
+                if self.in_flight >= self.max_in_flight:
+                    return  # A release will dispatch again
+                if lane.max_in_flight is not None and lane.in_flight >= lane.max_in_flight:
+                    break  # Remaining slots are reserved for earlier lanes; a release retries
+                wait = self.bucket.wait_time()
+                if wait > 0:
+                    # Nobody behind a higher-priority waiter may take the token
+                    self._schedule(wait)
+                    return
+                if lane.bucket is not None:
+                    lane_wait = lane.bucket.wait_time()
+                    if lane_wait > 0:
+                        retry_in = lane_wait if retry_in is None else min(retry_in, lane_wait)
+                        break  # Lane over its share; later lanes may still go
+                    lane.bucket.take()
+                self.bucket.take()
+                self.in_flight += 1
+                lane.in_flight += 1
+                lane.waiters.popleft()
+                head.set_result(None)
+        if retry_in is not None:
+            self._schedule(retry_in)
+
+    def _schedule(self, delay: float):
+        """Dispatch again once tokens have refilled (keeps the earliest pending wake-up)"""
+        loop = asyncio.get_running_loop()
+        when = loop.time() + delay
+        if self._timer is not None:
+            if self._timer.when() <= when:
+                return
+            self._timer.cancel()
+
+        def fire():
+            self._timer = None
+            self._dispatch()
+
+        self._timer = loop.call_at(when, fire)
+
+    def _retry_after(self, lane: _Lane) -> int:
+        """Rough seconds until a new caller in this lane would be admitted"""
+        rate = (lane.bucket or self.bucket).rate_per_s
+        ahead = len(lane.waiters)
+        if lane.name != INTERACTIVE:
+            ahead += len(self.lanes[INTERACTIVE].waiters)
+        return max(1, math.ceil((ahead + 1) / rate))
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "requests_per_minute": round(self.bucket.rate_per_s * 60),
+            "lanes": {
+                name: {
+                    "queued": len(lane.waiters),
+                    "in_flight": lane.in_flight,
+                    "admitted": lane.admitted,
+                    "rejected": lane.rejected,
+                    "avg_wait_ms": round(lane.wait_seconds / lane.admitted * 1000, 1) if lane.admitted else 0.0,
+                }
+                for name, lane in self.lanes.items()
+            },
+        }
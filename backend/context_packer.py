@@ -0,0 +1,139 @@
+import re
+import math
+import threading
+from functools import lru_cache
+from typing import Callable, List, Optional
+
+import numpy as np
+
+# ==========================================
+# TOKEN-BUDGET CONTEXT PACKER (MMR)
+# ==========================================
+# Retrieved chunks overlap: smart_chunk_text repeats 512 characters between
+# neighbours, and the same passage can come back from both the dense and
+# the BM25 lists. Instead of concatenating everything and slicing at a
+# character limit, chunks are picked greedily by maximal marginal
+# relevance (relevance minus similarity to what is already picked), near
+# duplicates are dropped outright, and only whole chunks that still fit
+# the token budget are kept.
+
+CHARS_PER_TOKEN = 4          # Estimate used until (or unless) the tokenizer loads
+DUPLICATE_SIMILARITY = 0.95  # Cosine at or above this is the same passage
+DUPLICATE_CONTAINMENT = 0.6  # Share of a chunk's shingles already in the context
+SHINGLE_WORDS = 5
+
+class TokenCounter:
+    """
+    Counts tokens with the Gemini tokenizer from google-genai's local
+    tokenizer when it is installed (sentencepiece), otherwise estimates
+    from character length. load() is blocking and may download the
+    tokenizer model, so it runs during startup warm-up.
+    """
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._tokenizer = None
+        self._lock = threading.Lock()
+        self.exact = False
+
+    def load(self) -> bool:
+        try:
+            from google.genai.local_tokenizer import LocalTokenizer
+            tokenizer = LocalTokenizer(model_name=self.model_name)
+            tokenizer.count_tokens("warm up")
+        except Exception as e:
+            print(f"⚠️ Local tokenizer unavailable, estimating tokens from length: {e}")
+            return False
+        with self._lock:
+            self._tokenizer = tokenizer
+            self.exact = True
+            self._count_cached.cache_clear()
+        print(f"🔢 Local tokenizer loaded for {self.model_name}")
+        return True
+
+    def count(self, text: str) -> int:
+        return self._count_cached(text)
+
+    @lru_cache(maxsize=4096)
+    def _count_cached(self, text: str) -> int:
+        tokenizer = self._tokenizer
+        if tokenizer is not None:
+            return tokenizer.count_tokens(text).total_tokens
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+_WORD = re.compile(r"\w+")
+
+def _shingles(text: str) -> set:
+    words = _WORD.findall(text.lower())
+    if len(words) < SHINGLE_WORDS:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+def _unit(vector) -> Optional[np.ndarray]:
+    if not vector:
+        return None
+    v = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(v)
+    return v / norm if norm else None
+
+def pack_context(candidates: List[dict], budget_tokens: int,
+                 count_tokens: Callable[[str], int], mmr_lambda: float = 0.7,
+                 pinned: Optional[dict] = None) -> List[dict]:
+    """
+    Choose whole chunks for the prompt within budget_tokens.
+
+    candidates are dicts with "text" (the formatted context block),
+    "relevance" and optionally "values" (embedding). pinned (the Knowledge
+    Map entry) is always placed first and counts against the budget.
+    Returns the chosen dicts in prompt order, each with "tokens" set.
+    """
+    selected = []
+    selected_units = []
+    seen_shingles = set()
+    remaining = budget_tokens
+
+    def take(item: dict, unit, shingles: set):
+        nonlocal remaining
+        remaining -= item["tokens"]
+        selected.append(item)
+        if unit is not None:
+            selected_units.append(unit)
+        seen_shingles.update(shingles)
+
+    if pinned is not None:
+        pinned = {**pinned, "tokens": count_tokens(pinned["text"])}
+        take(pinned, _unit(pinned.get("values")), _shingles(pinned["text"]))
+
+    pool = []
+    for c in candidates:
+        pool.append({
+            "item": {**c, "tokens": count_tokens(c["text"])},
+            "unit": _unit(c.get("values")),
+            "shingles": _shingles(c["text"]),
+        })
+
+    while pool and remaining > 0:
+        best, best_score = None, None
+        for entry in list(pool):
+            unit, shingles = entry["unit"], entry["shingles"]
+            # Redundancy: cosine to picked chunks, or shingle overlap without vectors
+            redundancy = 0.0
+            if unit is not None and selected_units:
+                redundancy = float(max(np.dot(s, unit) for s in selected_units))
+            containment = len(shingles & seen_shingles) / len(shingles) if shingles else 1.0
+            if redundancy >= DUPLICATE_SIMILARITY or containment >= DUPLICATE_CONTAINMENT:
+                pool.remove(entry)
+                continue
+            if entry["item"]["tokens"] > remaining:
+                pool.remove(entry)
+                continue
+            redundancy = max(redundancy, containment)
+            score = mmr_lambda * entry["item"]["relevance"] - (1 - mmr_lambda) * redundancy
+            if best_score is None or score > best_score:
+                best, best_score = entry, score
+        if best is None:
+            break
+        pool.remove(best)
+        take(best["item"], best["unit"], best["shingles"])
+
+    return selected
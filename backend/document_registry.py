@@ -0,0 +1,146 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import List, Optional
+
+# ==========================================
+# PERSISTENT DOCUMENT REGISTRY (SQLite)
+# ==========================================
+# One row per ingested source file per vector index. Every ingest path
+# (/ingest, ingest.py, ingest_km.py) records the file here after its vectors
+# are written, so the admin listings answer from this table in
+# O(documents) instead of sampling the vector index, and the bulk CLI can
+# tell unchanged files from changed ones by content hash. Files ingested
+# before the registry existed are merged in once per index from the index's
+# own source list; the backfills table remembers that it was done.
+# Every record/remove bumps a per-index version, which other processes
+# poll to notice that an index changed under them.
+
+DEFAULT_REGISTRY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "document_registry.sqlite")
+
+def file_sha256(path: str) -> str:
+    """Content hash of a file, read in 1 MB blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class DocumentRegistry:
+    def __init__(self, path: str = DEFAULT_REGISTRY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        # WAL lets the API server and a CLI ingest share the file
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " index_name TEXT NOT NULL,"
+            " source TEXT NOT NULL,"
+            " chunk_count INTEGER,"
+            " content_hash TEXT,"
+            " size_bytes INTEGER,"
+            " ingested_at REAL NOT NULL,"
+            " PRIMARY KEY (index_name, source))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS index_versions ("
+            " index_name TEXT PRIMARY KEY,"
+            " version INTEGER NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS backfills ("
+            " index_name TEXT PRIMARY KEY,"
+            " backfilled_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def record(self, index_name: str, source: str, chunk_count: Optional[int],
+               content_hash: Optional[str], size_bytes: Optional[int]):
+        """Insert or replace one document's row in a single transaction"""
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO documents "
+                "(index_name, source, chunk_count, content_hash, size_bytes, ingested_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (index_name, source, chunk_count, content_hash, size_bytes, time.time())
+            )
+            self._bump(index_name)
+
+    def is_backfilled(self, index_name: str) -> bool:
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM backfills WHERE index_name = ?", (index_name,)
+            ).fetchone() is not None
+
+    def backfill(self, index_name: str, sources: List[str]) -> int:
+        """
+        Add rows for sources found in the index but not yet registered
+        (existing rows are kept) and mark the index as backfilled.
+        """
+        now = time.time()
+        with self._lock, self._db:
+            before = self._db.total_changes
+            self._db.executemany(
+                "INSERT OR IGNORE INTO documents "
+                "(index_name, source, chunk_count, content_hash, size_bytes, ingested_at) "
+                "VALUES (?, ?, NULL, NULL, NULL, ?)",
+                [(index_name, src, now) for src in sources]
+            )
+            added = self._db.total_changes - before
+            self._db.execute(
+                "INSERT OR REPLACE INTO backfills (index_name, backfilled_at) VALUES (?, ?)",
+                (index_name, now)
+            )
+        return added
+
+    def remove(self, index_name: str, source: str):
+        with self._lock, self._db:
+            self._db.execute(
+                "DELETE FROM documents WHERE index_name = ? AND source = ?",
+                (index_name, source)
+            )
+            self._bump(index_name)
+
+    def _bump(self, index_name: str):
+        """Caller holds the lock inside a transaction"""
+        self._db.execute(
+            "INSERT INTO index_versions (index_name, version) VALUES (?, 1) "
+            "ON CONFLICT (index_name) DO UPDATE SET version = version + 1",
+            (index_name,)
+        )
+
+    def version(self, index_name: str) -> int:
+        """Changes whenever a document of the index is recorded or removed, by any process"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT version FROM index_versions WHERE index_name = ?", (index_name,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def get(self, index_name: str, source: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM documents WHERE index_name = ? AND source = ?",
+                (index_name, source)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def list(self, index_name: str) -> List[dict]:
+        """Every document in an index, newest first"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM documents WHERE index_name = ? ORDER BY ingested_at DESC, source",
+                (index_name,)
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def count(self, index_name: str) -> int:
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM documents WHERE index_name = ?", (index_name,)
+            ).fetchone()[0]
@@ -0,0 +1,119 @@
+import re
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+# ==========================================
+# QUERY EMBEDDING CACHE (LRU + TTL)
+# ==========================================
+# Widget traffic is very repetitive, so question embeddings are cached
+# in-process keyed on (model, normalized query). Misses fall through to the
+# persistent EmbeddingStore when one is given, which is shared by every
+# uvicorn worker on the host. Code on the event loop uses aget()/aput(),
+# which touch the SQLite store from a worker thread.
+
+def normalize_query(text: str) -> str:
+    """Lowercase and collapse whitespace so trivial variations share a key"""
+    return re.sub(r"\s+", " ", text.strip().lower())
+
+class EmbeddingCache:
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 3600, store=None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.store = store
+        self._entries = OrderedDict()  # (model, normalized) -> (stored_at, vector)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        """Return a cached vector, or None on miss/expiry"""
+        key = (model, normalize_query(text))
+        vector = self._get_local(key)
+        if vector is None and self.store is not None:
+            vector = self._get_shared(key, self.store.get(model, key[1]))
+        if vector is None:
+            self._count_miss()
+        return vector
+
+    async def aget(self, model: str, text: str) -> Optional[List[float]]:
+        """get() for the event loop: the store lookup runs in a worker thread"""
+        key = (model, normalize_query(text))
+        vector = self._get_local(key)
+        if vector is None and self.store is not None:
+            vector = self._get_shared(key, await asyncio.to_thread(self.store.get, model, key[1]))
+        if vector is None:
+            self._count_miss()
+        return vector
+
+    def put(self, model: str, text: str, vector: List[float]):
+        key = self._put_local(model, text, vector)
+        if self.store is not None:
+            self.store.put(model, key[1], vector)
+
+    async def aput(self, model: str, text: str, vector: List[float]):
+        key = self._put_local(model, text, vector)
+        if self.store is not None:
+            await asyncio.to_thread(self.store.put, model, key[1], vector)
+
+    async def aput_many(self, model: str, texts: List[str], vectors: List[List[float]]):
+        """Several aput()s with a single store write"""
+        keys = [self._put_local(model, t, v) for t, v in zip(texts, vectors)]
+        if self.store is not None and keys:
+            await asyncio.to_thread(self.store.put_many, model, [k[1] for k in keys], vectors)
+
+    def _get_local(self, key: tuple) -> Optional[List[float]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, vector = entry
+                if now - stored_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self._entries[key]
+        return None
+
+    def _get_shared(self, key: tuple, vector: Optional[List[float]]) -> Optional[List[float]]:
+        if vector is not None:
+            with self._lock:
+                self._store(key, vector, time.time())
+                self.shared_hits += 1
+        return vector
+
+    def _count_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def _put_local(self, model: str, text: str, vector: List[float]) -> tuple:
+        key = (model, normalize_query(text))
+        with self._lock:
+            self._store(key, list(vector), time.time())
+        return key
+
+    def _store(self, key: tuple, vector: List[float], stored_at: float):
+        self._entries[key] = (stored_at, vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.shared_hits) / lookups, 3) if lookups else 0.0,
+                "shared": self.store is not None,
+            }
@@ -0,0 +1,156 @@
+import asyncio
+from typing import AsyncContextManager, AsyncIterable, Callable, Iterable, List, Optional, Union
+
+from embedding_store import DEFAULT_DIMENSION, store_model_key
+from metrics import timed
+from admission import Overloaded
+
+# ==========================================
+# BATCHED EMBEDDING + UPSERT ENGINE
+# ==========================================
+# Shared by the /ingest endpoint and the ingest.py / ingest_km.py CLIs.
+# Chunks are embedded in batches (one embed_content call per batch), a
+# bounded number of batches are in flight at once, and each finished
+# batch is upserted while the following batches are still embedding.
+# When an EmbeddingStore is passed, vectors already on disk are reused and
+# only the missing texts are sent to Gemini. When an `admit` callable is
+# passed (the API server's admission controller), each Gemini call runs
+# inside the slot it returns.
+
+EMBED_BATCH_SIZE = 100   # Gemini accepts up to 100 contents per embed call
+EMBED_CONCURRENCY = 4    # Embedding batches in flight at once
+EMBED_TIMEOUT_S = 60     # Per batch
+
+def batched(items: Iterable, size: int):
+    """Yield lists of up to `size` items from any iterable"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+async def abatched(items: AsyncIterable, size: int):
+    """Async counterpart of batched() for streamed chunks"""
+    batch = []
+    async for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+async def _as_async(items: Iterable):
+    for item in items:
+        yield item
+
+async def embed_batch(client, model: str, texts: List[str], config=None,
+                      timeout: float = EMBED_TIMEOUT_S, store=None,
+                      dimension: int = DEFAULT_DIMENSION,
+                      admit: Optional[Callable[[], AsyncContextManager]] = None) -> List[List[float]]:
+    """Embed a list of texts with at most one async Gemini call"""
+    if store is None:
+        return await _embed_remote(client, model, texts, config, timeout, admit)
+
+    key_model = store_model_key(model, config)
+    found = await asyncio.to_thread(store.get_many, key_model, texts, dimension)
+    missing = [i for i in range(len(texts)) if i not in found]
+    if missing:
+        missing_texts = [texts[i] for i in missing]
+        vectors = await _embed_remote(client, model, missing_texts, config, timeout, admit)
+        await asyncio.to_thread(store.put_many, key_model, missing_texts, vectors, dimension)
+        found.update(zip(missing, vectors))
+    return [found[i] for i in range(len(texts))]
+
+async def _embed_remote(client, model: str, texts: List[str], config, timeout: float,
+                        admit=None) -> List[List[float]]:
+    async def call():
+        return await asyncio.wait_for(
+            client.aio.models.embed_content(model=model, contents=texts, config=config),
+            timeout=timeout
+        )
+
+    if admit is None:
+        response = await call()
+    else:
+        async with admit():
+            response = await call()
+    return [e.values for e in response.embeddings]
+
+async def embed_and_upsert(
+    client,
+    model: str,
+    index,
+    chunks: Union[Iterable[dict], AsyncIterable[dict]],
+    to_vector: Callable[[dict, List[float]], tuple],
+    batch_size: int = EMBED_BATCH_SIZE,
+    concurrency: int = EMBED_CONCURRENCY,
+    config=None,
+    on_batch: Optional[Callable[[int, int], None]] = None,
+    store=None,
+    admit: Optional[Callable[[], AsyncContextManager]] = None,
+) -> int:
+    """
+    Embed chunk dicts (each with a "text" key) and upsert them into `index`.
+    chunks may be a plain or an async iterable; it is consumed one batch at a time.
+
+    to_vector(chunk, values) builds the (id, values, metadata) tuple for a chunk.
+    on_batch(embedded, upserted) is called after each batch is upserted.
+    store, if given, is an EmbeddingStore consulted before calling Gemini.
+    admit, if given, returns the async context manager each Gemini call runs in.
+    Failed batches are logged and skipped; callers must compare the returned
+    number of upserted vectors with what they sent before treating the
+    content as indexed. An admission rejection (Overloaded) is not a batch
+    error: it cancels the remaining batches and propagates.
+    """
+    pending = set()
+    upserted = 0
+
+    async def embed_one(batch):
+        try:
+            with timed("embed_batch"):
+                values = await embed_batch(client, model, [c["text"] for c in batch], config,
+                                           store=store, admit=admit)
+            return batch, values
+        except Overloaded:
+            raise
+        except Exception as e:
+            print(f"  ❌ Error embedding batch of {len(batch)} chunks: {e}")
+            return batch, None
+
+    async def upsert_done(done):
+        nonlocal upserted
+        for task in done:
+            batch, values = task.result()
+            if values is None:
+                continue
+            vectors = [to_vector(chunk, v) for chunk, v in zip(batch, values)]
+            # Runs in a thread, so in-flight embedding batches keep going
+            with timed("upsert"):
+                await asyncio.to_thread(index.upsert, vectors=vectors)
+            upserted += len(vectors)
+            print(f"  📤 Upserted batch of {len(vectors)} vectors")
+            if on_batch:
+                on_batch(len(batch), len(vectors))
+
+    try:
+        if not hasattr(chunks, "__aiter__"):
+            chunks = _as_async(chunks)
+        async for batch in abatched(chunks, batch_size):
+            if len(pending) >= concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                await upsert_done(done)
+            pending.add(asyncio.create_task(embed_one(batch)))
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            await upsert_done(done)
+    finally:
+        # An upsert failure must not leave embedding calls running unobserved
+        for task in pending:
+            task.cancel()
+
+    return upserted
@@ -0,0 +1,189 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from typing import Dict, List, Optional
+
+# ==========================================
+# PERSISTENT EMBEDDING STORE (SQLite)
+# ==========================================
+# Every embedding the server or the CLI ingest scripts pay for is kept on
+# disk, keyed by (model, dimension, sha256(text)). Re-ingesting a document,
+# rebuilding an index or switching between KB and KM paths then reads the
+# vectors back locally instead of calling Gemini again.
+#
+# Reads don't write: hits are remembered in memory and their last_used
+# stamps are flushed in one batch with the next insert, every
+# TOUCH_FLUSH_EVERY hits, or before compaction. Compaction (LRU eviction +
+# VACUUM) runs on its own thread and connection, so the caller that
+# crosses the cap doesn't wait for it.
+
+DEFAULT_STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_store.sqlite")
+DEFAULT_DIMENSION = 768
+DEFAULT_MAX_ENTRIES = 100_000   # ~300 MB of float32 vectors at 768 dims
+COMPACT_EVERY = 1000            # Inserts between size-cap checks
+TOUCH_FLUSH_EVERY = 500         # Buffered last_used updates before they are written
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def store_model_key(model: str, config=None) -> str:
+    """Vectors differ per task type, so it is part of the model key"""
+    task_type = getattr(config, "task_type", None) if config is not None else None
+    return f"{model}/{task_type}" if task_type else model
+
+class EmbeddingStore:
+    def __init__(self, path: str = DEFAULT_STORE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._inserts_since_compact = 0
+        self._touched = {}              # (model, dim, text_hash) -> last read time
+        self._compacting = None         # Background compaction thread
+        self._lock = threading.Lock()
+
+        # WAL lets the API server and a CLI ingest share the file
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " dim INTEGER NOT NULL,"
+            " text_hash TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, dim, text_hash))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._db.commit()
+        self.compact_in_background()
+
+    def get_many(self, model: str, texts: List[str], dim: int = DEFAULT_DIMENSION) -> Dict[int, List[float]]:
+        """Return {position: vector} for every text already in the store"""
+        hashes = [text_hash(t) for t in texts]
+        found = {}
+        with self._lock:
+            rows = {}
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(hashes), 500):
+                part = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                for h, blob in self._db.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND dim = ? "
+                    f"AND text_hash IN ({placeholders})",
+                    (model, dim, *part)
+                ):
+                    rows[h] = blob
+
+            for i, h in enumerate(hashes):
+                if h in rows:
+                    found[i] = array("f", rows[h]).tolist()
+
+            now = time.time()
+            for h in rows:
+                self._touched[(model, dim, h)] = now
+            if len(self._touched) >= TOUCH_FLUSH_EVERY:
+                self._flush_touched()
+                self._db.commit()
+
+            self.hits += len(found)
+            self.misses += len(texts) - len(found)
+        return found
+
+    def get(self, model: str, text: str, dim: int = DEFAULT_DIMENSION) -> Optional[List[float]]:
+        return self.get_many(model, [text], dim).get(0)
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]],
+                 dim: int = DEFAULT_DIMENSION):
+        now = time.time()
+        rows = [
+            (model, dim, text_hash(t), array("f", v).tobytes(), now)
+            for t, v in zip(texts, vectors)
+            if len(v) == dim
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, dim, text_hash, vector, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._flush_touched()
+            self._db.commit()
+            self._inserts_since_compact += len(rows)
+            due = self._inserts_since_compact >= COMPACT_EVERY
+        if due:
+            self.compact_in_background()
+
+    def put(self, model: str, text: str, vector: List[float], dim: int = DEFAULT_DIMENSION):
+        self.put_many(model, [text], [vector], dim)
+
+    def _flush_touched(self):
+        """Write buffered last_used stamps (caller holds the lock and commits)"""
+        if not self._touched:
+            return
+        self._db.executemany(
+            "UPDATE embeddings SET last_used = ? WHERE model = ? AND dim = ? AND text_hash = ?",
+            [(used, model, dim, h) for (model, dim, h), used in self._touched.items()]
+        )
+        self._touched.clear()
+
+    def compact_in_background(self):
+        """Start compact() on its own thread unless one is already running"""
+        with self._lock:
+            self._inserts_since_compact = 0
+            if self._compacting is not None and self._compacting.is_alive():
+                return
+            self._compacting = threading.Thread(target=self.compact, name="embedding-store-compact")
+            self._compacting.start()
+
+    def compact(self) -> int:
+        """Evict least-recently-used rows above the size cap and reclaim disk space"""
+        with self._lock:
+            self._inserts_since_compact = 0
+            self._flush_touched()
+            self._db.commit()
+
+        # A separate connection, so readers and writers on the shared one
+        # only wait on SQLite's own locking while this runs
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            count = db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            excess = count - self.max_entries
+            if excess <= 0:
+                return 0
+            # Trim to 90% of the cap so compaction doesn't run on every insert
+            evict = excess + self.max_entries // 10
+            db.execute(
+                "DELETE FROM embeddings WHERE rowid IN "
+                "(SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (evict,)
+            )
+            db.commit()
+            db.execute("VACUUM")
+        except sqlite3.Error as e:
+            print(f"⚠️ Embedding store compaction failed: {e}")
+            return 0
+        finally:
+            db.close()
+        print(f"🧹 Compacted embedding store: evicted {evict} vectors")
+        return evict
+
+    def stats(self) -> dict:
+        with self._lock:
+            count = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": count,
+            "max_entries": self.max_entries,
+            "size_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
@@ -0,0 +1,68 @@
+import re
+from typing import List, Optional
+
+# ==========================================
+# KNOWLEDGE MAP FAST PATH
+# ==========================================
+# "Which tool should I use to check colour contrast?" is answered by a
+# single Knowledge Map entry: its tool name, description and link. When
+# the question reads like a tool lookup and the best KM match is both
+# strong and clearly ahead of the runner-up, the reply is templated from
+# the entry's metadata instead of going through KB retrieval and Gemini.
+
+_LOOKUP_NOUNS = r"(tools?|toolkits?|checkers?|resources?|apps?|software|templates?|platforms?|plugins?|extensions?)"
+
+_TOOL_LOOKUP_PATTERNS = [
+    # "which tool ...", "any resources for ...", "recommend a checker"
+    re.compile(
+        r"\b(which|what|any|best|good|recommend\w*|suggest\w*|is there an?|are there)\b"
+        r"[^.?!]*\b" + _LOOKUP_NOUNS + r"\b"
+    ),
+    # "tool for checking contrast", "tools to test my website"
+    re.compile(r"\b" + _LOOKUP_NOUNS + r" (for|to)\b"),
+    # "where can I find a contrast checker", "what should I use to ..."
+    re.compile(r"\bwhere (can|do|should) i (find|get)\b[^.?!]*\b" + _LOOKUP_NOUNS + r"\b"),
+    re.compile(r"\bwhat (can|should) i use\b"),
+]
+
+def is_tool_lookup(question: str) -> bool:
+    """
+    Heuristic: is the user asking which tool or resource to use?
+
+    >>> is_tool_lookup("Where can I find a free contrast checker?")
+    True
+    >>> is_tool_lookup("Where can I find the WCAG 2.2 success criteria?")
+    False
+    >>> is_tool_lookup("Which guidelines cover captions?")
+    False
+    """
+    q = question.lower()
+    return any(p.search(q) for p in _TOOL_LOOKUP_PATTERNS)
+
+def km_confidence(matches: List[dict]) -> tuple:
+    """(top score, margin over the runner-up); a lone match has margin = its score"""
+    if not matches:
+        return 0.0, 0.0
+    top = matches[0]["score"]
+    runner_up = matches[1]["score"] if len(matches) > 1 else 0.0
+    return top, top - runner_up
+
+def _description(km_text: str) -> str:
+    match = re.search(r"^Description:\s*(.+)$", km_text, re.MULTILINE)
+    return match.group(1).strip() if match else ""
+
+def km_answer(match: dict) -> Optional[str]:
+    """Templated reply from a KM entry's metadata, or None if it names no tool"""
+    metadata = match.get("metadata", {})
+    tool_name = (metadata.get("tool_name") or "").strip()
+    if not tool_name:
+        return None
+
+    lines = [f"I recommend **{tool_name}**."]
+    description = _description(metadata.get("text", ""))
+    if description:
+        lines.append(description)
+    url = (metadata.get("url") or "").strip()
+    if url:
+        lines.append(f"Link: {url}")
+    return "\n\n".join(lines)
@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+# ==========================================
+# BACKGROUND INGESTION JOB QUEUE
+# ==========================================
+# /ingest only validates and enqueues the upload; a small, bounded pool of
+# worker tasks does extraction, embedding and upserts in the background.
+# Each job records per-stage progress so the admin UI can poll it. Job
+# records are also written to SQLite (on submit, every
+# JOB_SAVE_INTERVAL_S while running and when finished), so a status poll
+# that lands on another uvicorn worker still finds the job.
+
+DEFAULT_JOBS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ingest_jobs.sqlite")
+JOB_SAVE_INTERVAL_S = 1.0
+
+class QueueFullError(Exception):
+    """Raised when the ingest queue cannot accept another upload"""
+
+def new_job(filename: str, target_index: str) -> dict:
+    return {
+        "job_id": uuid.uuid4().hex,
+        "filename": filename,
+        "target_index": target_index,
+        "status": "queued",       # queued | running | succeeded | failed
+        "stage": "queued",        # queued | extracting | embedding | deleting | done
+        "chunks_extracted": 0,
+        "chunks_unchanged": 0,
+        "chunks_embedded": 0,
+        "chunks_upserted": 0,
+        "chunks_deleted": 0,
+        "timings": {},            # Seconds per stage, filled in by the handler
+        "message": "",
+        "error": None,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+    }
+
+class JobStore:
+    """Job records shared by every process on the host"""
+
+    def __init__(self, path: str = DEFAULT_JOBS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        # WAL lets every uvicorn worker read while one writes
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " record TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_created_at ON jobs (created_at)")
+        self._db.commit()
+
+    def save(self, job_id: str, status: str, created_at: float, record: str):
+        """record is the job dict already serialised to JSON"""
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, status, created_at, record) VALUES (?, ?, ?, ?)",
+                (job_id, status, created_at, record)
+            )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute("SELECT record FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def prune(self, keep_finished: int):
+        """Drop all but the newest keep_finished finished jobs"""
+        with self._lock, self._db:
+            self._db.execute(
+                "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND job_id NOT IN ("
+                " SELECT job_id FROM jobs WHERE status IN ('succeeded', 'failed')"
+                " ORDER BY created_at DESC LIMIT ?)",
+                (keep_finished,)
+            )
+
+class IngestJobQueue:
+    def __init__(self, handler: Callable[[dict, str], Awaitable[None]],
+                 workers: int = 1, max_queued: int = 20, keep_finished: int = 200,
+                 store: Optional[JobStore] = None):
+        self.handler = handler
+        self.workers = workers
+        self.keep_finished = keep_finished
+        self.store = store
+        self._queue = asyncio.Queue(maxsize=max_queued)
+        self._jobs = OrderedDict()  # job_id -> job dict, oldest first (this process's jobs)
+        self._tasks = []
+
+    async def start(self):
+        for n in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(n)))
+        print(f"🧵 Started {self.workers} ingest worker(s)")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, filename: str, target_index: str, payload: str) -> dict:
+        """Queue an upload (the path of its spooled file) and return its job record"""
+        job = new_job(filename, target_index)
+        if self._queue.full():
+            raise QueueFullError("Ingest queue is full, please retry shortly")
+        # Saved before a worker can pick it up, so any process can answer a poll
+        await self._save(job)
+        self._queue.put_nowait((job, payload))
+        self._jobs[job["job_id"]] = job
+        self._prune()
+        return job
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        """This process's live record, else the shared one"""
+        job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            job = await asyncio.to_thread(self.store.get, job_id)
+        return job
+
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    def _prune(self):
+        finished = [jid for jid, j in self._jobs.items() if j["status"] in ("succeeded", "failed")]
+        for jid in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[jid]
+
+    async def _save(self, job: dict):
+        if self.store is None:
+            return
+        # Serialised on the loop: the handler's threads only add timings keys,
+        # and dict() copies them in one step
+        record = json.dumps({**job, "timings": dict(job["timings"])})
+        try:
+            await asyncio.to_thread(self.store.save, job["job_id"], job["status"], job["created_at"], record)
+        except sqlite3.Error as e:
+            print(f"⚠️ Could not save ingest job {job['job_id']}: {e}")
+
+    async def _checkpoint(self, job: dict):
+        """Publish a running job's progress for status polls on other workers"""
+        while True:
+            await asyncio.sleep(JOB_SAVE_INTERVAL_S)
+            await self._save(job)
+
+    async def _worker(self, n: int):
+        while True:
+            job, payload = await self._queue.get()
+            job["status"] = "running"
+            job["started_at"] = time.time()
+            checkpoint = asyncio.create_task(self._checkpoint(job))
+            try:
+                await self.handler(job, payload)
+                job["status"] = "succeeded"
+            except Exception as e:
+                print(f"❌ Ingest job {job['job_id']} ({job['filename']}) failed: {e}")
+                job["status"] = "failed"
+                job["error"] = str(e)
+            finally:
+                checkpoint.cancel()
+                job["finished_at"] = time.time()
+                await self._save(job)
+                if self.store is not None:
+                    await asyncio.to_thread(self.store.prune, self.keep_finished)
+                self._queue.task_done()
@@ -0,0 +1,102 @@
+import threading
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+# ==========================================
+# IN-PROCESS KNOWLEDGE MAP INDEX
+# ==========================================
+# The Knowledge Map is a few dozen entries, so its vectors live in one
+# contiguous float32 matrix and are searched with a vectorised cosine
+# top-k instead of a Pinecone round-trip. Every rebuild produces a new
+# immutable table that replaces the old one in a single assignment, so
+# concurrent searches always see a complete snapshot.
+
+class _Table:
+    def __init__(self, ids: List[str], vectors: List[List[float]], metadata: List[dict]):
+        self.ids = ids
+        self.metadata = metadata
+        self.values = [list(v) for v in vectors]
+        if not ids:
+            self.matrix = np.zeros((0, 0), dtype=np.float32)
+            return
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.matrix = np.ascontiguousarray(matrix / norms)
+
+class KnowledgeMapIndex:
+    def __init__(self):
+        self._table: Optional[_Table] = None
+        self._write_lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._table is not None
+
+    def __len__(self) -> int:
+        table = self._table
+        return len(table.ids) if table else 0
+
+    def load(self, records: Iterable[tuple]):
+        """Replace the whole table with (id, values, metadata) records"""
+        records = list(records)
+        table = _Table(
+            [r[0] for r in records],
+            [r[1] for r in records],
+            [r[2] or {} for r in records]
+        )
+        with self._write_lock:
+            self._table = table
+
+    def apply(self, upserts: Iterable[tuple] = (), delete_ids: Iterable[str] = (),
+              delete_source: Optional[str] = None):
+        """
+        Rebuild the table with deletes applied first, then upserts.
+        delete_source removes every entry whose metadata source matches.
+        """
+        with self._write_lock:
+            current = self._table
+            records = {}
+            if current is not None:
+                for cid, values, meta in zip(current.ids, current.values, current.metadata):
+                    records[cid] = (cid, values, meta)
+            for cid in delete_ids:
+                records.pop(cid, None)
+            if delete_source is not None:
+                records = {cid: r for cid, r in records.items() if r[2].get("source") != delete_source}
+            for record in upserts:
+                records[record[0]] = record
+
+            ordered = list(records.values())
+            self._table = _Table(
+                [r[0] for r in ordered],
+                [r[1] for r in ordered],
+                [r[2] or {} for r in ordered]
+            )
+
+    def search(self, vector: List[float], top_k: int = 2) -> dict:
+        """Pinecone-shaped query result: {"matches": [{id, score, values, metadata}]}"""
+        table = self._table
+        if table is None or not table.ids:
+            return {"matches": []}
+
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        scores = table.matrix @ query
+
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        return {"matches": [
+            {
+                "id": table.ids[i],
+                "score": float(scores[i]),
+                "values": table.values[i],
+                "metadata": table.metadata[i],
+            }
+            for i in top
+        ]}
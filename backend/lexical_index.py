@@ -0,0 +1,225 @@
+import os
+import re
+import math
+import heapq
+import time
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional
+
+# ==========================================
+# LOCAL BM25 LEXICAL INDEX (KB chunks)
+# ==========================================
+# Dense retrieval misses exact terms ("WCAG 2.2", success criterion
+# numbers like 1.4.3, tool names). This keeps an in-memory inverted index
+# over every KB chunk text, persisted in SQLite so it survives restarts
+# without re-reading the vector store. Searches never leave the process.
+# If another process (ingest.py) commits to the file, a search notices
+# and starts a rebuild on a background thread; searches keep using the
+# current postings until the new ones are swapped in.
+
+DEFAULT_LEXICAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lexical_index.sqlite")
+BM25_K1 = 1.2
+BM25_B = 0.75
+REFRESH_CHECK_S = 5.0   # How often to look for commits from other processes
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do for from how i in is it me my of on or "
+    "our should the this to we what when where which who why with you your".split()
+)
+
+# Keep dotted numbers together: "2.2", "1.4.3"
+_TOKEN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)*")
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+def reciprocal_rank_fusion(result_lists: Iterable[List[dict]], k: int = 60) -> List[dict]:
+    """
+    Merge ranked match lists by summing 1 / (k + rank). Matches are
+    identified by id; only the first occurrence's fields are kept (later
+    lists' flags and scores are not merged in) and "rrf_score" is added.
+    """
+    fused = {}
+    for matches in result_lists:
+        for rank, match in enumerate(matches, start=1):
+            entry = fused.get(match["id"])
+            if entry is None:
+                entry = fused[match["id"]] = {**match, "rrf_score": 0.0}
+            entry["rrf_score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda m: m["rrf_score"], reverse=True)
+
+class _Postings:
+    """One in-memory snapshot of the inverted index"""
+
+    def __init__(self, rows: Iterable[tuple] = ()):
+        self.docs: Dict[str, dict] = {}          # id -> metadata
+        self.lengths: Dict[str, int] = {}
+        self.postings = defaultdict(dict)        # term -> {id: term frequency}
+        self.total_length = 0
+        for chunk_id, source, heading, text in rows:
+            self.add(chunk_id, {"text": text, "heading": heading, "source": source})
+
+    def add(self, chunk_id: str, metadata: dict):
+        if chunk_id in self.docs:
+            self.remove(chunk_id)
+        terms = Counter(tokenize(f"{metadata.get('heading') or ''} {metadata['text']}"))
+        for term, tf in terms.items():
+            self.postings[term][chunk_id] = tf
+        length = sum(terms.values())
+        self.docs[chunk_id] = metadata
+        self.lengths[chunk_id] = length
+        self.total_length += length
+
+    def remove(self, chunk_id: str):
+        metadata = self.docs.pop(chunk_id, None)
+        if metadata is None:
+            return
+        for term in set(tokenize(f"{metadata.get('heading') or ''} {metadata['text']}")):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self.postings[term]
+        self.total_length -= self.lengths.pop(chunk_id, 0)
+
+    def update(self, upserts: List[tuple], delete_ids: List[str]):
+        for chunk_id in delete_ids:
+            self.remove(chunk_id)
+        for chunk_id, metadata in upserts:
+            self.add(chunk_id, {
+                "text": metadata["text"],
+                "heading": metadata.get("heading"),
+                "source": metadata.get("source"),
+            })
+
+class LexicalIndex:
+    def __init__(self, path: str = DEFAULT_LEXICAL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " id TEXT PRIMARY KEY, source TEXT, heading TEXT, text TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source)")
+        self._db.commit()
+        self._checked_at = 0.0
+        self._reloading = None    # Background rebuild thread
+        self._replay = []         # Local updates made while a rebuild runs
+        self._data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        self._index = _Postings(self._db.execute("SELECT id, source, heading, text FROM chunks"))
+
+    # -----------------------------
+    # Reloading after other processes' commits
+    # -----------------------------
+    def _refresh_if_changed(self):
+        """Start a background rebuild when another connection has committed (caller holds the lock)"""
+        now = time.monotonic()
+        if now - self._checked_at < REFRESH_CHECK_S:
+            return
+        self._checked_at = now
+        if self._reloading is not None:
+            return
+        version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return
+        # Commits that land during the rebuild change data_version again,
+        # so the next check after it finishes picks them up
+        self._data_version = version
+        self._replay = []
+        self._reloading = threading.Thread(target=self._reload, name="lexical-index-reload", daemon=True)
+        self._reloading.start()
+
+    def _reload(self):
+        try:
+            db = sqlite3.connect(self.path, timeout=30)
+            try:
+                index = _Postings(db.execute("SELECT id, source, heading, text FROM chunks"))
+            finally:
+                db.close()
+        except sqlite3.Error as e:
+            print(f"⚠️ Lexical index reload failed, keeping the current postings: {e}")
+            with self._lock:
+                self._data_version = None  # Retry on a later search
+                self._reloading = None
+            return
+        with self._lock:
+            for upserts, delete_ids in self._replay:
+                index.update(upserts, delete_ids)
+            self._replay = []
+            self._index = index
+            self._reloading = None
+        print(f"🔤 Reloaded lexical index: {len(index.docs)} chunks")
+
+    # -----------------------------
+    # Updates (persisted first, then applied in memory)
+    # -----------------------------
+    def apply(self, upserts: Iterable[tuple] = (), delete_ids: Iterable[str] = (),
+              delete_source: Optional[str] = None):
+        """
+        upserts are (id, metadata) pairs with "text", "heading" and "source".
+        delete_source removes every chunk of a source file.
+        """
+        upserts = list(upserts)
+        delete_ids = list(delete_ids)
+        with self._lock:
+            with self._db:
+                if delete_source is not None:
+                    removed = [r[0] for r in self._db.execute(
+                        "SELECT id FROM chunks WHERE source = ?", (delete_source,)
+                    )]
+                    self._db.execute("DELETE FROM chunks WHERE source = ?", (delete_source,))
+                    delete_ids.extend(removed)
+                self._db.executemany("DELETE FROM chunks WHERE id = ?", [(i,) for i in delete_ids])
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO chunks (id, source, heading, text) VALUES (?, ?, ?, ?)",
+                    [(i, m.get("source"), m.get("heading"), m["text"]) for i, m in upserts]
+                )
+            self._index.update(upserts, delete_ids)
+            if self._reloading is not None:
+                # The rebuild may have read the table before this commit
+                self._replay.append((upserts, delete_ids))
+
+    # -----------------------------
+    # Search
+    # -----------------------------
+    def search(self, query: str, top_k: int = 5) -> List[dict]:
+        """BM25 top-k as vector-store-shaped matches: {"id", "score", "metadata"}"""
+        terms = set(tokenize(query))
+        with self._lock:
+            self._refresh_if_changed()
+            index = self._index
+            n = len(index.docs)
+            if not n or not terms:
+                return []
+            avgdl = index.total_length / n
+            scores = defaultdict(float)
+            for term in terms:
+                postings = index.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * index.lengths[chunk_id] / avgdl)
+                    scores[chunk_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+            top = heapq.nlargest(top_k, scores.items(), key=lambda kv: kv[1])
+            return [
+                {"id": chunk_id, "score": score, "metadata": dict(index.docs[chunk_id])}
+                for chunk_id, score in top
+            ]
+
+    def __len__(self) -> int:
+        return len(self._index.docs)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "chunks": len(self._index.docs),
+                "terms": len(self._index.postings),
+                "reloading": self._reloading is not None,
+                "path": self.path,
+            }
@@ -3,61 +3,106 @@ import os
 import time
 import io
 import json
+import asyncio
+import hashlib
+import math
+import shutil
+import tempfile
+import logging
+import threading
+import contextvars
+from contextlib import asynccontextmanager
 from typing import List, Optional
-from fastapi import FastAPI, HTTPException, UploadFile, File
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, UploadFile, File, Request, Response
+from pydantic import BaseModel, Field
 from dotenv import load_dotenv
-from pinecone import Pinecone, ServerlessSpec
+from pinecone import Pinecone
 from google import genai
+from google.genai import types
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from pypdf import PdfReader
 from docx import Document
+from embedding_cache import EmbeddingCache, normalize_query
+from embedding_store import EmbeddingStore, DEFAULT_STORE_PATH
+from embedding_engine import embed_and_upsert, embed_batch, batched
+from ingest_jobs import IngestJobQueue, JobStore, QueueFullError, DEFAULT_JOBS_PATH
+from response_cache import SemanticResponseCache, make_context_key
+from km_index import KnowledgeMapIndex
+from single_flight import SingleFlight, StreamFlight
+from fast_path import is_tool_lookup, km_confidence, km_answer
+from context_packer import TokenCounter, pack_context
+from prompt_cache import PromptPrefixCache, is_cache_miss_error
+from session_store import SessionStore, is_follow_up
+from admission import AdmissionController, Overloaded, current_lane, BULK
+from lexical_index import LexicalIndex, DEFAULT_LEXICAL_PATH, reciprocal_rank_fusion
+from vector_store import open_vector_store, DEFAULT_LOCAL_DIR
+from document_registry import DocumentRegistry, DEFAULT_REGISTRY_PATH, file_sha256
+from metrics import (
+    request_seconds, record, render_metrics, server_timing, start_timing, timed, timed_iter
+)
 
 # ==========================================
 # 1. SETUP & CONFIGURATION
 # ==========================================
 load_dotenv()
 
+# Per-match retrieval previews are DEBUG; set LOG_LEVEL=DEBUG to see them.
+# Only our own logger is configured: the root logger is left alone so
+# httpx/genai don't start logging every HTTP request.
+logger = logging.getLogger("miv")
+logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+if not logger.handlers:
+    _log_handler = logging.StreamHandler()
+    _log_handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_log_handler)
+logger.propagate = False
+
 # Load API Keys with safety checks
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME")
 KNOWLEDGE_MAP_INDEX_NAME = os.getenv("KNOWLEDGE_MAP_INDEX_NAME")
 
-if not all([GEMINI_API_KEY, PINECONE_API_KEY, PINECONE_INDEX_NAME, KNOWLEDGE_MAP_INDEX_NAME]):
+# Vector store backend: "pinecone" (default) or "local" (memory-mapped, self-hosted)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone").lower()
+LOCAL_VECTOR_DIR = os.getenv("LOCAL_VECTOR_DIR") or DEFAULT_LOCAL_DIR
+
+if not all([GEMINI_API_KEY, PINECONE_INDEX_NAME, KNOWLEDGE_MAP_INDEX_NAME]):
     raise ValueError("❌ Missing required API keys in .env")
+if VECTOR_BACKEND == "pinecone" and not PINECONE_API_KEY:
+    raise ValueError("❌ Missing PINECONE_API_KEY in .env")
 
-# Configure Gemini with new API
+# Configure Gemini with new API (no network until the first call; the
+# client keeps one pooled keep-alive HTTP session for every request)
 client = genai.Client(api_key=GEMINI_API_KEY)
 
 # --- CHANGED: Use 2.5-flash-lite ---
 CHAT_MODEL_NAME = 'gemini-2.5-flash-lite'
 EMBED_MODEL_NAME = 'text-embedding-004'
 
-# Pinecone Configuration
-pc = Pinecone(api_key=PINECONE_API_KEY)
-
-# Main Knowledge Base Index
-if PINECONE_INDEX_NAME not in pc.list_indexes().names():
-    print(f"⚙️ Creating Knowledge Base index '{PINECONE_INDEX_NAME}'")
-    pc.create_index(
-        name=PINECONE_INDEX_NAME,
-        dimension=768,
-        metric="cosine",
-        spec=ServerlessSpec(cloud="aws", region="us-east-1")
-    )
-index_kb = pc.Index(PINECONE_INDEX_NAME)
+# Vector Store Configuration
+# Index handles are lazy: nothing touches the network at import time. They
+# are opened once (on startup warm-up or first use) and shared by every request.
+PINECONE_POOL_THREADS = int(os.getenv("PINECONE_POOL_THREADS", "4"))
+PREWARM_CONNECTIONS = os.getenv("PREWARM_CONNECTIONS", "1") == "1"  # Open Gemini/Pinecone connections on startup
+
+pc = Pinecone(api_key=PINECONE_API_KEY) if VECTOR_BACKEND == "pinecone" else None
+
+# Main Knowledge Base Index (PINECONE_INDEX_HOST skips the control-plane lookup)
+index_kb = open_vector_store(
+    PINECONE_INDEX_NAME, VECTOR_BACKEND, dimension=768,
+    pinecone_client=pc, local_dir=LOCAL_VECTOR_DIR,
+    host=os.getenv("PINECONE_INDEX_HOST"), pool_threads=PINECONE_POOL_THREADS, lazy=True
+)
 
 # Knowledge Map Index
-if KNOWLEDGE_MAP_INDEX_NAME not in pc.list_indexes().names():
-    print(f"⚙️ Creating Knowledge Map index '{KNOWLEDGE_MAP_INDEX_NAME}'")
-    pc.create_index(
-        name=KNOWLEDGE_MAP_INDEX_NAME,
-        dimension=768,
-        metric="cosine",
-        spec=ServerlessSpec(cloud="aws", region="us-east-1")
-    )
-index_km = pc.Index(KNOWLEDGE_MAP_INDEX_NAME)
+index_km = open_vector_store(
+    KNOWLEDGE_MAP_INDEX_NAME, VECTOR_BACKEND, dimension=768,
+    pinecone_client=pc, local_dir=LOCAL_VECTOR_DIR,
+    host=os.getenv("KNOWLEDGE_MAP_INDEX_HOST"), pool_threads=PINECONE_POOL_THREADS, lazy=True
+)
+print(f"🗄️ Vector backend: {VECTOR_BACKEND}")
 
 # ==========================================
 # OPTIMIZED CHUNKING PARAMETERS
@@ -65,12 +110,175 @@ index_km = pc.Index(KNOWLEDGE_MAP_INDEX_NAME)
 # Recommended for text-embedding-004 (768 dims) + conversational AI
 CHUNK_SIZE = 512              # Tokens ≈ 400-450 words - optimal for semantic coherence
 CHUNK_OVERLAP = 128           # 25% overlap prevents context loss at boundaries
-BATCH_SIZE = 100              # Pinecone upsert batch size
+BATCH_SIZE = 100              # Embedding + Pinecone upsert batch size
+DELETE_BATCH_SIZE = 1000      # Max ids per Pinecone delete call
+FETCH_BATCH_SIZE = 100        # Ids per Pinecone fetch call
+INGEST_BUFFER_CHUNKS = 2 * BATCH_SIZE  # Parsed chunks buffered ahead of embedding
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))  # Embedding batches in flight during ingest
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))         # Uploads processed at once
+INGEST_MAX_QUEUED = int(os.getenv("INGEST_MAX_QUEUED", "20"))  # Uploads waiting before /ingest returns 503
 
 # Character-based approximation (1 token ≈ 4 characters for English)
 CHUNK_SIZE_CHARS = CHUNK_SIZE * 4      # ~2048 characters
 CHUNK_OVERLAP_CHARS = CHUNK_OVERLAP * 4 # ~512 characters
 
+# ==========================================
+# PER-STAGE TIMEOUTS (seconds)
+# ==========================================
+EMBED_TIMEOUT_S = float(os.getenv("EMBED_TIMEOUT_S", "10"))
+QUERY_TIMEOUT_S = float(os.getenv("QUERY_TIMEOUT_S", "10"))
+GENERATE_TIMEOUT_S = float(os.getenv("GENERATE_TIMEOUT_S", "60"))
+
+# ==========================================
+# BATCH CHAT LIMITS
+# ==========================================
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "500"))
+BATCH_RETRIEVAL_CONCURRENCY = int(os.getenv("BATCH_RETRIEVAL_CONCURRENCY", "16"))  # KM/KB lookups in flight
+BATCH_GENERATE_CONCURRENCY = int(os.getenv("BATCH_GENERATE_CONCURRENCY", "4"))     # Gemini generations in flight
+
+# ==========================================
+# PERSISTENT EMBEDDING STORE + QUERY EMBEDDING CACHE
+# ==========================================
+# The on-disk store is shared with ingest.py / ingest_km.py and across workers
+embedding_store = EmbeddingStore(
+    os.getenv("EMBED_STORE_PATH") or DEFAULT_STORE_PATH,
+    max_entries=int(os.getenv("EMBED_STORE_MAX_ENTRIES", "100000"))
+)
+embedding_cache = EmbeddingCache(
+    max_size=int(os.getenv("EMBED_CACHE_SIZE", "2048")),
+    ttl_seconds=float(os.getenv("EMBED_CACHE_TTL_S", "86400")),
+    store=embedding_store
+)
+
+# ==========================================
+# DOCUMENT REGISTRY
+# ==========================================
+# What has been ingested into which index; shared with the ingest CLIs
+document_registry = DocumentRegistry(os.getenv("DOCUMENT_REGISTRY_PATH") or DEFAULT_REGISTRY_PATH)
+
+# Ingest job records, so any worker can answer /ingest/jobs/{job_id}
+ingest_job_store = JobStore(os.getenv("INGEST_JOBS_PATH") or DEFAULT_JOBS_PATH)
+
+# ==========================================
+# SEMANTIC RESPONSE CACHE
+# ==========================================
+# Cosine distance under which a new question reuses a cached answer
+response_cache = SemanticResponseCache(
+    max_size=int(os.getenv("RESPONSE_CACHE_SIZE", "512")),
+    ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL_S", "3600")),
+    max_distance=float(os.getenv("RESPONSE_CACHE_MAX_DISTANCE", "0.05"))
+)
+
+# ==========================================
+# IN-PROCESS KNOWLEDGE MAP INDEX
+# ==========================================
+# Loaded from index_km at startup and updated after every KM ingest.
+# Other workers (and ingest_km.py) change it too; their changes bump the
+# registry version, which is checked every KM_REFRESH_CHECK_S.
+# Until it loads, /chat falls back to querying Pinecone.
+km_index = KnowledgeMapIndex()
+KM_REFRESH_CHECK_S = float(os.getenv("KM_REFRESH_CHECK_S", "10"))
+
+# ==========================================
+# HYBRID RETRIEVAL (BM25 + VECTOR)
+# ==========================================
+# Exact-term hits from the local BM25 index are fused with the KB vector
+# results by reciprocal rank. Maintained by every KB ingest.
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"
+RRF_K = int(os.getenv("RRF_K", "60"))
+LEXICAL_MIN_RATIO = 0.5  # Drop BM25 hits scoring under half the best hit
+# BM25-only hits are gated on their chunk's cosine score too, with a lower
+# floor than dense hits since they also matched the question's exact terms
+LEXICAL_RELEVANCE_THRESHOLD = float(os.getenv("LEXICAL_RELEVANCE_THRESHOLD", "0.55"))
+lexical_index = LexicalIndex(os.getenv("LEXICAL_INDEX_PATH") or DEFAULT_LEXICAL_PATH)
+
+# ==========================================
+# CONTEXT PACKING
+# ==========================================
+# Retrieved chunks are packed whole, by MMR, into a token budget
+RELEVANCE_THRESHOLD = 0.7  # Dense KB chunks below this cosine score are skipped
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))  # 1.0 = relevance only, lower = more diversity
+token_counter = TokenCounter(CHAT_MODEL_NAME)
+
+# ==========================================
+# SYSTEM PROMPT CACHING
+# ==========================================
+# Long system prompts are registered once with Gemini context caching
+# and referenced by name; anything else is sent inline
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "1") == "1"
+PROMPT_CACHE_TTL_S = int(os.getenv("PROMPT_CACHE_TTL_S", "3600"))
+PROMPT_CACHE_MAX_ENTRIES = int(os.getenv("PROMPT_CACHE_MAX_ENTRIES", "16"))
+PROMPT_CACHE_MIN_TOKENS = int(os.getenv("PROMPT_CACHE_MIN_TOKENS", "1024"))  # Provider minimum for explicit caching
+prompt_cache = PromptPrefixCache(
+    client, CHAT_MODEL_NAME, token_counter.count,
+    ttl_s=PROMPT_CACHE_TTL_S, max_entries=PROMPT_CACHE_MAX_ENTRIES, min_tokens=PROMPT_CACHE_MIN_TOKENS
+)
+
+# ==========================================
+# CONVERSATION SESSIONS
+# ==========================================
+# Requests carrying a session_id get a bounded window of that
+# conversation folded into retrieval and the prompt, but only when the
+# question is a follow-up. Standalone questions in a session are answered
+# like sessionless ones, so they still share the response cache and
+# single-flight with everyone else.
+SESSION_TTL_S = int(os.getenv("SESSION_TTL_S", "3600"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "6"))              # Verbatim turns kept per session
+SESSION_MAX_TOKENS = int(os.getenv("SESSION_MAX_TOKENS", "1500"))         # Turns + summary per session
+SESSION_SUMMARY_TOKENS = int(os.getenv("SESSION_SUMMARY_TOKENS", "300"))  # Rolling summary of older turns
+SESSION_MEMORY_MB = int(os.getenv("SESSION_MEMORY_MB", "64"))             # All sessions together
+SESSION_PROMPT_TURNS = int(os.getenv("SESSION_PROMPT_TURNS", "3"))        # Recent turns shown to the model
+SESSION_RETRIEVAL_TURNS = int(os.getenv("SESSION_RETRIEVAL_TURNS", "1"))  # Earlier questions added to follow-up retrieval
+session_store = SessionStore(
+    token_counter.count, max_sessions=SESSION_MAX_SESSIONS, ttl_s=SESSION_TTL_S,
+    max_turns=SESSION_MAX_TURNS, max_tokens=SESSION_MAX_TOKENS,
+    summary_tokens=SESSION_SUMMARY_TOKENS, max_bytes=SESSION_MEMORY_MB * 1024 * 1024
+)
+
+# ==========================================
+# GEMINI ADMISSION CONTROL
+# ==========================================
+# Every embed/generate call takes a slot from its model's controller.
+# Chat runs in the interactive lane; ingestion and /chat/batch run in the
+# bulk lane, which waits behind chat, is capped at BULK_RATE_SHARE of
+# the quota and can't take the INTERACTIVE_RESERVED_SHARE of in-flight
+# slots kept for chat. Set the *_RPM values to the project's Gemini quota.
+EMBED_RPM = float(os.getenv("EMBED_RPM", "3000"))
+GENERATE_RPM = float(os.getenv("GENERATE_RPM", "4000"))
+EMBED_MAX_IN_FLIGHT = int(os.getenv("EMBED_MAX_IN_FLIGHT", "16"))
+GENERATE_MAX_IN_FLIGHT = int(os.getenv("GENERATE_MAX_IN_FLIGHT", "32"))
+BULK_RATE_SHARE = float(os.getenv("BULK_RATE_SHARE", "0.5"))
+INTERACTIVE_RESERVED_SHARE = float(os.getenv("INTERACTIVE_RESERVED_SHARE", "0.25"))  # In-flight slots bulk can't take
+ADMISSION_LANES = {
+    "interactive_queue": int(os.getenv("INTERACTIVE_MAX_QUEUED", "100")),   # Waiting calls before 503
+    "interactive_wait_s": float(os.getenv("INTERACTIVE_MAX_WAIT_S", "5")),  # Longest wait for a slot
+    "bulk_queue": int(os.getenv("BULK_MAX_QUEUED", "64")),
+    "bulk_wait_s": float(os.getenv("BULK_MAX_WAIT_S", "300")),
+    "bulk_share": BULK_RATE_SHARE,
+    "interactive_reserved_share": INTERACTIVE_RESERVED_SHARE,
+}
+embed_admission = AdmissionController("embedding", EMBED_RPM, EMBED_MAX_IN_FLIGHT, **ADMISSION_LANES)
+generate_admission = AdmissionController("generation", GENERATE_RPM, GENERATE_MAX_IN_FLIGHT, **ADMISSION_LANES)
+
+# ==========================================
+# SINGLE-FLIGHT COALESCING
+# ==========================================
+# Identical requests in flight at the same time share one pipeline run
+chat_flights = SingleFlight("chat")
+stream_flights = StreamFlight("chat_stream")
+embed_flights = SingleFlight("embedding")
+
+# ==========================================
+# KNOWLEDGE MAP FAST PATH
+# ==========================================
+# Tool-lookup questions whose best KM match is confident enough are
+# answered from the entry's metadata, skipping KB retrieval and Gemini
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "1") == "1"
+FAST_PATH_MIN_SCORE = float(os.getenv("FAST_PATH_MIN_SCORE", "0.75"))    # Top KM cosine score
+FAST_PATH_MIN_MARGIN = float(os.getenv("FAST_PATH_MIN_MARGIN", "0.05"))  # Lead over the runner-up
+
 # ==========================================
 # 2. DATA MODELS (Pydantic)
 # ==========================================
@@ -78,24 +286,145 @@ class ChatRequest(BaseModel):
     query: str    
     top_k: Optional[int] = 5  # Increased from 3 for better context coverage
     system_prompt: Optional[str] = None
+    bypass_cache: Optional[bool] = False  # Skip the semantic response cache
+    session_id: Optional[str] = None      # Server-side conversation history
 
 class Source(BaseModel):
     text: str
     source: str
     score: float
 
+class ChatBatchRequest(BaseModel):
+    requests: List[ChatRequest]
+    generate_concurrency: Optional[int] = Field(None, ge=1)  # Lower than the server cap to be gentle
+
+class RouteInfo(BaseModel):
+    decision: str                       # greeting | cache | km_fast_path | generate
+    confidence: Optional[float] = None  # Top Knowledge Map score
+    margin: Optional[float] = None      # Lead of the top KM match over the runner-up
+
 class ChatResponse(BaseModel):
     response: str          
     sources: List[Source]
+    route: Optional[RouteInfo] = None
 
-class IngestResponse(BaseModel):
+class IngestJobResponse(BaseModel):
     success: bool
     message: str
-    chunks_added: int
+    job_id: str
     filename: str
+    status: str
 
 # ==========================================
-# 3. IMPROVED CHUNKING FUNCTIONS
+# 3. ASYNC CLIENT HELPERS
+# ==========================================
+# Gemini calls go through the SDK's native async client (client.aio),
+# each inside a slot from its model's admission controller.
+# Pinecone's client is synchronous, so its calls are offloaded to the
+# default thread pool to keep the event loop free for other requests.
+
+async def run_stage(stage: str, awaitable, timeout: float):
+    """Await a pipeline stage, turning a timeout into a 504 naming the stage"""
+    try:
+        return await asyncio.wait_for(awaitable, timeout=timeout)
+    except asyncio.TimeoutError:
+        print(f"⏱️ Stage '{stage}' timed out after {timeout}s")
+        raise HTTPException(
+            status_code=504,
+            detail=f"Timed out during {stage} after {timeout}s"
+        )
+
+async def embed_text(text: str) -> List[float]:
+    """Embed a single text with the async Gemini client"""
+    async with embed_admission.slot():
+        response = await run_stage(
+            "embedding",
+            client.aio.models.embed_content(model=EMBED_MODEL_NAME, contents=text),
+            EMBED_TIMEOUT_S
+        )
+    return response.embeddings[0].values
+
+async def embed_query(text: str) -> List[float]:
+    """Embed a user question, consulting the query embedding cache first"""
+    vector = await embedding_cache.aget(EMBED_MODEL_NAME, text)
+    if vector is None:
+        async def embed_and_cache():
+            result = await embed_text(text)
+            await embedding_cache.aput(EMBED_MODEL_NAME, text, result)
+            return result
+
+        # Concurrent misses for the same question share one Gemini call
+        vector = await embed_flights.do((EMBED_MODEL_NAME, normalize_query(text)), embed_and_cache)
+    return vector
+
+async def query_index(index, stage: str, **kwargs):
+    """Run a blocking Pinecone query in a worker thread"""
+    return await run_stage(stage, asyncio.to_thread(index.query, **kwargs), QUERY_TIMEOUT_S)
+
+def generation_request(prompt: str, system_prompt: str) -> tuple:
+    """(contents, config, cache name): the cached system prompt if registered, else inline"""
+    cache_name = prompt_cache.lookup(system_prompt) if PROMPT_CACHE_ENABLED else None
+    if cache_name is None:
+        return f"{system_prompt}\n\n{prompt}", None, None
+    return prompt, types.GenerateContentConfig(cached_content=cache_name), cache_name
+
+async def generate_text(prompt: str, system_prompt: str) -> str:
+    """Generate a reply with the async Gemini client"""
+    contents, config, cache_name = generation_request(prompt, system_prompt)
+    try:
+        async with generate_admission.slot():
+            response = await run_stage(
+                "generation",
+                client.aio.models.generate_content(model=CHAT_MODEL_NAME, contents=contents, config=config),
+                GENERATE_TIMEOUT_S
+            )
+    except Exception as e:
+        if cache_name is None or not is_cache_miss_error(e):
+            raise
+        print(f"⚠️ Cached system prompt {cache_name} is gone, retrying inline")
+        prompt_cache.invalidate(cache_name)
+        return await generate_text(prompt, system_prompt)
+    return response.text
+
+async def stream_text(prompt: str, system_prompt: str):
+    """Yield reply pieces from the async Gemini client as they are produced"""
+    contents, config, cache_name = generation_request(prompt, system_prompt)
+    started = False
+    retry_inline = False
+    # The slot is held until the reply is complete
+    async with generate_admission.slot():
+        deadline = time.monotonic() + GENERATE_TIMEOUT_S
+        try:
+            stream = await run_stage(
+                "generation",
+                client.aio.models.generate_content_stream(model=CHAT_MODEL_NAME, contents=contents, config=config),
+                GENERATE_TIMEOUT_S
+            )
+            pieces = stream.__aiter__()
+            while True:
+                # The timeout covers the whole reply, not each piece
+                remaining = max(deadline - time.monotonic(), 0.001)
+                try:
+                    chunk = await run_stage("generation", pieces.__anext__(), remaining)
+                except StopAsyncIteration:
+                    break
+                if chunk.text:
+                    started = True
+                    yield chunk.text
+        except Exception as e:
+            # An expired cached prompt fails before anything is produced
+            if started or cache_name is None or not is_cache_miss_error(e):
+                raise
+            print(f"⚠️ Cached system prompt {cache_name} is gone, retrying inline")
+            prompt_cache.invalidate(cache_name)
+            retry_inline = True
+
+    if retry_inline:
+        async for piece in stream_text(prompt, system_prompt):
+            yield piece
+
+# ==========================================
+# 4. IMPROVED CHUNKING FUNCTIONS
 # ==========================================
 def extract_text_from_pdf(file_bytes: bytes) -> str:
     """Extract text from PDF file bytes"""
@@ -168,12 +497,15 @@ def smart_chunk_text(text: str, chunk_size: int = CHUNK_SIZE_CHARS,
     
     return [c.strip() for c in chunks if c.strip()]
 
-def extract_docx_paragraphs_with_headings(file_bytes: bytes):
+def open_document(source):
+    """Accept a file path, raw bytes or a binary file object"""
+    return io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source
+
+def extract_docx_paragraphs_with_headings(source):
     """
-    Returns a list of tuples: (paragraph_text, heading)
+    Yields tuples: (paragraph_text, heading)
     """
-    doc = Document(io.BytesIO(file_bytes))
-    paragraphs = []
+    doc = Document(open_document(source))
     current_heading = "No Heading"
 
     for p in doc.paragraphs:
@@ -181,18 +513,22 @@ def extract_docx_paragraphs_with_headings(file_bytes: bytes):
         if style.startswith("Heading"):
             current_heading = p.text.strip() or current_heading
         elif p.text.strip():
-            paragraphs.append((p.text.strip(), current_heading))
-
-    return paragraphs
+            yield (p.text.strip(), current_heading)
 
-def extract_pdf_paragraphs_with_headings(file_bytes: bytes):
+def extract_pdf_paragraphs_with_headings(source):
     """
-    Returns a list of tuples: (paragraph_text, heading)
+    Yields tuples: (paragraph_text, heading), one page at a time.
+    A path is opened here and pypdf gets the file handle, since given a
+    path it would first read the whole file into memory; with a handle it
+    seeks to objects as pages are extracted.
     Improved heuristic: lines in ALL CAPS, short, or bold are headings
     """
-    pdf_file = io.BytesIO(file_bytes)
-    reader = PdfReader(pdf_file)
-    paragraphs = []
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            yield from extract_pdf_paragraphs_with_headings(f)
+        return
+
+    reader = PdfReader(open_document(source))
     current_heading = "No Heading"
 
     for page in reader.pages:
@@ -206,7 +542,7 @@ def extract_pdf_paragraphs_with_headings(file_bytes: bytes):
             if not line:
                 if current_para:
                     para_text = ' '.join(current_para)
-                    paragraphs.append((para_text, current_heading))
+                    yield (para_text, current_heading)
                     current_para = []
                 continue
             
@@ -220,7 +556,7 @@ def extract_pdf_paragraphs_with_headings(file_bytes: bytes):
             if is_heading:
                 if current_para:
                     para_text = ' '.join(current_para)
-                    paragraphs.append((para_text, current_heading))
+                    yield (para_text, current_heading)
                     current_para = []
                 current_heading = line
             else:
@@ -229,16 +565,23 @@ def extract_pdf_paragraphs_with_headings(file_bytes: bytes):
         # Add remaining paragraph
         if current_para:
             para_text = ' '.join(current_para)
-            paragraphs.append((para_text, current_heading))
+            yield (para_text, current_heading)
 
-    return paragraphs
+def _emit_chunk(text: str, heading: str, start_index, max_chunk_size: int):
+    """Yield one merged chunk, splitting it with smart chunking if very large"""
+    if len(text) > max_chunk_size * 1.2:
+        for sc in smart_chunk_text(text, max_chunk_size, CHUNK_OVERLAP_CHARS):
+            yield {"text": sc.strip(), "heading": heading, "paragraph_index": start_index}
+    else:
+        yield {"text": text.strip(), "heading": heading, "paragraph_index": start_index}
 
 def merge_paragraphs_into_chunks(paragraphs, max_chunk_size=CHUNK_SIZE_CHARS):
     """
     Merge paragraphs into semantically coherent chunks with metadata.
     Uses smart chunking to respect sentence boundaries.
+    Consumes any iterable and yields each chunk as soon as it is complete,
+    so at most one chunk is buffered.
     """
-    chunks = []
     current_chunk = ""
     current_heading = ""
     start_index = 0
@@ -252,49 +595,51 @@ def merge_paragraphs_into_chunks(paragraphs, max_chunk_size=CHUNK_SIZE_CHARS):
         # Try to merge if within size limit
         elif len(current_chunk) + len(para_text) + 2 <= max_chunk_size:
             current_chunk += "\n\n" + para_text
-        # Chunk is full, save it and start new one
+        # Chunk is full, emit it and start new one
         else:
-            # Use smart chunking if chunk is very large
-            if len(current_chunk) > max_chunk_size * 1.2:
-                sub_chunks = smart_chunk_text(current_chunk, max_chunk_size, CHUNK_OVERLAP_CHARS)
-                for sc in sub_chunks:
-                    chunks.append({
-                        "text": sc.strip(),
-                        "heading": current_heading,
-                        "paragraph_index": start_index
-                    })
-            else:
-                chunks.append({
-                    "text": current_chunk.strip(),
-                    "heading": current_heading,
-                    "paragraph_index": start_index
-                })
-            
+            yield from _emit_chunk(current_chunk, current_heading, start_index, max_chunk_size)
             current_chunk = para_text
             current_heading = para_heading
             start_index = i
 
     # Add final chunk
     if current_chunk:
-        if len(current_chunk) > max_chunk_size * 1.2:
-            sub_chunks = smart_chunk_text(current_chunk, max_chunk_size, CHUNK_OVERLAP_CHARS)
-            for sc in sub_chunks:
-                chunks.append({
-                    "text": sc.strip(),
-                    "heading": current_heading,
-                    "paragraph_index": start_index
-                })
-        else:
-            chunks.append({
-                "text": current_chunk.strip(),
-                "heading": current_heading,
-                "paragraph_index": start_index
-            })
+        yield from _emit_chunk(current_chunk, current_heading, start_index, max_chunk_size)
 
-    return chunks
+def chunk_content_hash(chunk: dict) -> str:
+    """
+    Stable SHA-256 of everything that ends up in a chunk's vector or metadata.
+    Unlike hash(), this is identical across processes and runs.
+    """
+    if "metadata" in chunk:
+        payload = json.dumps(chunk["metadata"], sort_keys=True)
+    else:
+        payload = f"{chunk.get('heading', 'No Heading')}\n{chunk['text']}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def chunk_id_prefix(filename: str, target_index: str) -> str:
+    """Vector id prefix shared by every chunk of one source file"""
+    return f"km-{filename}#" if target_index == "km" else f"{filename}#"
+
+def list_vector_ids(index, prefix: str) -> set:
+    """All vector ids in an index that start with prefix (blocking)"""
+    ids = set()
+    for page in index.list(prefix=prefix):
+        ids.update(page)
+    return ids
+
+def fetch_all_vectors(index) -> List[tuple]:
+    """Every (id, values, metadata) record in an index (blocking)"""
+    ids = sorted(list_vector_ids(index, ""))
+    records = []
+    for start in range(0, len(ids), FETCH_BATCH_SIZE):
+        fetched = index.fetch(ids=ids[start:start + FETCH_BATCH_SIZE])
+        for vector_id, vector in fetched.items():
+            records.append((vector_id, vector["values"], vector["metadata"]))
+    return records
 
 # ==========================================
-# 4. DEFAULT SYSTEM PROMPT (Fallback Only)
+# 5. DEFAULT SYSTEM PROMPT (Fallback Only)
 # ==========================================
 DEFAULT_SYSTEM_PROMPT = """You are an AI Co-Pilot for accessibility and inclusive design, specifically supporting Mekong Inclusive Ventures (MIV) practitioners, educators, and Entrepreneur Support Organizations (ESOs).
 
@@ -313,9 +658,37 @@ Do not use overly friendly or casual language like "I'd be happy to help", "Sure
 If the context does not contain the answer, say, "I don't have specific information on this in the MIV knowledge base, but here is general best practice," followed by helpful guidance."""
 
 # ==========================================
-# 5. FASTAPI APP & ROUTES
+# 6. FASTAPI APP & ROUTES
 # ==========================================
-app = FastAPI(title="MIV AI Co-Pilot API")
+# Readiness flags, filled in by warm_up() in the background
+readiness = {"ingest_workers": False, "indexes": False, "km_index": False,
+             "prewarmed": False, "ready": False, "error": None}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Start the ingest workers and warm up in the background. The worker
+    accepts connections at once; /readyz reports when it can take traffic.
+    """
+    app.state.ingest_queue = IngestJobQueue(
+        run_ingest_job,
+        workers=INGEST_WORKERS,
+        max_queued=INGEST_MAX_QUEUED,
+        store=ingest_job_store
+    )
+    await app.state.ingest_queue.start()
+    readiness["ingest_workers"] = True
+
+    warm_task = asyncio.create_task(warm_up())
+    km_watch_task = asyncio.create_task(watch_km_index())
+    try:
+        yield
+    finally:
+        warm_task.cancel()
+        km_watch_task.cancel()
+        await app.state.ingest_queue.stop()
+
+app = FastAPI(title="MIV AI Co-Pilot API", lifespan=lifespan)
 
 # CORS - Allowing all origins to prevent connection issues
 app.add_middleware(
@@ -324,22 +697,47 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "Retry-After"],  # Readable by the widget's fetch()
 )
 
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    """Gemini admission refused: shed the request with 503 + Retry-After"""
+    print(f"🚦 Shedding {request.url.path}: {exc}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 @app.get("/")
 def home():
     return {"status": "online", "message": "MIV AI Co-Pilot Brain is running 🧠"}
 
 # -----------------------
-# Ingest Endpoint
+# Liveness & Readiness
+# -----------------------
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process and its event loop are responsive"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: index handles are open and warm-up has finished"""
+    status_code = 200 if readiness["ready"] else 503
+    return JSONResponse(status_code=status_code, content=dict(readiness))
+
+# -----------------------
+# Ingest Pipeline (runs on the background job queue)
 # -----------------------
-@app.post("/ingest", response_model=IngestResponse)
-async def ingest_endpoint(file: UploadFile = File(...), target_index: str = "kb"):
+def iter_ingest_chunks(filename: str, path: str, target_index: str):
     """
-    Upload and ingest a file into the vector database.
+    Parse an upload into chunk dicts, yielding each one as soon as it is ready.
+    Blocking and CPU-bound, so it is driven from a worker thread.
 
     KB (default):
-      - PDF
+      - PDF (streamed page by page)
       - DOCX
       - TXT
       - Generic JSON {topic, content}
@@ -347,259 +745,558 @@ async def ingest_endpoint(file: UploadFile = File(...), target_index: str = "kb"
     KM (target_index="km"):
       - JSON Knowledge Map with text_to_embed + metadata
     """
-    start_time = time.time()
-    filename = file.filename
+    # =========================================================
+    # KB INGESTION (IMPROVED CHUNKING)
+    # =========================================================
+    if target_index != "km":
+        print(f"📄 Processing KB file: {filename}")
+
+        if filename.lower().endswith('.pdf'):
+            print("  Extracting PDF paragraphs...")
+            paragraph_chunks_raw = merge_paragraphs_into_chunks(extract_pdf_paragraphs_with_headings(path))
+
+        elif filename.lower().endswith('.docx'):
+            print("  Extracting DOCX paragraphs...")
+            paragraph_chunks_raw = merge_paragraphs_into_chunks(extract_docx_paragraphs_with_headings(path))
+
+        elif filename.lower().endswith('.txt'):
+            print("  Extracting TXT content...")
+            with open(path, "rb") as f:
+                text = f.read().decode("utf-8", errors="ignore")
+            # Use smart chunking for plain text
+            chunks_text = smart_chunk_text(text, CHUNK_SIZE_CHARS, CHUNK_OVERLAP_CHARS)
+            paragraph_chunks_raw = (
+                {"text": chunk, "heading": "No Heading", "paragraph_index": i} 
+                for i, chunk in enumerate(chunks_text)
+            )
 
-    # -----------------------------
-    # SELECT INDEX
-    # -----------------------------
-    if target_index == "km":
-        index_target = pc.Index(KNOWLEDGE_MAP_INDEX_NAME)
+        elif filename.lower().endswith('.json'):
+            print("  Extracting JSON content...")
+            with open(path, "rb") as f:
+                data = json.load(f)
+            paragraph_chunks_raw = iter_json_kb_chunks(data)
+
+        # Only pass on non-empty chunks
+        count = 0
+        total_chars = 0
+        for chunk in paragraph_chunks_raw:
+            if chunk.get("text", "").strip():
+                count += 1
+                total_chars += len(chunk["text"])
+                yield chunk
+
+        print(f"  ✅ Extracted {count} chunks (avg size: {total_chars // count if count else 0} chars)")
+
+    # =========================================================
+    # KM INGESTION
+    # =========================================================
     else:
-        index_target = pc.Index(PINECONE_INDEX_NAME)
+        print(f"🗺️ Processing KM file: {filename}")
+        with open(path, "rb") as f:
+            km_data = json.load(f)
+
+        count = 0
+        for i, entry in enumerate(km_data):
+            text_for_embedding = entry.get("text_to_embed", "").strip()
+            if not text_for_embedding:
+                print(f"  ⚠️ Skipping entry {i}: no text_to_embed")
+                continue
+
+            count += 1
+            yield {
+                "text": text_for_embedding,
+                "paragraph_index": i,
+                "metadata": {
+                    "source": filename,
+                    "user_intent": entry.get("user_intent", ""),
+                    "tool_name": entry.get("tool_name", ""),
+                    "url": entry.get("url") or entry.get("URL", ""),
+                    "text_to_embed": text_for_embedding
+                }
+            }
+
+        print(f"  ✅ Extracted {count} KM entries")
+
+def iter_json_kb_chunks(data):
+    """Chunks for a generic KB JSON file: a list of {topic, content} entries"""
+    for i, entry in enumerate(data):
+        content = entry.get("content", "")
+        # Apply smart chunking to JSON content if too large
+        if len(content) > CHUNK_SIZE_CHARS * 1.2:
+            chunks_text = smart_chunk_text(content, CHUNK_SIZE_CHARS, CHUNK_OVERLAP_CHARS)
+            for j, chunk in enumerate(chunks_text):
+                yield {
+                    "text": chunk,
+                    "heading": entry.get("topic", "No Heading"),
+                    "paragraph_index": f"{i}-{j}"
+                }
+        else:
+            yield {
+                "text": content,
+                "heading": entry.get("topic", "No Heading"),
+                "paragraph_index": i
+            }
+
+async def iterate_in_thread(make_iterator, maxsize: int):
+    """
+    Drive a blocking generator in a worker thread and yield its items here.
+    The bounded buffer applies backpressure: parsing pauses while embedding
+    and upserting catch up, so memory stays flat however large the file is.
+    """
+    loop = asyncio.get_running_loop()
+    buffer = asyncio.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in make_iterator():
+                if stop.is_set():
+                    return
+                asyncio.run_coroutine_threadsafe(buffer.put(("item", item)), loop).result()
+            asyncio.run_coroutine_threadsafe(buffer.put(("done", None)), loop).result()
+        except Exception as e:
+            asyncio.run_coroutine_threadsafe(buffer.put(("error", e)), loop).result()
+
+    # Copy the context so stage timers in the thread report to the current job
+    loop.run_in_executor(None, contextvars.copy_context().run, produce)
+    try:
+        while True:
+            kind, value = await buffer.get()
+            if kind == "done":
+                return
+            if kind == "error":
+                raise value
+            yield value
+    finally:
+        # Let a producer blocked on a full buffer finish and notice the stop flag
+        stop.set()
+        while not buffer.empty():
+            buffer.get_nowait()
+
+async def run_ingest_job(job: dict, upload_path: str):
+    """
+    Stream one upload through extract -> hash/diff -> embed -> upsert,
+    recording progress on the job. The first vectors are upserted while
+    later pages are still being parsed.
+    """
+    start_time = time.time()
+    filename = job["filename"]
+    target_index = job["target_index"]
+    job["timings"] = start_timing()  # Cumulative seconds per stage; batches overlap
 
     # -----------------------------
-    # FILE TYPE VALIDATION
+    # SELECT INDEX
     # -----------------------------
-    if not filename.lower().endswith(('.pdf', '.docx', '.json', '.txt')):
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid file type. Only PDF, DOCX, TXT, or JSON supported."
-        )
+    index_target = index_km if target_index == "km" else index_kb
 
+    # Embedding calls from this job queue behind chat for the Gemini quota
+    lane = current_lane.set(BULK)
     try:
-        # Read file bytes first
-        file_bytes = await file.read()
-        paragraph_chunks = []
+        content_hash = await asyncio.to_thread(file_sha256, upload_path)
+        size_bytes = os.path.getsize(upload_path)
 
         # =========================================================
-        # KB INGESTION (IMPROVED CHUNKING)
+        # WHAT IS ALREADY INDEXED (stable content hashes)
         # =========================================================
-        if target_index != "km":
-            print(f"📄 Processing KB file: {filename}")
-
-            if filename.lower().endswith('.pdf'):
-                print("  Extracting PDF paragraphs...")
-                paragraphs = extract_pdf_paragraphs_with_headings(file_bytes)
-                paragraph_chunks_raw = merge_paragraphs_into_chunks(paragraphs)
-
-            elif filename.lower().endswith('.docx'):
-                print("  Extracting DOCX paragraphs...")
-                paragraphs = extract_docx_paragraphs_with_headings(file_bytes)
-                paragraph_chunks_raw = merge_paragraphs_into_chunks(paragraphs)
-
-            elif filename.lower().endswith('.txt'):
-                print("  Extracting TXT content...")
-                text = file_bytes.decode("utf-8", errors="ignore")
-                # Use smart chunking for plain text
-                chunks_text = smart_chunk_text(text, CHUNK_SIZE_CHARS, CHUNK_OVERLAP_CHARS)
-                paragraph_chunks_raw = [
-                    {"text": chunk, "heading": "No Heading", "paragraph_index": i} 
-                    for i, chunk in enumerate(chunks_text)
-                ]
-
-            elif filename.lower().endswith('.json'):
-                print("  Extracting JSON content...")
-                data = json.loads(file_bytes)
-                paragraph_chunks_raw = []
-                for i, entry in enumerate(data):
-                    content = entry.get("content", "")
-                    # Apply smart chunking to JSON content if too large
-                    if len(content) > CHUNK_SIZE_CHARS * 1.2:
-                        chunks_text = smart_chunk_text(content, CHUNK_SIZE_CHARS, CHUNK_OVERLAP_CHARS)
-                        for j, chunk in enumerate(chunks_text):
-                            paragraph_chunks_raw.append({
-                                "text": chunk,
-                                "heading": entry.get("topic", "No Heading"),
-                                "paragraph_index": f"{i}-{j}"
-                            })
-                    else:
-                        paragraph_chunks_raw.append({
-                            "text": content,
-                            "heading": entry.get("topic", "No Heading"),
-                            "paragraph_index": i
-                        })
-
-            # Convert paragraph_chunks_raw to paragraph_chunks
-            for chunk in paragraph_chunks_raw:
-                if chunk.get("text", "").strip():  # Only add non-empty chunks
-                    paragraph_chunks.append(chunk)
-
-            print(f"  ✅ Extracted {len(paragraph_chunks)} chunks (avg size: {sum(len(c['text']) for c in paragraph_chunks) // len(paragraph_chunks) if paragraph_chunks else 0} chars)")
-
-        # =========================================================
-        # KM INGESTION
-        # =========================================================
-        else:
-            print(f"🗺️ Processing KM file: {filename}")
-            km_data = json.loads(file_bytes)
-
-            for i, entry in enumerate(km_data):
-                text_for_embedding = entry.get("text_to_embed", "").strip()
-                if not text_for_embedding:
-                    print(f"  ⚠️ Skipping entry {i}: no text_to_embed")
-                    continue
-
-                paragraph_chunks.append({
-                    "text": text_for_embedding,
-                    "paragraph_index": i,
-                    "metadata": {
-                        "source": filename,
-                        "user_intent": entry.get("user_intent", ""),
-                        "tool_name": entry.get("tool_name", ""),
-                        "url": entry.get("url") or entry.get("URL", ""),
-                        "text_to_embed": text_for_embedding
-                    }
-                })
-
-            print(f"  ✅ Extracted {len(paragraph_chunks)} KM entries")
-
-        # Check if we have chunks before deleting
-        if not paragraph_chunks:
-            raise HTTPException(
-                status_code=400,
-                detail=f"No valid content extracted from {filename}. File may be empty or corrupted."
-            )
-
-        # -----------------------------
-        # CLEAN EXISTING VECTORS (only after successful extraction)
-        # -----------------------------
-        print(f"🗑️ Deleting existing vectors for: {filename}")
+        # Vector ids are "<prefix><sha256>", so identical chunks keep identical ids
+        # across uploads and only new/changed chunks need embedding. Existing ids
+        # are listed up front so chunks can be diffed as they stream in.
+        id_prefix = chunk_id_prefix(filename, target_index)
         try:
-            index_target.delete(filter={"source": filename})
-            time.sleep(1)  # Wait for deletion to propagate
+            existing_ids = await asyncio.to_thread(list_vector_ids, index_target, id_prefix)
         except Exception as e:
-            print(f"  ⚠️ Could not delete existing vectors: {e}")
+            print(f"  ⚠️ Could not list existing vectors, re-ingesting everything: {e}")
+            existing_ids = set()
+
+        seen_ids = set()
+        km_upserts = []  # Mirrored into the in-process KM index once the job succeeds
+        lexical_upserts = []  # KB chunk texts for the BM25 index
+
+        async def new_chunks():
+            """Hash each extracted chunk and pass on only the ones not already indexed"""
+            legacy_cleared = bool(existing_ids)
+            async for chunk in iterate_in_thread(
+                lambda: timed_iter("extraction", iter_ingest_chunks(filename, upload_path, target_index)),
+                maxsize=INGEST_BUFFER_CHUNKS
+            ):
+                job["chunks_extracted"] += 1
+                chunk["content_hash"] = chunk_content_hash(chunk)
+                chunk_id = id_prefix + chunk["content_hash"]
+
+                # Skip duplicates
+                if chunk_id in seen_ids:
+                    logger.debug(f"  ⏭️ Skipping duplicate chunk {chunk['paragraph_index']}")
+                    continue
+                seen_ids.add(chunk_id)
 
-        # =========================================================
-        # EMBEDDING + UPSERT WITH DEDUPLICATION
-        # =========================================================
-        print(f"🔄 Embedding and upserting {len(paragraph_chunks)} chunks...")
-        vectors_to_upsert = []
-        seen_texts = set()  # Prevent duplicate chunks
+                if chunk_id in existing_ids:
+                    job["chunks_unchanged"] += 1
+                    continue
 
-        for chunk in paragraph_chunks:
+                if not legacy_cleared:
+                    # First hashed ingest of this file: clear vectors from the old
+                    # positional id scheme (<filename>-para-<n>) so nothing is
+                    # duplicated. Only done once the file has proven to have content.
+                    legacy_cleared = True
+                    print(f"🗑️ Deleting existing vectors for: {filename}")
+                    try:
+                        await asyncio.to_thread(index_target.delete, filter={"source": filename})
+                        await asyncio.sleep(1)  # Wait for deletion to propagate
+                    except Exception as e:
+                        print(f"  ⚠️ Could not delete existing vectors: {e}")
+
+                job["stage"] = "embedding"
+                yield chunk
+
+        def build_vector(chunk: dict, vector: List[float]) -> tuple:
             text = chunk["text"]
-            para_idx = chunk["paragraph_index"]
-            
-            # Skip duplicates
-            text_hash = hash(text)
-            if text_hash in seen_texts:
-                print(f"  ⏭️ Skipping duplicate chunk {para_idx}")
-                continue
-            seen_texts.add(text_hash)
-
-            # Generate embedding
-            try:
-                embedding_response = client.models.embed_content(
-                    model=EMBED_MODEL_NAME,
-                    contents=text
-                )
-                vector = embedding_response.embeddings[0].values
-            except Exception as e:
-                print(f"  ❌ Error embedding chunk {para_idx}: {e}")
-                continue
+            chunk_id = id_prefix + chunk["content_hash"]
 
             # -----------------------------
             # KB UPSERT (CLEAN)
             # -----------------------------
             if target_index != "km":
-                chunk_id = f"{filename}-para-{para_idx}"
-
-                vectors_to_upsert.append((
-                    chunk_id,
-                    vector,
-                    {
-                        "text": text,
-                        "heading": chunk.get("heading", "No Heading"),
-                        "source": filename,
-                        "chunk_size": len(text)  # Track chunk size for debugging
-                    }
-                ))
+                metadata = {
+                    "text": text,
+                    "heading": chunk.get("heading", "No Heading"),
+                    "source": filename,
+                    "chunk_size": len(text),  # Track chunk size for debugging
+                    "content_hash": chunk["content_hash"]
+                }
+                lexical_upserts.append((chunk_id, metadata))
+                return (chunk_id, vector, metadata)
 
             # -----------------------------
             # KM UPSERT (INTENT-BASED)
             # -----------------------------
-            else:
-                metadata = chunk["metadata"]
-                chunk_id = f"km-{filename}-{para_idx}"
-
-                vectors_to_upsert.append((
-                    chunk_id,
-                    vector,
-                    {
-                        "text": metadata["text_to_embed"],
-                        "source": metadata["source"],
-                        "user_intent": metadata["user_intent"],
-                        "tool_name": metadata["tool_name"],
-                        "url": metadata["url"],
-                    }
-                ))
-
-            # Batch upsert
-            if len(vectors_to_upsert) >= BATCH_SIZE:
-                index_target.upsert(vectors=vectors_to_upsert)
-                print(f"  📤 Upserted batch of {len(vectors_to_upsert)} vectors")
-                vectors_to_upsert = []
-
-        # Final flush
-        if vectors_to_upsert:
-            index_target.upsert(vectors=vectors_to_upsert)
-            print(f"  📤 Upserted final batch of {len(vectors_to_upsert)} vectors")
+            metadata = chunk["metadata"]
+            record = (
+                chunk_id,
+                vector,
+                {
+                    "text": metadata["text_to_embed"],
+                    "source": metadata["source"],
+                    "user_intent": metadata["user_intent"],
+                    "tool_name": metadata["tool_name"],
+                    "url": metadata["url"],
+                    "content_hash": chunk["content_hash"]
+                }
+            )
+            km_upserts.append(record)
+            return record
+
+        def record_progress(embedded: int, upserted: int):
+            job["chunks_embedded"] += embedded
+            job["chunks_upserted"] += upserted
+
+        # =========================================================
+        # EXTRACT -> EMBED -> UPSERT (new/changed chunks only)
+        # =========================================================
+        job["stage"] = "extracting"
+        print(f"🔄 Streaming {filename} through extraction, embedding and upsert...")
+        try:
+            # Batched embedding with bounded concurrency; upserts overlap embedding
+            upserted = await embed_and_upsert(
+                client,
+                EMBED_MODEL_NAME,
+                index_target,
+                new_chunks(),
+                build_vector,
+                batch_size=BATCH_SIZE,
+                concurrency=EMBED_CONCURRENCY,
+                on_batch=record_progress,
+                store=embedding_store,
+                admit=embed_admission.slot
+            )
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON file: {str(e)}")
+        except UnicodeDecodeError as e:
+            raise ValueError(f"File encoding error. Please ensure file is UTF-8 encoded: {str(e)}")
+
+        # Nothing extracted: leave whatever is indexed untouched
+        if not seen_ids:
+            raise ValueError(f"No valid content extracted from {filename}. File may be empty or corrupted.")
+
+        stale_ids = sorted(existing_ids - seen_ids)
+        new_count = len(seen_ids) - job["chunks_unchanged"]
+        print(f"  🔍 {new_count} new/changed, {job['chunks_unchanged']} unchanged, {len(stale_ids)} stale")
+
+        # Some batches failed: keep the previous version (stale chunks, cache,
+        # registry row) so the document is not left half-replaced
+        if upserted < new_count:
+            raise RuntimeError(
+                f"Only {upserted} of {new_count} new chunks of {filename} were embedded; "
+                f"previous version kept, please retry"
+            )
+
+        # -----------------------------
+        # DELETE STALE CHUNKS (after the new ones are live)
+        # -----------------------------
+        if stale_ids:
+            job["stage"] = "deleting"
+            print(f"🗑️ Deleting {len(stale_ids)} stale vectors for: {filename}")
+            with timed("delete"):
+                for start in range(0, len(stale_ids), DELETE_BATCH_SIZE):
+                    await asyncio.to_thread(index_target.delete, ids=stale_ids[start:start + DELETE_BATCH_SIZE])
+            job["chunks_deleted"] = len(stale_ids)
+
+        # -----------------------------
+        # HOT-RELOAD THE IN-PROCESS KM INDEX
+        # -----------------------------
+        if target_index == "km" and km_index.loaded:
+            km_index.apply(
+                upserts=km_upserts,
+                delete_ids=stale_ids,
+                delete_source=None if existing_ids else filename  # Legacy delete-by-source path
+            )
+            print(f"  🗺️ Knowledge Map index rebuilt in memory ({len(km_index)} entries)")
+
+        # -----------------------------
+        # KEEP THE BM25 INDEX IN STEP (KB only)
+        # -----------------------------
+        if target_index != "km":
+            await asyncio.to_thread(
+                lexical_index.apply,
+                upserts=lexical_upserts,
+                delete_ids=stale_ids,
+                delete_source=None if existing_ids else filename
+            )
+
+        # Cached answers built from this document are stale now
+        if new_count or stale_ids:
+            dropped = response_cache.invalidate_sources([filename])
+            if dropped:
+                print(f"  🧹 Invalidated {dropped} cached responses for {filename}")
+
+        # Vectors are in place; make the document visible in the listings
+        await asyncio.to_thread(
+            document_registry.record,
+            index_target.name, filename, len(seen_ids), content_hash, size_bytes
+        )
 
         elapsed = time.time() - start_time
+        request_seconds.observe(elapsed, "ingest_job")
         print(f"✅ Ingestion complete in {elapsed:.2f}s")
 
-        return IngestResponse(
-            success=True,
-            message=f"Successfully ingested {filename}",
-            chunks_added=len(paragraph_chunks),
-            filename=filename
-        )
+        job["stage"] = "done"
+        job["message"] = f"Successfully ingested {filename}"
 
-    except json.JSONDecodeError as e:
-        print(f"❌ JSON parsing error: {e}")
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid JSON file: {str(e)}"
-        )
-    except UnicodeDecodeError as e:
-        print(f"❌ Text encoding error: {e}")
-        raise HTTPException(
-            status_code=400,
-            detail=f"File encoding error. Please ensure file is UTF-8 encoded: {str(e)}"
-        )
+    finally:
+        current_lane.reset(lane)
+        try:
+            os.remove(upload_path)
+        except OSError:
+            pass
+
+def spool_upload(fileobj, filename: str) -> str:
+    """Copy an upload to a temp file (blocking) and return its path"""
+    suffix = os.path.splitext(filename)[1].lower()
+    with tempfile.NamedTemporaryFile(prefix="miv-ingest-", suffix=suffix, delete=False) as tmp:
+        shutil.copyfileobj(fileobj, tmp, 1024 * 1024)
+        return tmp.name
+
+def get_ingest_queue() -> IngestJobQueue:
+    return app.state.ingest_queue
+
+# -----------------------
+# Startup Warm-up
+# -----------------------
+km_index_version = 0  # Registry version of the Knowledge Map last loaded
+
+async def load_km_index():
+    global km_index_version
+    try:
+        # Read first: a change that lands during the fetch triggers another reload
+        version = await asyncio.to_thread(document_registry.version, index_km.name)
+        records = await asyncio.to_thread(fetch_all_vectors, index_km)
+        km_index.load(records)
+        km_index_version = version
+        readiness["km_index"] = True
+        print(f"🗺️ Loaded {len(km_index)} Knowledge Map entries into memory")
+    except Exception as e:
+        print(f"⚠️ Could not load Knowledge Map into memory, using Pinecone queries: {e}")
+
+async def watch_km_index():
+    """
+    Reload the in-memory KM table when another worker or ingest_km.py has
+    changed the Knowledge Map (seen through the registry version).
+    """
+    while True:
+        await asyncio.sleep(KM_REFRESH_CHECK_S)
+        if not km_index.loaded:
+            continue
+        try:
+            version = await asyncio.to_thread(document_registry.version, index_km.name)
+        except Exception as e:
+            print(f"⚠️ Could not check the Knowledge Map version: {e}")
+            continue
+        if version != km_index_version:
+            print("🗺️ Knowledge Map changed elsewhere, reloading it")
+            await load_km_index()
+
+async def backfill_lexical_index():
+    """One-off BM25 build from the KB index for vectors ingested before it existed"""
+    try:
+        records = await asyncio.to_thread(fetch_all_vectors, index_kb)
+        upserts = [(vid, meta) for vid, _, meta in records if meta.get("text")]
+        await asyncio.to_thread(lexical_index.apply, upserts=upserts)
+        print(f"🔤 Built BM25 index from {len(upserts)} KB chunks")
     except Exception as e:
-        print(f"❌ Unexpected error during ingestion: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        print(f"⚠️ Could not build BM25 index, retrieval stays vector-only: {e}")
+
+async def prewarm_connections():
+    """Open the Gemini connection pool with cheap model lookups (no tokens spent)"""
+    try:
+        await asyncio.wait_for(asyncio.gather(
+            client.aio.models.get(model=EMBED_MODEL_NAME),
+            client.aio.models.get(model=CHAT_MODEL_NAME)
+        ), timeout=EMBED_TIMEOUT_S)
+        readiness["prewarmed"] = True
+        print("🔥 Gemini connections pre-warmed")
+    except Exception as e:
+        print(f"⚠️ Gemini pre-warm failed (first request will connect): {e}")
+
+async def warm_up():
+    """Open both index handles, load the KM index and pre-warm, retrying with backoff"""
+    # Until the tokenizer loads, context tokens are estimated from length
+    asyncio.create_task(asyncio.to_thread(token_counter.load))
+
+    delay = 1.0
+    while True:
+        try:
+            # ping() opens the shared handle (creating the index if needed)
+            await asyncio.gather(
+                asyncio.to_thread(index_kb.ping),
+                asyncio.to_thread(index_km.ping)
+            )
+            readiness["indexes"] = True
+            break
+        except Exception as e:
+            readiness["error"] = str(e)
+            print(f"⚠️ Vector index warm-up failed, retrying in {delay:.0f}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
+
+    await load_km_index()
+    if HYBRID_RETRIEVAL and not len(lexical_index):
+        asyncio.create_task(backfill_lexical_index())
+    if PREWARM_CONNECTIONS:
+        await prewarm_connections()
+
+    readiness["error"] = None
+    readiness["ready"] = True
+    print("✅ Ready to serve traffic")
+
+# -----------------------
+# Ingest Endpoint
+# -----------------------
+@app.post("/ingest", response_model=IngestJobResponse)
+async def ingest_endpoint(response: Response, file: UploadFile = File(...), target_index: str = "kb"):
+    """
+    Accept an upload for ingestion into the vector database.
+
+    The file is validated and queued; processing happens on the background
+    worker pool. Poll /ingest/jobs/{job_id} for progress.
+    """
+    filename = file.filename
+    timings = start_timing()
+
+    # -----------------------------
+    # FILE TYPE VALIDATION
+    # -----------------------------
+    if not filename.lower().endswith(('.pdf', '.docx', '.json', '.txt')):
         raise HTTPException(
-            status_code=500,
-            detail=f"Error processing file: {str(e)}"
+            status_code=400,
+            detail="Invalid file type. Only PDF, DOCX, TXT, or JSON supported."
         )
 
+    # Spool the upload to disk so parsing can stream it page by page
+    with timed("spool_upload"):
+        upload_path = await asyncio.to_thread(spool_upload, file.file, filename)
+    if os.path.getsize(upload_path) == 0:
+        os.remove(upload_path)
+        raise HTTPException(status_code=400, detail=f"{filename} is empty.")
+
+    try:
+        job = await get_ingest_queue().submit(filename, target_index, upload_path)
+    except QueueFullError as e:
+        os.remove(upload_path)
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+
+    print(f"📥 Queued {filename} for ingestion (job {job['job_id']})")
+    response.headers["Server-Timing"] = server_timing(timings)
+    return IngestJobResponse(
+        success=True,
+        message=f"Queued {filename} for ingestion",
+        job_id=job["job_id"],
+        filename=filename,
+        status=job["status"]
+    )
+
 # -----------------------
-# Chat Endpoint (Dual Index) - OPTIMIZED RETRIEVAL
+# Ingest Job Status Endpoint
 # -----------------------
-@app.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(req: ChatRequest):
-    start_time = time.time()
-    
+@app.get("/ingest/jobs/{job_id}")
+async def ingest_job_status(job_id: str, response: Response):
+    job = await get_ingest_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ingest job: {job_id}")
+    timings = dict(job["timings"])
+    response.headers["Server-Timing"] = server_timing(timings)
+    job = {**job, "timings": {stage: round(seconds, 4) for stage, seconds in timings.items()}}
+    return {"success": True, "job": job}
+
+# -----------------------
+# Chat Pipeline (shared by /chat and /chat/stream)
+# -----------------------
+GREETING_RESPONSE = "Hello! 👋 I'm your AI Co-Pilot for accessibility. I can help you find tools, understand guidelines, or improve your content. What would you like to know?"
+
+def conversation_for(req: ChatRequest) -> dict:
+    """
+    The conversation a question is answered against: the session's recent
+    turns when it is a follow-up, otherwise empty.
+    """
+    history = {"summary": "", "turns": []}
+    if req.session_id:
+        if not SessionStore.valid_id(req.session_id):
+            raise HTTPException(status_code=400, detail="Invalid session_id.")
+        if is_follow_up(req.query):
+            history = session_store.history(req.session_id, SESSION_PROMPT_TURNS)
+    return history
+
+async def prepare_chat(req: ChatRequest, history: Optional[dict] = None) -> dict:
+    """
+    Run every stage of a chat request up to (but not including) generation.
+    history is conversation_for(req), computed here when not given.
+
+    Returns a plan dict. When "ready" is set (greeting, cache hit or KM fast
+    path) it holds the final ChatResponse payload; otherwise "prompt" and
+    "sources" are filled in and the caller generates the reply. "route"
+    records how the request was answered.
+    """
     # 1️⃣ Get user question
     question = req.query.strip()
     print(f"\n🔥 Received Question: {question}")
 
     # Use passed system prompt or fall back to default
     system_prompt = req.system_prompt if req.system_prompt else DEFAULT_SYSTEM_PROMPT
-    print(f"📋 Using System Prompt: {system_prompt[:100]}...")
+    logger.debug(f"📋 Using System Prompt: {system_prompt[:100]}...")
+
+    # Conversation so far, when this is a follow-up in a session
+    if history is None:
+        history = conversation_for(req)
+    in_conversation = bool(history["turns"] or history["summary"])
+
+    plan = {"ready": None, "prompt": None, "system_prompt": system_prompt, "sources": [], "query_embedding": None,
+            "cache_key": None, "used_documents": set(), "route": {"decision": "generate"},
+            # Answers that depend on earlier turns are not shared through the response cache
+            "use_cache": not req.bypass_cache and not in_conversation}
 
     # 2️⃣ Handle greetings first
     greetings = ['hi', 'hello', 'hey', 'good morning', 'good afternoon']
     if question.lower() in greetings:
-        return {
-            "response": "Hello! 👋 I'm your AI Co-Pilot for accessibility. I can help you find tools, understand guidelines, or improve your content. What would you like to know?",
-            "sources": []
-        }
+        plan["ready"] = {"response": GREETING_RESPONSE, "sources": [], "route": {"decision": "greeting"}}
+        return plan
 
     # 3️⃣ Detect formatting instructions
     formatted_question = question  # default
@@ -616,146 +1313,613 @@ async def chat_endpoint(req: ChatRequest):
             " (Answer as numbered steps: each step on a separate line starting with its number, no extra commentary)"
         )
 
-    try:
-        # --- EMBED USER QUESTION ---
-        embedding_response = client.models.embed_content(
-            model=EMBED_MODEL_NAME,
-            contents=question
-        )
-        query_embedding = embedding_response.embeddings[0].values
-
-        # --- STEP 1: QUERY KNOWLEDGE MAP ---
-        km_results = index_km.query(
-            vector=query_embedding,
-            top_k=2,  # Increased from 1 to get better coverage
-            include_metadata=True
-        )
+    # Follow-ups are retrieved together with the previous question(s)
+    retrieval_query = question
+    if history["turns"] and SESSION_RETRIEVAL_TURNS > 0:
+        previous = [q for q, _ in history["turns"][-SESSION_RETRIEVAL_TURNS:]]
+        retrieval_query = " ".join(previous + [question])
+        logger.debug(f"🧵 Follow-up retrieval query: {retrieval_query}")
+
+    # --- EMBED USER QUESTION ---
+    with timed("embed_question"):
+        query_embedding = await embed_query(retrieval_query)
+    plan["query_embedding"] = query_embedding
+
+    # --- SEMANTIC RESPONSE CACHE ---
+    cache_key = make_context_key(
+        system_prompt, req.top_k, formatted_question[len(question):]
+    )
+    plan["cache_key"] = cache_key
+    if plan["use_cache"]:
+        with timed("cache_lookup"):
+            cached = response_cache.lookup(query_embedding, cache_key)
+        if cached is not None:
+            print("⚡ Served from response cache")
+            plan["ready"] = {**cached, "route": {"decision": "cache"}}
+            return plan
+    # --- STEP 1: QUERY KNOWLEDGE MAP ---
+    with timed("km_query"):
+        if km_index.loaded:
+            # In-memory cosine top-k, no network round-trip
+            km_results = km_index.search(query_embedding, top_k=2)
+        else:
+            km_results = await query_index(
+                index_km,
+                "knowledge map query",
+                vector=query_embedding,
+                top_k=2,  # Increased from 1 to get better coverage
+                include_metadata=True,
+                include_values=True  # Stored KM vectors are reused for the KB query
+            )
 
-        km_text = ""
-        km_topic = question
-        
-        if km_results['matches']:
-            # Use the best match for topic expansion
-            km_text = km_results['matches'][0]['metadata'].get('text', '')
-            km_topic = km_text
-            print("🔹 KM Retrieved:")
+    km_text = ""
+    km_topic = retrieval_query
+    km_vector = None
+    
+    if km_results['matches']:
+        # Use the best match for topic expansion
+        best_km = km_results['matches'][0]
+        km_text = best_km['metadata'].get('text', '')
+        km_topic = km_text
+        # The KM entry's text_to_embed was embedded at ingest time
+        km_vector = best_km.get('values') or None
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("🔹 KM Retrieved:")
             for match in km_results['matches']:
                 metadata = match.get('metadata', {})
-                print(f"  - User Intent: {metadata.get('user_intent')}")
-                print(f"  - Source: {metadata.get('source')}")
-                print(f"  - Score: {match['score']:.3f}")
-                print(f"  - Text preview: {metadata.get('text', '')[:150]}")
-
-        # --- STEP 2: QUERY KNOWLEDGE BASE using KM topic ---
-        kb_embedding_response = client.models.embed_content(
-            model=EMBED_MODEL_NAME,
-            contents=km_topic
-        )
-        kb_query_embedding = kb_embedding_response.embeddings[0].values
-
-        kb_results = index_kb.query(
-            vector=kb_query_embedding,
-            top_k=req.top_k,
-            include_metadata=True
-        )
-
-        print("🔹 KB Retrieved:")
+                logger.debug(f"  - User Intent: {metadata.get('user_intent')}")
+                logger.debug(f"  - Source: {metadata.get('source')}")
+                logger.debug(f"  - Score: {match['score']:.3f}")
+                logger.debug(f"  - Text preview: {metadata.get('text', '')[:150]}")
+
+    # --- FAST PATH: confident tool lookups are answered from the KM entry ---
+    confidence, margin = km_confidence(km_results['matches'])
+    route = {"decision": "generate", "confidence": round(confidence, 3), "margin": round(margin, 3)}
+    plan["route"] = route
+    if (FAST_PATH_ENABLED and km_text and formatted_question == question
+            and confidence >= FAST_PATH_MIN_SCORE and margin >= FAST_PATH_MIN_MARGIN
+            and is_tool_lookup(question)):
+        answer = km_answer(best_km)
+        if answer is not None:
+            print(f"⚡ KM fast path: {best_km['metadata'].get('tool_name')} (score {confidence:.3f}, margin {margin:.3f})")
+            route["decision"] = "km_fast_path"
+            plan["ready"] = {
+                "response": answer,
+                "sources": [{"text": km_text[:200] + "...", "source": "Knowledge Map", "score": confidence}],
+                "route": route
+            }
+            return plan
+
+    # --- STEP 2: QUERY KNOWLEDGE BASE using KM topic ---
+    # The KB lookup is keyed on the KM match, so it has to wait for step 1.
+    # Prefer the stored KM vector; without a KM match the topic is the
+    # question itself, so its vector is reused. Only re-embed as a fallback.
+    if km_vector:
+        kb_query_embedding = km_vector
+    elif km_topic == retrieval_query:
+        kb_query_embedding = query_embedding
+    else:
+        with timed("embed_question"):
+            kb_query_embedding = await embed_query(km_topic)
+
+    # Lexical hits on the question's exact terms never leave the process
+    lexical_matches = []
+    if HYBRID_RETRIEVAL:
+        with timed("lexical_query"):
+            hits = await asyncio.to_thread(lexical_index.search, retrieval_query, top_k=req.top_k)
+            lexical_matches = [
+                {"id": m["id"], "score": 0.0, "bm25_score": m["score"], "metadata": m["metadata"], "lexical": True}
+                for m in hits
+                if m["score"] >= hits[0]["score"] * LEXICAL_MIN_RATIO
+            ]
+
+    with timed("kb_query"):
+        try:
+            kb_results = await query_index(
+                index_kb,
+                "knowledge base query",
+                vector=kb_query_embedding,
+                top_k=req.top_k,
+                include_metadata=True,
+                include_values=True  # The context packer compares chunk vectors
+            )
+        except HTTPException as e:
+            # A slow vector store shouldn't sink the answer when BM25 found something
+            if e.status_code != 504 or not lexical_matches:
+                raise
+            print("⚠️ KB vector query timed out, using lexical matches only")
+            kb_results = {"matches": [], "lexical_only": True}
+
+    if lexical_matches:
+        # Dense matches come first, so shared chunks keep their cosine score and flags
+        fused = reciprocal_rank_fusion([kb_results['matches'], lexical_matches], k=RRF_K)
+        kb_results = {**kb_results, "matches": fused[:req.top_k]}
+        await score_lexical_matches(kb_results['matches'], kb_query_embedding)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("🔹 KB Retrieved:")
         for match in kb_results['matches']:
             metadata = match.get('metadata', {})
-            print(f"  - Source: {metadata.get('source')}")
-            print(f"  - Heading: {metadata.get('heading')}")
-            print(f"  - Score: {match['score']:.3f}")
-            print(f"  - Chunk size: {metadata.get('chunk_size', 'unknown')} chars")
-            print(f"  - Text preview: {metadata.get('text', '')[:150]}")  
-            
-        # --- BUILD CONTEXT WITH DEDUPLICATION ---
-        retrieved_chunks = []
-        context_text_list = []
-        seen_sources = set()
-
-        # Add Knowledge Map snippet first
-        if km_text:
-            context_text_list.append(f"[Source: Knowledge Map]\n{km_text}")
-            retrieved_chunks.append({
-                "text": km_text[:200]+"...", 
-                "source": "Knowledge Map", 
-                "score": 1.0
-            })
-
-        # Add Knowledge Base results (filter by relevance score)
-        RELEVANCE_THRESHOLD = 0.7  # Only include chunks with score > 0.7
-        
-        for match in kb_results['matches']:
-            if match['score'] < RELEVANCE_THRESHOLD:
-                print(f"  ⏭️ Skipping low relevance chunk (score: {match['score']:.3f})")
+            logger.debug(f"  - Source: {metadata.get('source')}{' (lexical)' if match.get('lexical') else ''}")
+            logger.debug(f"  - Heading: {metadata.get('heading')}")
+            logger.debug(f"  - Score: {match['score']:.3f}")
+            logger.debug(f"  - Chunk size: {metadata.get('chunk_size', 'unknown')} chars")
+            logger.debug(f"  - Text preview: {metadata.get('text', '')[:150]}")
+
+    with timed("context_build"):
+        build_context(formatted_question, km_text,
+                      best_km if km_text else None, kb_results, plan, history)
+    return plan
+
+def cosine_similarity(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+async def score_lexical_matches(matches: List[dict], query_vector: List[float]):
+    """
+    Give BM25-only hits their chunk's cosine score and vector, so they are
+    gated, packed and reported on the same scale as dense hits ("cosine"
+    marks the ones scored). If the vectors can't be fetched, the fused RRF
+    score is reported instead.
+    """
+    lexical_only = [m for m in matches if m.get('lexical')]
+    if not lexical_only:
+        return
+    try:
+        with timed("lexical_fetch"):
+            fetched = await run_stage(
+                "lexical vector fetch",
+                asyncio.to_thread(index_kb.fetch, [m['id'] for m in lexical_only]),
+                QUERY_TIMEOUT_S
+            )
+    except Exception as e:
+        print(f"⚠️ Could not fetch vectors for lexical matches: {e}")
+        fetched = {}
+    for match in lexical_only:
+        values = fetched.get(match['id'], {}).get('values')
+        if values:
+            match['values'] = values
+            match['score'] = cosine_similarity(query_vector, values)
+            match['cosine'] = True
+        else:
+            match['score'] = match['rrf_score']
+
+def build_context(formatted_question: str, km_text: str,
+                  best_km: Optional[dict], kb_results: dict, plan: dict,
+                  history: Optional[dict] = None):
+    """Pack the context within the token budget and build the final prompt into the plan"""
+    # --- CANDIDATE CHUNKS ---
+    pinned = None
+    if km_text:
+        # The Knowledge Map snippet always goes first
+        pinned = {
+            "text": f"[Source: Knowledge Map]\n{km_text}",
+            "values": best_km.get('values'),
+            "preview": km_text[:200] + "...",
+            "source": "Knowledge Map",
+            "document": best_km['metadata'].get('source', 'Knowledge Map'),
+            "score": 1.0,
+        }
+
+    candidates = []
+    for match in kb_results['matches']:
+        if match.get('lexical') and not match.get('cosine'):
+            # No cosine score to judge it by: only usable when the vector query failed
+            if not kb_results.get('lexical_only'):
+                logger.debug(f"  ⏭️ Skipping unscored lexical chunk {match['id']}")
                 continue
-                
-            metadata = match.get('metadata', {})
-            text_content = metadata.get('text', '')
-            source_name = metadata.get('source', 'Knowledge Base')
-            
-            # Prevent duplicate sources from dominating context
-            source_key = f"{source_name}:{text_content[:50]}"
-            if source_key in seen_sources:
+        else:
+            # BM25 hits matched exact terms, so their cosine floor is lower
+            threshold = LEXICAL_RELEVANCE_THRESHOLD if match.get('lexical') else RELEVANCE_THRESHOLD
+            if match['score'] < threshold:
+                logger.debug(f"  ⏭️ Skipping low relevance chunk (score: {match['score']:.3f})")
                 continue
-            seen_sources.add(source_key)
-
-            context_text_list.append(f"[Source: {source_name}]\n{text_content}")
-            retrieved_chunks.append({
-                "text": text_content[:200]+"...", 
-                "source": source_name, 
-                "score": match['score']
-            })
-
-        full_context = "\n\n---\n\n".join(context_text_list)
-        
-        # Limit total context size to prevent token overflow
-        MAX_CONTEXT_CHARS = 8000  # ~2000 tokens for context
-        if len(full_context) > MAX_CONTEXT_CHARS:
-            full_context = full_context[:MAX_CONTEXT_CHARS] + "\n\n[Context truncated...]"
-            print(f"⚠️ Context truncated to {MAX_CONTEXT_CHARS} chars")
-
-        # --- GENERATE AI RESPONSE USING PASSED SYSTEM PROMPT ---
-        prompt = f"""{system_prompt}
 
-CONTEXT FROM KNOWLEDGE MAP + KNOWLEDGE BASE:
+        metadata = match.get('metadata', {})
+        text_content = metadata.get('text', '')
+        source_name = metadata.get('source', 'Knowledge Base')
+        candidates.append({
+            "text": f"[Source: {source_name}]\n{text_content}",
+            "values": match.get('values'),
+            "relevance": match['score'],
+            "preview": text_content[:200] + "...",
+            "source": source_name,
+            "document": source_name,
+            "score": match['score'],
+        })
+
+    # --- PACK WHOLE CHUNKS BY MMR WITHIN THE TOKEN BUDGET ---
+    packed = pack_context(candidates, CONTEXT_TOKEN_BUDGET, token_counter.count,
+                          mmr_lambda=CONTEXT_MMR_LAMBDA, pinned=pinned)
+    dropped = len(candidates) + (pinned is not None) - len(packed)
+    context_tokens = sum(c["tokens"] for c in packed)
+    logger.debug(f"📦 Context: {len(packed)} chunks, {context_tokens} tokens, {dropped} dropped")
+
+    full_context = "\n\n---\n\n".join(c["text"] for c in packed)
+    retrieved_chunks = [
+        {"text": c["preview"], "source": c["source"], "score": c["score"]} for c in packed
+    ]
+    used_documents = {c["document"] for c in packed}  # Source files behind the answer, for cache invalidation
+
+    # --- BUILD PROMPT (system prompt is prepended at generation time) ---
+    # The system prompt stays separate (plan["system_prompt"]) so generation can use its cached prefix
+    conversation = format_history(history) if history else ""
+    plan["prompt"] = f"""CONTEXT FROM KNOWLEDGE MAP + KNOWLEDGE BASE:
 {full_context}
-
+{conversation}
 USER QUESTION:
 {formatted_question}
 """
-        response = client.models.generate_content(
-            model=CHAT_MODEL_NAME,
-            contents=prompt
-        )
+    plan["sources"] = retrieved_chunks
+    plan["used_documents"] = used_documents
+
+def format_history(history: dict) -> str:
+    """The bounded conversation window as a prompt section ("" when empty)"""
+    if not history["turns"] and not history["summary"]:
+        return ""
+    lines = ["", "CONVERSATION SO FAR:"]
+    if history["summary"]:
+        lines.append(f"Earlier: {history['summary']}")
+    for q, a in history["turns"]:
+        lines.append(f"User: {q}")
+        lines.append(f"Assistant: {a}")
+    return "\n".join(lines) + "\n"
+
+def remember_response(req: ChatRequest, plan: dict, result: dict):
+    """Store a freshly generated answer in the semantic response cache"""
+    if plan["use_cache"]:
+        response_cache.store(plan["query_embedding"], plan["cache_key"], result, plan["used_documents"])
+
+def remember_turn(req: ChatRequest, route: dict, response_text: str):
+    """Append the answered question to the request's session, if it has one"""
+    if req.session_id and route["decision"] != "greeting":
+        session_store.append(req.session_id, req.query.strip(), response_text)
+
+def sse_event(event: str, data) -> str:
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def chat_flight_key(req: ChatRequest, history: dict) -> tuple:
+    """Requests with the same key produce the same answer"""
+    return (
+        normalize_query(req.query),
+        req.system_prompt or DEFAULT_SYSTEM_PROMPT,
+        req.top_k,
+        bool(req.bypass_cache),
+        # Only answers resolved against a conversation are per-session
+        req.session_id if history["turns"] or history["summary"] else None
+    )
+
+async def answer_chat(req: ChatRequest, history: dict) -> dict:
+    """Full /chat pipeline for one request: retrieval, generation, caching"""
+    start_time = time.time()
+    plan = await prepare_chat(req, history)
+    if plan["ready"] is not None:
+        return plan["ready"]
+
+    with timed("generation"):
+        response_text = await generate_text(plan["prompt"], plan["system_prompt"])
+
+    elapsed = time.time() - start_time
+    print(f"✅ Reply generated in {elapsed:.2f}s")
 
+    result = {"response": response_text, "sources": plan["sources"], "route": plan["route"]}
+    remember_response(req, plan, result)
+    return result
+
+# -----------------------
+# Chat Endpoint (Dual Index) - OPTIMIZED RETRIEVAL
+# -----------------------
+@app.post("/chat", response_model=ChatResponse)
+async def chat_endpoint(req: ChatRequest, response: Response):
+    start_time = time.time()
+    timings = start_timing()
+
+    try:
+        # Identical questions arriving while this one is in flight get the same answer
+        history = conversation_for(req)
+        result = await chat_flights.do(chat_flight_key(req, history), lambda: answer_chat(req, history))
+        # Every caller's turn goes into its own session, not just the leader's
+        remember_turn(req, result["route"], result["response"])
+        return result
+
+    except (HTTPException, Overloaded):
+        raise
+    except Exception as e:
+        print(f"❌ Error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
         elapsed = time.time() - start_time
-        print(f"✅ Reply generated in {elapsed:.2f}s")
+        request_seconds.observe(elapsed, "chat")
+        response.headers["Server-Timing"] = server_timing(timings, elapsed)
 
-        return {"response": response.text, "sources": retrieved_chunks}
+# -----------------------
+# Streaming Chat Endpoint (Server-Sent Events)
+# -----------------------
+async def chat_stream_events(req: ChatRequest, history: dict):
+    """
+    The /chat/stream pipeline as ("plan", plan) followed by ("token", text)
+    items. It runs once per stream_flights key and every coalesced stream
+    reads the same items.
+    """
+    plan = await prepare_chat(req, history)
+    if plan["ready"] is None:
+        # Shed load before the stream opens if generation is already backed up
+        generate_admission.check()
+    yield "plan", plan
+    if plan["ready"] is not None:
+        return
+
+    parts = []
+    async for piece in stream_text(plan["prompt"], plan["system_prompt"]):
+        parts.append(piece)
+        yield "token", piece
+    print(f"✅ Reply streamed ({len(parts)} pieces)")
+    remember_response(req, plan, {"response": "".join(parts), "sources": plan["sources"], "route": plan["route"]})
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(req: ChatRequest):
+    """
+    Same pipeline as /chat, but the reply is streamed as SSE frames:
+      event: sources  -> list of Source objects (sent before generation starts)
+      event: token    -> {"text": "..."} for each generated piece
+      event: done     -> {"elapsed": seconds, "timing": {stage: ms}, "route": {...}}
+      event: error    -> {"detail": "...", "retry_after"?: s} if generation fails mid-stream
+    Server-Timing covers retrieval only; generation timing is in the done event.
+    Identical questions in flight share one retrieval and one generation.
+    """
+    start_time = time.time()
+    timings = start_timing()
 
+    # Retrieval errors surface as normal HTTP errors before the stream opens
+    try:
+        history = conversation_for(req)
+        events = stream_flights.join(chat_flight_key(req, history), lambda: chat_stream_events(req, history))
+        _, plan = await events.__anext__()
+    except (HTTPException, Overloaded):
+        raise
     except Exception as e:
         print(f"❌ Error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+    retrieval_timing = server_timing(timings, time.time() - start_time)
+
+    route = (plan["ready"] or plan)["route"]
+
+    def done_event() -> str:
+        elapsed = time.time() - start_time
+        request_seconds.observe(elapsed, "chat_stream")
+        timing = {stage: round(seconds * 1000, 1) for stage, seconds in dict(timings).items()}
+        return sse_event("done", {"elapsed": round(elapsed, 3), "timing": timing, "route": route})
+
+    async def event_stream():
+        if plan["ready"] is not None:
+            yield sse_event("sources", plan["ready"]["sources"])
+            yield sse_event("token", {"text": plan["ready"]["response"]})
+            remember_turn(req, route, plan["ready"]["response"])
+            yield done_event()
+            return
+
+        yield sse_event("sources", plan["sources"])
+
+        parts = []
+        generation_start = time.perf_counter()
+        try:
+            async for _, piece in events:
+                if not parts:
+                    record("first_token", time.perf_counter() - generation_start, timings)
+                parts.append(piece)
+                yield sse_event("token", {"text": piece})
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            print(f"❌ Streaming error: {detail}")
+            error = {"detail": detail}
+            if isinstance(e, Overloaded):
+                error["retry_after"] = e.retry_after
+            yield sse_event("error", error)
+            return
+        finally:
+            record("generation", time.perf_counter() - generation_start, timings)
+
+        remember_turn(req, route, "".join(parts))
+        yield done_event()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            "Server-Timing": retrieval_timing
+        }
+    )
+
+# -----------------------
+# Batch Chat Endpoint (NDJSON)
+# -----------------------
+async def embed_questions(questions: List[str]):
+    """
+    Warm the query embedding cache for many questions with batched embed
+    calls, so each request's embed_query() afterwards is a cache hit.
+    """
+    missing = []
+    seen = set()
+    for q in questions:
+        key = normalize_query(q)
+        if key and key not in seen and await embedding_cache.aget(EMBED_MODEL_NAME, q.strip()) is None:
+            seen.add(key)
+            missing.append(q.strip())
+
+    async def embed_one(texts):
+        vectors = await embed_batch(client, EMBED_MODEL_NAME, texts, timeout=EMBED_TIMEOUT_S,
+                                    admit=lambda: embed_admission.slot(BULK))
+        await embedding_cache.aput_many(EMBED_MODEL_NAME, texts, vectors)
+
+    with timed("embed_question"):
+        await asyncio.gather(*(embed_one(texts) for texts in batched(missing, 100)))
+    return len(missing)
+
+@app.post("/chat/batch")
+async def chat_batch_endpoint(batch: ChatBatchRequest):
+    """
+    Answer many questions in one call. Questions are embedded in batched
+    calls, retrieval runs concurrently and generation is capped; results
+    stream back as NDJSON lines in completion order:
+      {"index": i, "query": ..., "response": ..., "sources": [...], "route": {...}, "elapsed": s}
+      {"index": i, "query": ..., "error": "...", "status": 504}
+    Gemini calls from a batch run in the bulk admission lane, behind live chat.
+    """
+    if not batch.requests:
+        raise HTTPException(status_code=400, detail="No requests in batch.")
+    if len(batch.requests) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch too large: {len(batch.requests)} > {BATCH_MAX_QUESTIONS} questions."
+        )
+
+    start_time = time.time()
+    try:
+        embedded = await embed_questions([r.query for r in batch.requests])
+    except Exception as e:
+        # Per-question embedding still happens inside prepare_chat
+        print(f"⚠️ Batch embedding failed, embedding per question: {e}")
+        embedded = 0
+    print(f"📦 Batch of {len(batch.requests)} questions ({embedded} embedded in batches)")
+
+    retrieval_slots = asyncio.Semaphore(BATCH_RETRIEVAL_CONCURRENCY)
+    generate_slots = asyncio.Semaphore(
+        min(batch.generate_concurrency or BATCH_GENERATE_CONCURRENCY, BATCH_GENERATE_CONCURRENCY)
+    )
+
+    async def answer(i: int, req: ChatRequest) -> dict:
+        item_start = time.time()
+        # Each item is its own task, so this only moves the batch's Gemini calls to the bulk lane
+        current_lane.set(BULK)
+        try:
+            async with retrieval_slots:
+                plan = await prepare_chat(req)
+            if plan["ready"] is not None:
+                result = plan["ready"]
+            else:
+                async with generate_slots:
+                    with timed("generation"):
+                        response_text = await generate_text(plan["prompt"], plan["system_prompt"])
+                result = {"response": response_text, "sources": plan["sources"], "route": plan["route"]}
+                remember_response(req, plan, result)
+            remember_turn(req, result["route"], result["response"])
+            return {"index": i, "query": req.query, **result,
+                    "elapsed": round(time.time() - item_start, 3)}
+        except HTTPException as e:
+            return {"index": i, "query": req.query, "error": e.detail, "status": e.status_code}
+        except Overloaded as e:
+            return {"index": i, "query": req.query, "error": str(e), "status": 503,
+                    "retry_after": e.retry_after}
+        except Exception as e:
+            print(f"❌ Batch item {i} failed: {e}")
+            return {"index": i, "query": req.query, "error": str(e), "status": 500}
+
+    async def result_lines():
+        tasks = [asyncio.create_task(answer(i, req)) for i, req in enumerate(batch.requests)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield json.dumps(await finished) + "\n"
+        finally:
+            # Client went away: stop spending tokens on the rest
+            for task in tasks:
+                task.cancel()
+            elapsed = time.time() - start_time
+            request_seconds.observe(elapsed, "chat_batch")
+            print(f"✅ Batch finished in {elapsed:.2f}s")
+
+    return StreamingResponse(
+        result_lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# -----------------------
+# Session Endpoints
+# -----------------------
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    """The conversation window the server keeps for a session"""
+    if not SessionStore.valid_id(session_id):
+        raise HTTPException(status_code=400, detail="Invalid session_id.")
+    history = session_store.history(session_id)
+    return {
+        "session_id": session_id,
+        "summary": history["summary"],
+        "turns": [{"query": q, "response": a} for q, a in history["turns"]]
+    }
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """Forget a conversation (the widget calls this when chat history is cleared)"""
+    if not SessionStore.valid_id(session_id):
+        raise HTTPException(status_code=400, detail="Invalid session_id.")
+    return {"success": True, "deleted": session_store.clear(session_id)}
+
+# -----------------------
+# Cache Stats Endpoint
+# -----------------------
+@app.get("/cache-stats")
+async def cache_stats():
+    return {
+        "success": True,
+        "embedding_cache": embedding_cache.stats(),
+        "embedding_store": await asyncio.to_thread(embedding_store.stats),
+        "response_cache": response_cache.stats(),
+        "lexical_index": lexical_index.stats(),
+        "prompt_cache": prompt_cache.stats(),
+        "sessions": session_store.stats(),
+        "single_flight": {
+            "chat": chat_flights.stats(),
+            "chat_stream": stream_flights.stats(),
+            "embedding": embed_flights.stats()
+        },
+        "admission": {
+            "embedding": embed_admission.stats(),
+            "generation": generate_admission.stats()
+        }
+    }
+
+# -----------------------
+# Metrics Endpoint (Prometheus text format)
+# -----------------------
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 # -----------------------
 # List Documents Endpoint
 # -----------------------
+async def list_registered_documents(index) -> List[dict]:
+    """Registry rows for an index, merged once with the sources already in the index"""
+    if not await asyncio.to_thread(document_registry.is_backfilled, index.name):
+        # Vectors ingested before the registry existed: one-off backfill,
+        # remembered in the registry even when the index is empty
+        sources = await asyncio.to_thread(index.list_sources)
+        added = await asyncio.to_thread(document_registry.backfill, index.name, sources)
+        print(f"🗂️ Backfilled {added} documents into the registry for '{index.name}'")
+    documents = await asyncio.to_thread(document_registry.list, index.name)
+
+    return [
+        {
+            "filename": doc["source"],
+            "chunk_count": doc["chunk_count"],
+            "size_bytes": doc["size_bytes"],
+            "content_hash": doc["content_hash"],
+            "ingested_at": doc["ingested_at"],
+        }
+        for doc in documents
+    ]
+
 @app.get("/list-documents")
 async def list_documents():
     try:
-        results = index_kb.query(
-            vector=[0.0] * 768,
-            top_k=1000,
-            include_metadata=True
-        )
-        sources = set()
-        for match in results.get('matches', []):
-            metadata = match.get('metadata', {})
-            if 'source' in metadata:
-                sources.add(metadata['source'])
-        documents = [{"filename": src} for src in sorted(sources)]
-        return {"success": True, "documents": documents, "total_chunks_sampled": len(results.get('matches', []))}
+        documents = await list_registered_documents(index_kb)
+        return {"success": True, "documents": documents}
     except Exception as e:
         print(f"❌ Error listing documents: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -766,13 +1930,7 @@ async def list_documents():
 @app.get("/list-knowledge-maps")
 async def list_km():
     try:
-        results = index_km.query(vector=[0.0]*768, top_k=1000, include_metadata=True)
-        sources = set()
-        for match in results.get('matches', []):
-            metadata = match.get('metadata', {})
-            if 'source' in metadata:
-                sources.add(metadata['source'])
-        km_docs = [{"filename": src} for src in sorted(sources)]
+        km_docs = await list_registered_documents(index_km)
         return {"success": True, "knowledge_maps": km_docs}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,113 @@
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Optional, Tuple
+
+# ==========================================
+# STAGE TIMERS + PROMETHEUS HISTOGRAMS
+# ==========================================
+# Every pipeline stage is wrapped in timed("<stage>"). Each measurement
+# feeds a process-wide histogram (rendered on /metrics) and, when a request
+# or ingest job has called start_timing(), that request's own totals, which
+# become its Server-Timing header. The per-request dict lives in a
+# ContextVar, so tasks and threads started from the request inherit it.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...],
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {k: (list(v[0]), v[1], v[2]) for k, v in self._series.items()}
+        for label_values, (counts, total, count) in sorted(snapshot.items()):
+            labels = ",".join(f'{n}="{v}"' for n, v in zip(self.label_names, label_values))
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total:.6f}")
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+        return "\n".join(lines)
+
+stage_seconds = Histogram(
+    "miv_stage_duration_seconds",
+    "Time spent in each chat and ingest pipeline stage",
+    ("stage",)
+)
+request_seconds = Histogram(
+    "miv_request_duration_seconds",
+    "End-to-end latency per endpoint",
+    ("endpoint",)
+)
+
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("miv_stage_timings", default=None)
+
+def start_timing() -> Dict[str, float]:
+    """Begin collecting stage totals for the current request or job"""
+    timings = {}
+    _timings.set(timings)
+    return timings
+
+def record(stage: str, seconds: float, timings: Optional[Dict[str, float]] = None):
+    """Observe one stage duration; timings defaults to the current request's dict"""
+    stage_seconds.observe(seconds, stage)
+    if timings is None:
+        timings = _timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+@contextmanager
+def timed(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+def timed_iter(stage: str, items: Iterable):
+    """Yield from items, recording the total time spent producing them as one observation"""
+    iterator = iter(items)
+    total = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                total += time.perf_counter() - start
+            yield item
+    finally:
+        record(stage, total)
+
+def server_timing(timings: Dict[str, float], total: Optional[float] = None) -> str:
+    """Format stage totals as a Server-Timing header value (milliseconds)"""
+    parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in dict(timings).items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+def render_metrics() -> str:
+    """Prometheus text exposition of every histogram"""
+    return "\n".join([stage_seconds.render(), request_seconds.render()]) + "\n"
@@ -0,0 +1,126 @@
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Callable, Optional
+
+# ==========================================
+# CACHED SYSTEM-PROMPT PREFIXES (Gemini context caching)
+# ==========================================
+# Every chat prompt starts with the same system prompt: the default one or
+# the site-specific prompt the WordPress plugin sends. Each distinct prompt
+# (keyed by SHA-256) is registered once with client.aio.caches and later
+# generations reference the cached content by name, so the model doesn't
+# re-process the prefix on every call.
+#
+# Registration happens in the background: the request that first sees a
+# prompt is answered with the prompt inline, and so is every request while
+# the entry is missing, expired or evicted. Prompts below the provider's
+# minimum cacheable size, or that failed to register, are remembered and
+# retried only after a back-off.
+
+RETRY_AFTER_FAILURE_S = 600
+EXPIRY_MARGIN_S = 60  # Stop using an entry this long before the provider drops it
+
+def prompt_key(system_prompt: str) -> str:
+    return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+
+def is_cache_miss_error(error: Exception) -> bool:
+    """Did a generation fail because its cached content no longer exists?"""
+    return getattr(error, "code", None) in (400, 403, 404) and "cache" in str(error).lower()
+
+class PromptPrefixCache:
+    def __init__(self, client, model_name: str, count_tokens: Callable[[str], int],
+                 ttl_s: int = 3600, max_entries: int = 16, min_tokens: int = 1024):
+        self.client = client
+        self.model_name = model_name
+        self.count_tokens = count_tokens
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.min_tokens = min_tokens
+        self._entries = OrderedDict()   # key -> (cache name, local expiry)
+        self._skip_until = {}           # key -> monotonic time to retry registration
+        self._pending = {}              # key -> registration task
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+        self.expired = 0
+
+    def lookup(self, system_prompt: str) -> Optional[str]:
+        """
+        Cached content name for this prompt, or None to send it inline.
+        A miss schedules registration; it never blocks the request.
+        """
+        key = prompt_key(system_prompt)
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None:
+            name, expires_at = entry
+            if now < expires_at:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return name
+            del self._entries[key]
+            self.expired += 1
+
+        self.misses += 1
+        if key not in self._pending and now >= self._skip_until.get(key, 0.0):
+            task = asyncio.ensure_future(self._register(key, system_prompt))
+            self._pending[key] = task
+            task.add_done_callback(lambda t: self._pending.pop(key, None))
+        return None
+
+    def invalidate(self, name: str):
+        """Forget an entry the provider reported as missing or expired"""
+        for key, (entry_name, _) in list(self._entries.items()):
+            if entry_name == name:
+                del self._entries[key]
+                self.expired += 1
+
+    async def _register(self, key: str, system_prompt: str):
+        if self.count_tokens(system_prompt) < self.min_tokens:
+            # Below the provider minimum: inline (implicit prefix caching still applies)
+            self._skip_until[key] = time.monotonic() + RETRY_AFTER_FAILURE_S
+            return
+        try:
+            from google.genai import types
+            cached = await self.client.aio.caches.create(
+                model=self.model_name,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=system_prompt,
+                    display_name=f"miv-system-{key[:12]}",
+                    ttl=f"{self.ttl_s}s",
+                )
+            )
+        except Exception as e:
+            print(f"⚠️ System prompt cache registration failed, sending inline: {e}")
+            self._skip_until[key] = time.monotonic() + RETRY_AFTER_FAILURE_S
+            return
+
+        self._entries[key] = (cached.name, time.monotonic() + self.ttl_s - EXPIRY_MARGIN_S)
+        self._entries.move_to_end(key)
+        self.created += 1
+        print(f"🗂️ Cached system prompt {key[:12]} as {cached.name}")
+        while len(self._entries) > self.max_entries:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            asyncio.ensure_future(self._delete(evicted))
+
+    async def _delete(self, name: str):
+        """Best effort: the entry expires on its own anyway"""
+        try:
+            await self.client.aio.caches.delete(name=name)
+        except Exception as e:
+            print(f"⚠️ Could not delete cached prompt {name}: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "created": self.created,
+            "expired": self.expired,
+            "ttl_s": self.ttl_s,
+        }
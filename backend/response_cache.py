@@ -0,0 +1,117 @@
+import time
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+# ==========================================
+# SEMANTIC RESPONSE CACHE
+# ==========================================
+# Answers are cached against the question embedding. A new question whose
+# embedding lies within max_distance (cosine) of a recently answered one,
+# asked with the same prompt settings, gets the cached answer back and
+# skips generation entirely.
+
+def make_context_key(system_prompt: str, top_k: int, format_hint: str = "") -> str:
+    """Everything besides the question that shapes the answer"""
+    raw = f"{top_k}\x00{format_hint}\x00{system_prompt}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class SemanticResponseCache:
+    def __init__(self, max_size: int = 512, ttl_seconds: float = 3600,
+                 max_distance: float = 0.05):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        # entry_id -> dict(context_key, vector, response, sources, stored_at)
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _unit(vector: List[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def lookup(self, vector: List[float], context_key: str) -> Optional[dict]:
+        """Return a copy of the closest cached response, or None"""
+        query = self._unit(vector)
+        now = time.time()
+
+        with self._lock:
+            expired = [eid for eid, e in self._entries.items()
+                       if now - e["stored_at"] > self.ttl_seconds]
+            for eid in expired:
+                del self._entries[eid]
+
+            candidates = [(eid, e) for eid, e in self._entries.items()
+                          if e["context_key"] == context_key]
+            if not candidates:
+                self.misses += 1
+                return None
+
+            matrix = np.stack([e["vector"] for _, e in candidates])
+            similarities = matrix @ query
+            best = int(np.argmax(similarities))
+            if 1.0 - float(similarities[best]) > self.max_distance:
+                self.misses += 1
+                return None
+
+            eid, entry = candidates[best]
+            self._entries.move_to_end(eid)
+            self.hits += 1
+            return copy.deepcopy(entry["response"])
+
+    def store(self, vector: List[float], context_key: str, response: dict,
+              sources: Iterable[str]):
+        """Cache a response along with the source documents it was built from"""
+        with self._lock:
+            self._entries[self._next_id] = {
+                "context_key": context_key,
+                "vector": self._unit(vector),
+                "response": copy.deepcopy(response),
+                "sources": set(sources),
+                "stored_at": time.time(),
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_sources(self, sources: Iterable[str]) -> int:
+        """Drop every cached answer that used any of the given source documents"""
+        sources = set(sources)
+        with self._lock:
+            stale = [eid for eid, e in self._entries.items() if e["sources"] & sources]
+            for eid in stale:
+                del self._entries[eid]
+            self.invalidations += len(stale)
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "max_distance": self.max_distance,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
@@ -0,0 +1,173 @@
+import re
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Optional
+
+# ==========================================
+# SERVER-SIDE CONVERSATION SESSIONS
+# ==========================================
+# Each session keeps its most recent turns verbatim plus a compact rolling
+# summary of older ones. When a session goes over its turn or token cap,
+# its oldest turns are folded into the summary (the question and the first
+# sentence of the answer), and the summary itself is trimmed from the
+# front. Sessions are evicted least-recently-used first, after ttl_s of
+# inactivity, and whenever the whole store goes over its memory ceiling.
+
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,128}$")
+ANSWER_DIGEST_CHARS = 200  # Longest answer excerpt kept in the summary
+
+_FOLLOW_UP_PATTERNS = [
+    # Opens with a pronoun pointing back: "it", "that one", "those"
+    re.compile(r"^(it|its|that|this|these|those|them|they|there|same)\b"),
+    # "what about ...", "how about ...", "what else ..."
+    re.compile(r"^(what|how) about\b"),
+    re.compile(r"^what else\b"),
+    # Continues the last turn: "and for ...", "but on mobile ..."
+    re.compile(r"^(and|also|but|so|or)\b"),
+    # Ends pointing back: "how do I test it?", "why is that?", "can I do them too?"
+    re.compile(r"\b(it|that|them|those|these|one|ones)( (too|as well|instead))?$"),
+    # "can I do the same for video", "what should I use instead"
+    re.compile(r"\b(the same|instead|as well)\b"),
+    # A bare prompt to go on: "Why?", "Examples?", "More?"
+    re.compile(r"^(why|how|how so|really|examples?|any examples|more|tell me more|go on)$"),
+]
+
+def is_follow_up(question: str) -> bool:
+    """
+    Does the question point back at the last turn ("what about for PDFs?",
+    "and on mobile?", "how do I test it?", "why?")? Short standalone
+    questions such as "What is WCAG?" are not follow-ups.
+    """
+    q = " ".join(question.lower().split()).strip(" .!?")
+    return any(p.search(q) for p in _FOLLOW_UP_PATTERNS)
+
+def _first_sentence(text: str) -> str:
+    text = " ".join(text.split())
+    match = re.search(r"(.+?[.!?])(\s|$)", text)
+    sentence = match.group(1) if match else text
+    return sentence[:ANSWER_DIGEST_CHARS]
+
+class _Session:
+    __slots__ = ("turns", "summary", "last_used", "bytes")
+
+    def __init__(self):
+        self.turns = deque()   # (question, answer, tokens)
+        self.summary = []      # Digest lines, oldest first
+        self.last_used = time.monotonic()
+        self.bytes = 0
+
+class SessionStore:
+    def __init__(self, count_tokens: Callable[[str], int], max_sessions: int = 10000,
+                 ttl_s: float = 3600, max_turns: int = 6, max_tokens: int = 1500,
+                 summary_tokens: int = 300, max_bytes: int = 64 * 1024 * 1024):
+        self.count_tokens = count_tokens
+        self.max_sessions = max_sessions
+        self.ttl_s = ttl_s
+        self.max_turns = max_turns            # Verbatim turns kept per session
+        self.max_tokens = max_tokens          # Verbatim turns + summary, per session
+        self.summary_tokens = summary_tokens  # Rolling summary cap, per session
+        self.max_bytes = max_bytes            # Ceiling for every session together (by text length)
+        self._sessions = OrderedDict()        # session id -> _Session, LRU order
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    @staticmethod
+    def valid_id(session_id: str) -> bool:
+        return bool(SESSION_ID_PATTERN.match(session_id))
+
+    def history(self, session_id: str, max_turns: Optional[int] = None) -> dict:
+        """
+        {"summary": str, "turns": [(question, answer), ...]} for a session,
+        newest turn last; empty when the session is unknown or expired.
+        """
+        with self._lock:
+            session = self._touch(session_id)
+            if session is None:
+                return {"summary": "", "turns": []}
+            turns = [(q, a) for q, a, _ in session.turns]
+            if max_turns is not None:
+                turns = turns[-max_turns:] if max_turns > 0 else []
+            return {"summary": " ".join(session.summary), "turns": turns}
+
+    def append(self, session_id: str, question: str, answer: str):
+        """Record one turn, folding old turns into the summary to stay within caps"""
+        tokens = self.count_tokens(question) + self.count_tokens(answer)
+        with self._lock:
+            session = self._touch(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _Session()
+            session.turns.append((question, answer, tokens))
+            self._resize(session, len(question) + len(answer))
+
+            while session.turns and (
+                len(session.turns) > self.max_turns
+                or self._session_tokens(session) > self.max_tokens
+            ):
+                old_q, old_a, _ = session.turns.popleft()
+                digest = f"User asked: {' '.join(old_q.split())} - Answer: {_first_sentence(old_a)}"
+                session.summary.append(digest)
+                self._resize(session, len(digest) - len(old_q) - len(old_a))
+                while len(session.summary) > 1 and self._summary_tokens(session) > self.summary_tokens:
+                    dropped = session.summary.pop(0)
+                    self._resize(session, -len(dropped))
+
+            self._evict()
+
+    def clear(self, session_id: str) -> bool:
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                return False
+            self._bytes -= session.bytes
+            return True
+
+    # -----------------------------
+    # Internals (callers hold the lock)
+    # -----------------------------
+    def _touch(self, session_id: str) -> Optional[_Session]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        now = time.monotonic()
+        if now - session.last_used > self.ttl_s:
+            del self._sessions[session_id]
+            self._bytes -= session.bytes
+            self.evictions += 1
+            return None
+        session.last_used = now
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _resize(self, session: _Session, delta: int):
+        session.bytes += delta
+        self._bytes += delta
+
+    def _summary_tokens(self, session: _Session) -> int:
+        return self.count_tokens(" ".join(session.summary)) if session.summary else 0
+
+    def _session_tokens(self, session: _Session) -> int:
+        return sum(t for _, _, t in session.turns) + self._summary_tokens(session)
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._sessions:
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            if (len(self._sessions) <= self.max_sessions and self._bytes <= self.max_bytes
+                    and now - oldest.last_used <= self.ttl_s):
+                break
+            del self._sessions[oldest_id]
+            self._bytes -= oldest.bytes
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "ttl_s": self.ttl_s,
+            }
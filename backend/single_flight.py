@@ -0,0 +1,109 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Hashable
+
+# ==========================================
+# SINGLE-FLIGHT REQUEST COALESCING
+# ==========================================
+# A burst of identical requests (same question shared on a page) should
+# cost one embedding and one generation, not N. The first caller for a key
+# starts the work as a task; callers arriving while it is in flight await
+# the same task and get the same result or exception. The key is dropped
+# as soon as the task finishes, so nothing is cached beyond the burst.
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight = {}  # key -> asyncio.Task
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: Hashable, make_call: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(make_call())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+            self.leaders += 1
+        else:
+            self.followers += 1
+        # Shielded: one caller disconnecting must not cancel the shared work
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception retrieved even if every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        calls = self.leaders + self.followers
+        return {
+            "in_flight": len(self._inflight),
+            "leaders": self.leaders,
+            "coalesced": self.followers,
+            "coalesced_rate": round(self.followers / calls, 3) if calls else 0.0,
+        }
+
+# ==========================================
+# SINGLE-FLIGHT FOR STREAMED REPLIES
+# ==========================================
+# The same idea for an async generator: the first caller for a key starts
+# one producer task that drains the generator into a shared buffer, and
+# every caller (the first included) reads the buffer from the start, so
+# late joiners replay what was already produced and then follow live.
+# The key is dropped when the generator finishes or fails.
+
+class _Broadcast:
+    def __init__(self):
+        self.items = []
+        self.finished = False
+        self.error = None
+        self.changed = asyncio.Condition()
+
+    async def notify(self):
+        async with self.changed:
+            self.changed.notify_all()
+
+class StreamFlight(SingleFlight):
+    async def join(self, key: Hashable, make_stream: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        broadcast = self._inflight.get(key)
+        if broadcast is None:
+            broadcast = self._inflight[key] = _Broadcast()
+            asyncio.ensure_future(self._produce(key, broadcast, make_stream))
+            self.leaders += 1
+        else:
+            self.followers += 1
+
+        position = 0
+        while True:
+            if position < len(broadcast.items):
+                yield broadcast.items[position]
+                position += 1
+                continue
+            if broadcast.finished:
+                if broadcast.error is not None:
+                    raise broadcast.error
+                return
+            async with broadcast.changed:
+                await broadcast.changed.wait_for(
+                    lambda: len(broadcast.items) > position or broadcast.finished
+                )
+
+    async def _produce(self, key: Hashable, broadcast: _Broadcast,
+                       make_stream: Callable[[], AsyncIterator[Any]]):
+        # Runs to the end even if every reader disconnects, like do()
+        try:
+            async for item in make_stream():
+                broadcast.items.append(item)
+                await broadcast.notify()
+        except asyncio.CancelledError:
+            broadcast.error = RuntimeError(f"{self.name} stream was cancelled")
+            raise
+        except Exception as e:
+            broadcast.error = e
+        finally:
+            broadcast.finished = True
+            if self._inflight.get(key) is broadcast:
+                del self._inflight[key]
+            await broadcast.notify()
@@ -0,0 +1,578 @@
+import os
+import json
+import math
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, run one writer at a time
+    fcntl = None
+
+# ==========================================
+# PLUGGABLE VECTOR STORE BACKENDS
+# ==========================================
+# The API and the ingest scripts talk to a VectorStore, never to Pinecone
+# directly. Two backends implement it:
+#   - PineconeStore: thin adapter over a Pinecone serverless index
+#   - LocalVectorStore: float32 vectors in a memory-mapped file plus a
+#     SQLite metadata table; exact search for small collections, IVF
+#     (k-means partitioned) search once a collection grows. The API and
+#     a CLI ingest may open the same collection: writes hold an exclusive
+#     lock file, and every process reloads its in-memory view when it
+#     sees another process's commit.
+# Method names and arguments mirror Pinecone's Index so call sites are
+# identical for both; results are always plain dicts.
+
+DEFAULT_LOCAL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vector_data")
+IVF_THRESHOLD = 20_000     # Vectors before a local collection switches to IVF search
+IVF_NPROBE = 8             # Partitions scanned per IVF query
+LIST_PAGE_SIZE = 100       # Ids per page from list(), like Pinecone
+
+class VectorStore:
+    """Operations the app needs from a vector index"""
+    name: str = ""
+
+    def upsert(self, vectors: List[tuple]):
+        """Insert or replace (id, values, metadata) records"""
+        raise NotImplementedError
+
+    def query(self, vector: List[float], top_k: int = 5, filter: Optional[dict] = None,
+              include_metadata: bool = True, include_values: bool = False) -> dict:
+        """Cosine top-k: {"matches": [{"id", "score", "values"?, "metadata"?}]}"""
+        raise NotImplementedError
+
+    def delete(self, ids: Optional[List[str]] = None, filter: Optional[dict] = None):
+        raise NotImplementedError
+
+    def list(self, prefix: str = "") -> Iterator[List[str]]:
+        """Pages of ids starting with prefix"""
+        raise NotImplementedError
+
+    def fetch(self, ids: List[str]) -> Dict[str, dict]:
+        """{id: {"values": [...], "metadata": {...}}} for the ids that exist"""
+        raise NotImplementedError
+
+    def list_sources(self) -> List[str]:
+        """Distinct metadata "source" values in the index"""
+        raise NotImplementedError
+
+    def ping(self):
+        """Cheap round trip that opens (or checks) the backend connection"""
+
+# ==========================================
+# PINECONE BACKEND
+# ==========================================
+class PineconeStore(VectorStore):
+    def __init__(self, index, name: str):
+        self.index = index
+        self.name = name
+
+    @classmethod
+    def connect(cls, pc, name: str, dimension: int = 768, cloud: str = "aws",
+                region: str = "us-east-1", wait_ready: bool = False,
+                host: Optional[str] = None, pool_threads: int = 1) -> "PineconeStore":
+        """
+        Open an index, creating it first if it doesn't exist. With a known
+        host the control-plane lookups are skipped entirely. The returned
+        handle keeps its HTTP connections alive and is meant to be shared.
+        """
+        from pinecone import ServerlessSpec
+
+        if host:
+            return cls(pc.Index(name, host=host, pool_threads=pool_threads), name)
+
+        if name not in pc.list_indexes().names():
+            print(f"⚙️ Creating index '{name}'")
+            pc.create_index(
+                name=name,
+                dimension=dimension,
+                metric="cosine",
+                spec=ServerlessSpec(cloud=cloud, region=region)
+            )
+            if wait_ready:
+                while not pc.describe_index(name).status['ready']:
+                    time.sleep(1)
+        return cls(pc.Index(name, pool_threads=pool_threads), name)
+
+    def upsert(self, vectors: List[tuple]):
+        self.index.upsert(vectors=vectors)
+
+    def query(self, vector, top_k=5, filter=None, include_metadata=True, include_values=False) -> dict:
+        kwargs = {"vector": vector, "top_k": top_k, "include_metadata": include_metadata,
+                  "include_values": include_values}
+        if filter:
+            kwargs["filter"] = filter
+        results = self.index.query(**kwargs)
+        matches = []
+        for m in results.matches:
+            match = {"id": m.id, "score": m.score}
+            if include_values:
+                match["values"] = list(m.values or [])
+            if include_metadata:
+                match["metadata"] = m.metadata or {}
+            matches.append(match)
+        return {"matches": matches}
+
+    def delete(self, ids=None, filter=None):
+        if ids:
+            self.index.delete(ids=ids)
+        elif filter:
+            self.index.delete(filter=filter)
+
+    def list(self, prefix: str = ""):
+        yield from self.index.list(prefix=prefix)
+
+    def fetch(self, ids: List[str]) -> Dict[str, dict]:
+        fetched = self.index.fetch(ids=ids)
+        return {
+            vector_id: {"values": list(v.values), "metadata": v.metadata or {}}
+            for vector_id, v in fetched.vectors.items()
+        }
+
+    def ping(self):
+        self.index.describe_index_stats()
+
+    def list_sources(self) -> List[str]:
+        # Pinecone has no metadata listing; sample with a zero-vector query
+        results = self.query([0.0] * 768, top_k=1000)
+        return sorted({m["metadata"]["source"] for m in results["matches"] if "source" in m["metadata"]})
+
+# ==========================================
+# LOCAL BACKEND (memory-mapped, exact → IVF)
+# ==========================================
+def _matches_filter(metadata: dict, flt: Optional[dict]) -> bool:
+    """Subset of Pinecone's filter language: equality, $eq, $ne, $in, $nin"""
+    if not flt:
+        return True
+    for field, cond in flt.items():
+        value = metadata.get(field)
+        if isinstance(cond, dict):
+            for op, arg in cond.items():
+                if op == "$eq" and value != arg:
+                    return False
+                if op == "$ne" and value == arg:
+                    return False
+                if op == "$in" and value not in arg:
+                    return False
+                if op == "$nin" and value in arg:
+                    return False
+        elif value != cond:
+            return False
+    return True
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+class LocalVectorStore(VectorStore):
+    """
+    One directory per collection:
+      vectors.f32      float32 [capacity, dimension] memory-mapped, unit-normalised rows
+      records.sqlite   row -> id, source, metadata JSON
+      ivf.npz          k-means centroids + row assignments (large collections only)
+      lock             flock()ed exclusively by writers, shared while reloading
+    Deleted rows are marked dead and reused by later upserts.
+    """
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, root: str, name: str, dimension: int = 768,
+                 ivf_threshold: int = IVF_THRESHOLD, nprobe: int = IVF_NPROBE):
+        self.name = name
+        self.dimension = dimension
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.dir = os.path.join(root, name)
+        os.makedirs(self.dir, exist_ok=True)
+        self._lock = threading.RLock()
+        self._vectors_path = os.path.join(self.dir, "vectors.f32")
+        self._ivf_path = os.path.join(self.dir, "ivf.npz")
+        self._lock_file = open(os.path.join(self.dir, "lock"), "a+")
+
+        self._db = sqlite3.connect(os.path.join(self.dir, "records.sqlite"), check_same_thread=False,
+                                   timeout=30)
+        with self._file_lock(exclusive=True):
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                " row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, source TEXT, metadata TEXT NOT NULL)"
+            )
+            self._db.commit()
+            self._capacity = 0
+            self._matrix = None
+            self._load()
+
+    # ---------- cross-process sync ----------
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        """flock() the collection against other processes (never nested)"""
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _changed(self) -> bool:
+        """Has another connection committed since the last load?"""
+        return self._db.execute("PRAGMA data_version").fetchone()[0] != self._data_version
+
+    def _load(self):
+        """(Re)build the in-memory view from disk (caller holds the file lock)"""
+        self._data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        self._row_of: Dict[str, int] = {}
+        self._id_of: Dict[int, str] = {}
+        self._metadata: Dict[int, dict] = {}
+        self._rows_by_source: Dict[str, set] = {}
+        for row, vector_id, source, meta in self._db.execute("SELECT row, id, source, metadata FROM records"):
+            self._remember(row, vector_id, json.loads(meta))
+
+        self._next_row = max(self._id_of) + 1 if self._id_of else 0
+        self._free = sorted(set(range(self._next_row)) - set(self._id_of), reverse=True)
+
+        capacity = max(self.INITIAL_CAPACITY, self._next_row, self._rows_on_disk())
+        if self._matrix is None or capacity != self._capacity:
+            self._open_matrix(capacity)
+        self._alive = np.zeros(self._capacity, dtype=bool)
+        if self._id_of:
+            self._alive[list(self._id_of)] = True
+
+        # IVF state: centroids [nlist, dim], assign[row] = partition or -1
+        self._centroids = None
+        self._assign = np.full(self._capacity, -1, dtype=np.int32)
+        self._ivf_built_size = 0
+        self._load_ivf()
+
+    def _refresh(self):
+        """Pick up other processes' writes before a read (caller holds self._lock)"""
+        if self._changed():
+            with self._file_lock(exclusive=False):
+                self._load()
+
+    # ---------- storage ----------
+    def _rows_on_disk(self) -> int:
+        if not os.path.exists(self._vectors_path):
+            return 0
+        return os.path.getsize(self._vectors_path) // (4 * self.dimension)
+
+    def _open_matrix(self, capacity: int):
+        # Never truncate rows another process has already written
+        capacity = max(capacity, self._rows_on_disk())
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(capacity * self.dimension * 4)
+        self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r+",
+                                 shape=(capacity, self.dimension))
+        self._capacity = capacity
+
+    def _grow(self, needed: int):
+        capacity = max(needed, self._capacity * 2)
+        self._open_matrix(capacity)
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:len(self._alive)] = self._alive
+        self._alive = alive
+        assign = np.full(capacity, -1, dtype=np.int32)
+        assign[:len(self._assign)] = self._assign
+        self._assign = assign
+
+    def _remember(self, row: int, vector_id: str, metadata: dict):
+        self._row_of[vector_id] = row
+        self._id_of[row] = vector_id
+        self._metadata[row] = metadata
+        source = metadata.get("source")
+        if source is not None:
+            self._rows_by_source.setdefault(source, set()).add(row)
+
+    def _forget(self, row: int):
+        vector_id = self._id_of.pop(row)
+        del self._row_of[vector_id]
+        metadata = self._metadata.pop(row)
+        source = metadata.get("source")
+        if source in self._rows_by_source:
+            self._rows_by_source[source].discard(row)
+            if not self._rows_by_source[source]:
+                del self._rows_by_source[source]
+        self._alive[row] = False
+        self._assign[row] = -1
+        self._free.append(row)
+
+    # ---------- writes ----------
+    def upsert(self, vectors: List[tuple]):
+        if not vectors:
+            return
+        with self._lock, self._file_lock(exclusive=True):
+            if self._changed():
+                self._load()
+            values = _normalize(np.asarray([v[1] for v in vectors], dtype=np.float32))
+            db_rows = []
+            for (vector_id, _, metadata), unit in zip(vectors, values):
+                metadata = metadata or {}
+                row = self._row_of.get(vector_id)
+                if row is not None:
+                    self._forget(row)
+                    self._free.remove(row)
+                elif self._free:
+                    row = self._free.pop()
+                else:
+                    row = self._next_row
+                    self._next_row += 1
+                    if row >= self._capacity:
+                        self._grow(row + 1)
+                self._matrix[row] = unit
+                self._alive[row] = True
+                self._remember(row, vector_id, metadata)
+                if self._centroids is not None:
+                    self._assign[row] = int(np.argmax(self._centroids @ unit))
+                db_rows.append((row, vector_id, metadata.get("source"), json.dumps(metadata)))
+
+            self._matrix.flush()
+            self._db.executemany(
+                "INSERT OR REPLACE INTO records (row, id, source, metadata) VALUES (?, ?, ?, ?)", db_rows
+            )
+            self._db.commit()
+            self._maybe_build_ivf()
+
+    def delete(self, ids=None, filter=None):
+        with self._lock, self._file_lock(exclusive=True):
+            if self._changed():
+                self._load()
+            if ids:
+                rows = [self._row_of[i] for i in ids if i in self._row_of]
+            elif filter:
+                rows = [r for r in self._candidate_rows(filter)]
+            else:
+                return
+            for row in rows:
+                self._forget(row)
+            self._db.executemany("DELETE FROM records WHERE row = ?", [(r,) for r in rows])
+            self._db.commit()
+
+    # ---------- IVF ----------
+    def _maybe_build_ivf(self):
+        size = len(self._id_of)
+        if size < self.ivf_threshold:
+            return
+        if self._centroids is not None and size < 2 * self._ivf_built_size:
+            return
+        self._build_ivf()
+
+    def build_ivf(self, iterations: int = 10, seed: int = 0):
+        """(Re)partition the collection with spherical k-means"""
+        with self._lock, self._file_lock(exclusive=True):
+            if self._changed():
+                self._load()
+            self._build_ivf(iterations, seed)
+
+    def _build_ivf(self, iterations: int = 10, seed: int = 0):
+        """build_ivf() for callers that already hold both locks"""
+        rows = np.flatnonzero(self._alive[:self._next_row])
+        if len(rows) == 0:
+            return
+        nlist = int(min(4096, max(16, math.sqrt(len(rows)))))
+        rng = np.random.default_rng(seed)
+        sample = rows if len(rows) <= nlist * 64 else rng.choice(rows, nlist * 64, replace=False)
+        data = np.asarray(self._matrix[np.sort(sample)])
+        centroids = data[rng.choice(len(data), min(nlist, len(data)), replace=False)]
+
+        for _ in range(iterations):
+            labels = np.argmax(data @ centroids.T, axis=1)
+            for c in range(len(centroids)):
+                members = data[labels == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+
+        assign = np.full(self._capacity, -1, dtype=np.int32)
+        for start in range(0, len(rows), 8192):
+            part = rows[start:start + 8192]
+            assign[part] = np.argmax(self._matrix[part] @ centroids.T, axis=1)
+
+        self._centroids = centroids.astype(np.float32)
+        self._assign = assign
+        self._ivf_built_size = len(rows)
+        # Written aside and renamed, so another process never loads half a file
+        tmp_path = self._ivf_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, centroids=self._centroids, assign=assign[:self._next_row],
+                     built_size=np.array([self._ivf_built_size]))
+        os.replace(tmp_path, self._ivf_path)
+        print(f"🧭 Built IVF index for '{self.name}': {len(centroids)} partitions over {len(rows)} vectors")
+
+    def _load_ivf(self):
+        if not os.path.exists(self._ivf_path) or len(self._id_of) < self.ivf_threshold:
+            return
+        saved = np.load(self._ivf_path)
+        self._centroids = saved["centroids"]
+        assign = saved["assign"]
+        self._assign[:len(assign)] = assign[:self._capacity]
+        self._ivf_built_size = int(saved["built_size"][0])
+        # Rows written after the last build (or by an older process) get assigned now
+        missing = np.flatnonzero(self._alive[:self._next_row] & (self._assign[:self._next_row] < 0))
+        if len(missing):
+            self._assign[missing] = np.argmax(self._matrix[missing] @ self._centroids.T, axis=1)
+
+    # ---------- reads ----------
+    def _candidate_rows(self, flt: Optional[dict]):
+        """Rows passing a metadata filter; the common source filter uses an index"""
+        if flt and set(flt) == {"source"}:
+            cond = flt["source"]
+            if not isinstance(cond, dict):
+                return sorted(self._rows_by_source.get(cond, ()))
+            if set(cond) == {"$eq"}:
+                return sorted(self._rows_by_source.get(cond["$eq"], ()))
+            if set(cond) == {"$in"}:
+                return sorted(set().union(*(self._rows_by_source.get(s, set()) for s in cond["$in"])))
+        return [row for row, meta in self._metadata.items() if _matches_filter(meta, flt)]
+
+    def query(self, vector, top_k=5, filter=None, include_metadata=True, include_values=False) -> dict:
+        q = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        if norm:
+            q = q / norm
+
+        with self._lock:
+            self._refresh()
+            n = self._next_row
+            if filter:
+                rows = np.asarray(self._candidate_rows(filter), dtype=np.int64)
+            elif self._centroids is not None:
+                probe = np.argsort(-(self._centroids @ q))[:self.nprobe]
+                rows = np.flatnonzero(self._alive[:n] & np.isin(self._assign[:n], probe))
+            else:
+                rows = None
+
+            if rows is None:
+                scores = self._matrix[:n] @ q
+                scores[~self._alive[:n]] = -np.inf
+                candidates = np.arange(n)
+            else:
+                if len(rows) == 0:
+                    return {"matches": []}
+                scores = self._matrix[rows] @ q
+                candidates = rows
+
+            k = min(top_k, int(np.isfinite(scores).sum()))
+            if k <= 0:
+                return {"matches": []}
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            matches = []
+            for i in top:
+                row = int(candidates[i])
+                match = {"id": self._id_of[row], "score": float(scores[i])}
+                if include_values:
+                    match["values"] = self._matrix[row].tolist()
+                if include_metadata:
+                    match["metadata"] = dict(self._metadata[row])
+                matches.append(match)
+            return {"matches": matches}
+
+    def list(self, prefix: str = ""):
+        with self._lock:
+            self._refresh()
+            ids = sorted(i for i in self._row_of if i.startswith(prefix))
+        for start in range(0, len(ids), LIST_PAGE_SIZE):
+            yield ids[start:start + LIST_PAGE_SIZE]
+
+    def fetch(self, ids: List[str]) -> Dict[str, dict]:
+        with self._lock:
+            self._refresh()
+            return {
+                i: {"values": self._matrix[self._row_of[i]].tolist(),
+                    "metadata": dict(self._metadata[self._row_of[i]])}
+                for i in ids if i in self._row_of
+            }
+
+    def list_sources(self) -> List[str]:
+        with self._lock:
+            self._refresh()
+            return sorted(self._rows_by_source)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._id_of)
+
+# ==========================================
+# LAZY HANDLE
+# ==========================================
+class LazyVectorStore(VectorStore):
+    """
+    Defers opening a store until its first use, so importing the app makes
+    no network calls. The opened handle is cached and shared by every
+    request for the life of the process.
+    """
+    def __init__(self, name: str, opener: Callable[[], VectorStore]):
+        self.name = name
+        self._opener = opener
+        self._store: Optional[VectorStore] = None
+        self._lock = threading.Lock()
+
+    @property
+    def opened(self) -> bool:
+        return self._store is not None
+
+    def open(self) -> VectorStore:
+        store = self._store
+        if store is None:
+            with self._lock:
+                if self._store is None:
+                    self._store = self._opener()
+                store = self._store
+        return store
+
+    def upsert(self, vectors):
+        self.open().upsert(vectors)
+
+    def query(self, vector, top_k=5, filter=None, include_metadata=True, include_values=False) -> dict:
+        return self.open().query(vector, top_k=top_k, filter=filter,
+                                 include_metadata=include_metadata, include_values=include_values)
+
+    def delete(self, ids=None, filter=None):
+        self.open().delete(ids=ids, filter=filter)
+
+    def list(self, prefix: str = ""):
+        yield from self.open().list(prefix=prefix)
+
+    def fetch(self, ids: List[str]) -> Dict[str, dict]:
+        return self.open().fetch(ids)
+
+    def list_sources(self) -> List[str]:
+        return self.open().list_sources()
+
+    def ping(self):
+        self.open().ping()
+
+# ==========================================
+# FACTORY
+# ==========================================
+def open_vector_store(name: str, backend: str = "pinecone", dimension: int = 768,
+                      pinecone_client=None, local_dir: str = DEFAULT_LOCAL_DIR,
+                      cloud: str = "aws", region: str = "us-east-1",
+                      wait_ready: bool = False, host: Optional[str] = None,
+                      pool_threads: int = 1, lazy: bool = False) -> VectorStore:
+    """
+    Open the named collection on the configured backend ("pinecone" or "local").
+    lazy=True returns a LazyVectorStore that connects on first use.
+    """
+    if lazy:
+        return LazyVectorStore(name, lambda: open_vector_store(
+            name, backend, dimension, pinecone_client, local_dir, cloud, region,
+            wait_ready, host, pool_threads
+        ))
+    if backend == "local":
+        return LocalVectorStore(local_dir, name, dimension)
+    if backend == "pinecone":
+        return PineconeStore.connect(pinecone_client, name, dimension, cloud, region, wait_ready,
+                                     host, pool_threads)
+    raise ValueError(f"Unknown vector backend: {backend}")
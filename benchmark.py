@@ -0,0 +1,623 @@
+import os
+import sys
+import json
+import time
+import zlib
+import random
+import threading
+import argparse
+import asyncio
+import resource
+import platform
+import tempfile
+import contextlib
+import subprocess
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+# ==========================================
+# OFFLINE PERFORMANCE BENCHMARKS
+# ==========================================
+# Drives the real FastAPI app (backend/main.py) with no network access:
+#   - Gemini is replaced by a deterministic fake embedder and a fake
+#     generator with configurable latency
+#   - Pinecone is replaced by an in-memory vector store with an optional
+#     simulated round-trip latency
+# Results are written as JSON so runs can be compared between commits:
+#
+#   python benchmark.py --output before.json
+#   python benchmark.py --output after.json --compare before.json
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+sys.path.insert(0, BACKEND_DIR)
+from vector_store import VectorStore
+
+EMBED_DIM = 768
+
+VOCABULARY = (
+    "investment impact fund portfolio gender lens equity diligence founder "
+    "venture capital climate health women entrepreneurs emerging markets "
+    "blended finance returns measurement framework indicator reporting "
+    "governance board term sheet valuation pipeline sourcing screening "
+    "exit strategy risk mitigation toolkit guideline template workshop"
+).split()
+
+# ==========================================
+# 1. FAKE GEMINI CLIENT
+# ==========================================
+def fake_embedding(text: str) -> List[float]:
+    """
+    Deterministic bag-of-words vector: each word lands in a fixed dimension,
+    so texts sharing words get a high cosine score, like a real embedder.
+    """
+    vector = np.zeros(EMBED_DIM, dtype=np.float32)
+    for word in text.lower().split():
+        h = zlib.crc32(word.encode("utf-8"))
+        vector[h % EMBED_DIM] += 1.0 if (h >> 16) & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector.tolist()
+
+class _Values:
+    def __init__(self, values):
+        self.values = values
+
+class _EmbedResponse:
+    def __init__(self, vectors):
+        self.embeddings = [_Values(v) for v in vectors]
+
+class _TextResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeModels:
+    def __init__(self, embed_latency_s: float, generate_latency_s: float,
+                 reply_tokens: int, token_latency_s: float):
+        self.embed_latency_s = embed_latency_s
+        self.generate_latency_s = generate_latency_s
+        self.reply_tokens = reply_tokens
+        self.token_latency_s = token_latency_s
+        self.embed_calls = 0
+        self.generate_calls = 0
+
+    def _reply(self, prompt: str) -> List[str]:
+        rng = random.Random(zlib.crc32(prompt.encode("utf-8")))
+        return [rng.choice(VOCABULARY) + " " for _ in range(self.reply_tokens)]
+
+    async def get(self, model):
+        return {"name": model}
+
+    async def embed_content(self, model, contents, config=None):
+        self.embed_calls += 1
+        await asyncio.sleep(self.embed_latency_s)
+        texts = [contents] if isinstance(contents, str) else list(contents)
+        return _EmbedResponse([fake_embedding(t) for t in texts])
+
+    async def generate_content(self, model, contents, config=None):
+        self.generate_calls += 1
+        await asyncio.sleep(self.generate_latency_s + self.token_latency_s * self.reply_tokens)
+        return _TextResponse("".join(self._reply(str(contents))))
+
+    async def generate_content_stream(self, model, contents, config=None):
+        self.generate_calls += 1
+        pieces = self._reply(str(contents))
+
+        async def stream():
+            await asyncio.sleep(self.generate_latency_s)
+            for piece in pieces:
+                await asyncio.sleep(self.token_latency_s)
+                yield _TextResponse(piece)
+
+        return stream()
+
+class FakeGenaiClient:
+    def __init__(self, models: FakeModels):
+        self.models = models
+        self.aio = self
+
+# ==========================================
+# 2. IN-MEMORY VECTOR STORE
+# ==========================================
+class InMemoryVectorStore(VectorStore):
+    """Exact cosine search over a dict, with optional per-call latency"""
+
+    def __init__(self, name: str, latency_s: float = 0.0):
+        self.name = name
+        self.latency_s = latency_s
+        self._records = {}     # id -> (normalised vector, values, metadata)
+        self._matrix = None    # Rebuilt lazily after writes
+        self._ids = []
+        self._lock = threading.Lock()  # Upserts run in worker threads alongside queries
+
+    def _wait(self):
+        if self.latency_s:
+            time.sleep(self.latency_s)
+
+    def _snapshot(self):
+        if self._matrix is None:
+            self._ids = list(self._records)
+            self._matrix = (
+                np.stack([self._records[i][0] for i in self._ids])
+                if self._ids else np.zeros((0, EMBED_DIM), dtype=np.float32)
+            )
+        return self._ids, self._matrix
+
+    @staticmethod
+    def _matches(metadata: dict, filter: Optional[dict]) -> bool:
+        for key, cond in (filter or {}).items():
+            value = metadata.get(key)
+            if isinstance(cond, dict):
+                if "$eq" in cond and value != cond["$eq"]:
+                    return False
+                if "$in" in cond and value not in cond["$in"]:
+                    return False
+            elif value != cond:
+                return False
+        return True
+
+    def upsert(self, vectors: List[tuple]):
+        self._wait()
+        with self._lock:
+            for vector_id, values, metadata in vectors:
+                v = np.asarray(values, dtype=np.float32)
+                norm = np.linalg.norm(v)
+                self._records[vector_id] = (v / norm if norm else v, list(values), dict(metadata or {}))
+            self._matrix = None
+
+    def query(self, vector, top_k=5, filter=None, include_metadata=True, include_values=False) -> dict:
+        self._wait()
+        with self._lock:
+            ids, matrix = self._snapshot()
+            records = [self._records[i] for i in ids]
+        if not ids:
+            return {"matches": []}
+        q = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        scores = matrix @ (q / norm if norm else q)
+        matches = []
+        for i in np.argsort(-scores):
+            _, values, metadata = records[i]
+            if not self._matches(metadata, filter):
+                continue
+            match = {"id": ids[i], "score": float(scores[i])}
+            if include_values:
+                match["values"] = values
+            if include_metadata:
+                match["metadata"] = metadata
+            matches.append(match)
+            if len(matches) >= top_k:
+                break
+        return {"matches": matches}
+
+    def delete(self, ids=None, filter=None):
+        self._wait()
+        with self._lock:
+            if ids:
+                for vector_id in ids:
+                    self._records.pop(vector_id, None)
+            elif filter:
+                self._records = {k: r for k, r in self._records.items() if not self._matches(r[2], filter)}
+            self._matrix = None
+
+    def list(self, prefix: str = "") -> Iterator[List[str]]:
+        self._wait()
+        with self._lock:
+            ids = sorted(i for i in self._records if i.startswith(prefix))
+        for start in range(0, len(ids), 100):
+            yield ids[start:start + 100]
+
+    def fetch(self, ids: List[str]) -> Dict[str, dict]:
+        self._wait()
+        with self._lock:
+            return {
+                i: {"values": self._records[i][1], "metadata": self._records[i][2]}
+                for i in ids if i in self._records
+            }
+
+    def list_sources(self) -> List[str]:
+        with self._lock:
+            return sorted({r[2].get("source") for r in self._records.values() if r[2].get("source")})
+
+# ==========================================
+# 3. SYNTHETIC CORPUS
+# ==========================================
+def synthetic_paragraphs(rng: random.Random, count: int) -> List[tuple]:
+    """(paragraph_text, heading) tuples, as the document extractors yield them"""
+    paragraphs = []
+    heading = "Introduction"
+    for i in range(count):
+        if i % 8 == 0:
+            heading = " ".join(rng.choice(VOCABULARY) for _ in range(3)).title()
+        sentences = [
+            " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(8, 20))).capitalize() + "."
+            for _ in range(rng.randint(2, 6))
+        ]
+        paragraphs.append((" ".join(sentences), heading))
+    return paragraphs
+
+def synthetic_document(rng: random.Random, paragraphs: int) -> str:
+    return "\n\n".join(text for text, _ in synthetic_paragraphs(rng, paragraphs))
+
+def synthetic_knowledge_map(rng: random.Random, entries: int) -> list:
+    return [
+        {
+            "user_intent": " ".join(rng.choice(VOCABULARY) for _ in range(6)),
+            "tool_name": f"Tool {i}",
+            "url": f"https://example.org/tools/{i}",
+            "text_to_embed": " ".join(rng.choice(VOCABULARY) for _ in range(25)),
+        }
+        for i in range(entries)
+    ]
+
+def synthetic_questions(rng: random.Random, count: int) -> List[str]:
+    return [
+        "How do I " + " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(4, 10))) + "?"
+        for _ in range(count)
+    ]
+
+# ==========================================
+# 4. MEASUREMENT HELPERS
+# ==========================================
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+def latency_summary(latencies: List[float], elapsed: float) -> dict:
+    ms = np.asarray(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2) if len(ms) else None,
+        "p95_ms": round(float(np.percentile(ms, 95)), 2) if len(ms) else None,
+        "p99_ms": round(float(np.percentile(ms, 99)), 2) if len(ms) else None,
+        "mean_ms": round(float(ms.mean()), 2) if len(ms) else None,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+    }
+
+def report(message: str):
+    """Benchmark output goes to the real stdout even while server logs are muted"""
+    print(message, file=sys.__stdout__, flush=True)
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+# ==========================================
+# 5. BENCHMARKS
+# ==========================================
+def bench_chunking(main, rng: random.Random, paragraphs: int, repeat: int) -> dict:
+    """Pure CPU: smart_chunk_text and merge_paragraphs_into_chunks"""
+    paras = synthetic_paragraphs(rng, paragraphs)
+    text = "\n\n".join(p for p, _ in paras)
+    results = {}
+
+    for name, run in (
+        ("smart_chunk_text", lambda: main.smart_chunk_text(text)),
+        ("merge_paragraphs_into_chunks", lambda: list(main.merge_paragraphs_into_chunks(paras))),
+    ):
+        timings = []
+        chunks = 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            chunks = len(run())
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        results[name] = {
+            "input_chars": len(text),
+            "chunks": chunks,
+            "best_s": round(best, 4),
+            "chunks_per_sec": round(chunks / best, 1),
+            "mb_per_sec": round(len(text) / best / 1e6, 2),
+        }
+        report(f"  ✂️ {name}: {chunks} chunks, {results[name]['chunks_per_sec']} chunks/s")
+    return results
+
+async def wait_for_job(http, job_id: str, poll_s: float = 0.02) -> dict:
+    while True:
+        job = (await http.get(f"/ingest/jobs/{job_id}")).json()["job"]
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        await asyncio.sleep(poll_s)
+
+async def bench_ingest(http, documents: Dict[str, bytes], target_index: str = "kb") -> dict:
+    """Upload every document through /ingest and wait for all jobs to finish"""
+    start = time.perf_counter()
+    latencies = []
+    chunks = 0
+    failed = 0
+
+    async def one(filename, body):
+        nonlocal chunks, failed
+        t0 = time.perf_counter()
+        resp = await http.post(
+            "/ingest",
+            params={"target_index": target_index},
+            files={"file": (filename, body, "application/octet-stream")}
+        )
+        resp.raise_for_status()
+        job = await wait_for_job(http, resp.json()["job_id"])
+        latencies.append(time.perf_counter() - t0)
+        chunks += job["chunks_extracted"]
+        if job["status"] != "succeeded":
+            failed += 1
+
+    await asyncio.gather(*(one(name, body) for name, body in documents.items()))
+    elapsed = time.perf_counter() - start
+
+    result = latency_summary(latencies, elapsed)
+    result.update({
+        "documents": len(documents),
+        "bytes": sum(len(b) for b in documents.values()),
+        "chunks": chunks,
+        "failed": failed,
+        "elapsed_s": round(elapsed, 3),
+        "chunks_per_sec": round(chunks / elapsed, 1) if elapsed else None,
+        "peak_rss_mb": peak_rss_mb(),
+    })
+    return result
+
+async def bench_chat(http, questions: List[str], concurrency: int, bypass_cache: bool) -> dict:
+    """Fire /chat requests with at most `concurrency` in flight"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(question):
+        nonlocal errors
+        async with semaphore:
+            t0 = time.perf_counter()
+            resp = await http.post("/chat", json={"query": question, "bypass_cache": bypass_cache})
+            latencies.append(time.perf_counter() - t0)
+            if resp.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(q) for q in questions))
+    elapsed = time.perf_counter() - start
+
+    result = latency_summary(latencies, elapsed)
+    result.update({"concurrency": concurrency, "errors": errors, "peak_rss_mb": peak_rss_mb()})
+    return result
+
+async def asgi_post_stream(app, path: str, payload: dict):
+    """
+    POST straight into the ASGI app and yield (elapsed_s, body_bytes) as each
+    body chunk is sent. httpx's ASGITransport buffers whole responses, which
+    would hide time to first token.
+    """
+    body = json.dumps(payload).encode("utf-8")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": b"", "root_path": "", "server": ("benchmark", 80), "client": ("127.0.0.1", 0),
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    }
+    chunks = asyncio.Queue()
+    request_sent = False
+    t0 = time.perf_counter()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()  # No disconnect until the app is done
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            await chunks.put((time.perf_counter() - t0, message.get("body", b"")))
+            if not message.get("more_body", False):
+                await chunks.put(None)
+
+    task = asyncio.create_task(app(scope, receive, send))
+    try:
+        while True:
+            item = await chunks.get()
+            if item is None:
+                break
+            yield item
+        await task
+    finally:
+        task.cancel()
+
+async def bench_chat_stream(app, questions: List[str], concurrency: int) -> dict:
+    """Time to first token and to the done event on /chat/stream"""
+    semaphore = asyncio.Semaphore(concurrency)
+    first_token = []
+    complete = []
+    errors = 0
+
+    async def one(question):
+        nonlocal errors
+        async with semaphore:
+            seen_token = False
+            elapsed = 0.0
+            async for elapsed, data in asgi_post_stream(app, "/chat/stream", {"query": question, "bypass_cache": True}):
+                if not seen_token and b"event: token" in data:
+                    first_token.append(elapsed)
+                    seen_token = True
+                if b"event: error" in data:
+                    errors += 1
+            complete.append(elapsed)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(q) for q in questions))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "time_to_first_token": latency_summary(first_token, elapsed),
+        "complete": latency_summary(complete, elapsed),
+        "concurrency": concurrency,
+        "errors": errors,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+# ==========================================
+# 6. RUNNER
+# ==========================================
+def configure_environment(workdir: str):
+    """Point main.py at throwaway local state before it is imported"""
+    os.environ.update({
+        "GEMINI_API_KEY": "offline-benchmark",
+        "PINECONE_INDEX_NAME": "bench-kb",
+        "KNOWLEDGE_MAP_INDEX_NAME": "bench-km",
+        "VECTOR_BACKEND": "local",
+        "LOCAL_VECTOR_DIR": os.path.join(workdir, "vectors"),
+        "EMBED_STORE_PATH": os.path.join(workdir, "embeddings.sqlite"),
+        "DOCUMENT_REGISTRY_PATH": os.path.join(workdir, "documents.sqlite"),
+        "LEXICAL_INDEX_PATH": os.path.join(workdir, "lexical.sqlite"),
+        "INGEST_JOBS_PATH": os.path.join(workdir, "jobs.sqlite"),
+        # The fake client has no context-caching API
+        "PROMPT_CACHE_ENABLED": "0",
+    })
+
+async def run_benchmarks(args, main, models: FakeModels) -> dict:
+    import httpx
+
+    rng = random.Random(args.seed)
+    results = {}
+
+    report("✂️ Chunking")
+    results["chunking"] = bench_chunking(main, rng, args.chunk_paragraphs, args.repeat)
+
+    app = main.app
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=300) as http:
+            report("🗺️ Ingest: Knowledge Map")
+            km = json.dumps(synthetic_knowledge_map(rng, args.km_entries)).encode("utf-8")
+            results["ingest_km"] = await bench_ingest(http, {"bench-km.json": km}, target_index="km")
+
+            report("📄 Ingest: Knowledge Base")
+            documents = {
+                f"bench-doc-{i}.txt": synthetic_document(rng, args.doc_paragraphs).encode("utf-8")
+                for i in range(args.documents)
+            }
+            results["ingest_kb"] = await bench_ingest(http, documents)
+            report(f"  {results['ingest_kb']['chunks']} chunks, {results['ingest_kb']['chunks_per_sec']} chunks/s")
+
+            report("🔁 Re-ingest: unchanged documents")
+            results["reingest_unchanged"] = await bench_ingest(http, documents)
+
+            questions = synthetic_questions(rng, args.requests)
+            for concurrency in args.concurrency:
+                report(f"💬 Chat (uncached), concurrency {concurrency}")
+                r = await bench_chat(http, questions, concurrency, bypass_cache=True)
+                results[f"chat_c{concurrency}"] = r
+                report(f"  p50 {r['p50_ms']} ms, p95 {r['p95_ms']} ms, p99 {r['p99_ms']} ms, {r['throughput_rps']} req/s")
+
+            report("💾 Chat (response cache warm)")
+            await bench_chat(http, questions, max(args.concurrency), bypass_cache=False)
+            results["chat_cached"] = await bench_chat(http, questions, max(args.concurrency), bypass_cache=False)
+
+            report("📡 Chat stream")
+            results["chat_stream"] = await bench_chat_stream(app, questions, max(args.concurrency))
+
+            # Admission control should keep chat latency flat while ingestion saturates Gemini
+            report("🚦 Chat (uncached) while ingesting")
+            load = {
+                f"bench-load-{i}.txt": synthetic_document(rng, args.doc_paragraphs).encode("utf-8")
+                for i in range(args.documents)
+            }
+            ingest_task = asyncio.create_task(bench_ingest(http, load))
+            r = await bench_chat(http, synthetic_questions(rng, args.requests), max(args.concurrency), bypass_cache=True)
+            results["chat_during_ingest"] = r
+            results["ingest_during_chat"] = await ingest_task
+            report(f"  p50 {r['p50_ms']} ms, p95 {r['p95_ms']} ms, p99 {r['p99_ms']} ms, {r['errors']} errors")
+
+    results["fake_calls"] = {"embed": models.embed_calls, "generate": models.generate_calls}
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+def compare(current: dict, baseline: dict, path: str = ""):
+    """Print numeric changes between two result trees"""
+    for key, value in current.items():
+        name = f"{path}.{key}" if path else key
+        old = baseline.get(key) if isinstance(baseline, dict) else None
+        if isinstance(value, dict):
+            compare(value, old or {}, name)
+        elif isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+            change = (value - old) / old * 100
+            if abs(change) >= 1:
+                report(f"  {name}: {old} -> {value} ({change:+.1f}%)")
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Offline latency/throughput benchmarks for the MIV backend")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="Earlier results JSON to diff against")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--requests", type=int, default=200, help="Chat requests per scenario")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--documents", type=int, default=8, help="KB documents to ingest")
+    parser.add_argument("--doc-paragraphs", type=int, default=400, help="Paragraphs per KB document")
+    parser.add_argument("--km-entries", type=int, default=60)
+    parser.add_argument("--chunk-paragraphs", type=int, default=5000, help="Paragraphs for the chunking benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per chunking benchmark (best is kept)")
+    parser.add_argument("--embed-latency-ms", type=float, default=20)
+    parser.add_argument("--generate-latency-ms", type=float, default=150, help="Fake generator latency before the first token")
+    parser.add_argument("--token-latency-ms", type=float, default=2)
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument("--store-latency-ms", type=float, default=15, help="Simulated vector store round trip")
+    parser.add_argument("--embed-rpm", type=float, default=1_000_000, help="Embedding quota for admission control")
+    parser.add_argument("--generate-rpm", type=float, default=1_000_000, help="Generation quota for admission control")
+    parser.add_argument("--verbose", action="store_true", help="Show the server's own logging")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="miv-bench-")
+    configure_environment(workdir)
+    os.environ.update({"EMBED_RPM": str(args.embed_rpm), "GENERATE_RPM": str(args.generate_rpm)})
+
+    log_sink = open(os.devnull, "w") if not args.verbose else sys.stdout
+    with contextlib.redirect_stdout(log_sink):
+        import main
+
+        # Swap the network clients for the offline stand-ins
+        models = FakeModels(
+            args.embed_latency_ms / 1000,
+            args.generate_latency_ms / 1000,
+            args.reply_tokens,
+            args.token_latency_ms / 1000,
+        )
+        main.client = FakeGenaiClient(models)
+        main.index_kb = InMemoryVectorStore("bench-kb", args.store_latency_ms / 1000)
+        main.index_km = InMemoryVectorStore("bench-km", args.store_latency_ms / 1000)
+        # Nothing else may reach the network: the prompt cache holds its own
+        # client, and warm-up would download the local tokenizer model
+        main.prompt_cache.client = main.client
+        main.token_counter.load = lambda: False
+
+        started = time.time()
+        results = asyncio.run(run_benchmarks(args, main, models))
+
+    output = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": started,
+            "duration_s": round(time.time() - started, 2),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+    report(f"✅ Results written to {args.output} (peak RSS {results['peak_rss_mb']} MB)")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        report(f"📊 Changes vs {args.compare} ({baseline['meta'].get('commit')}):")
+        compare(results, baseline["results"])
+
+
+if __name__ == "__main__":
+    main_cli()
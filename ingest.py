@@ -1,13 +1,25 @@
 import os
-import time
+import sys
 import glob
 import json
+import asyncio
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
-from pinecone import Pinecone, ServerlessSpec
-import google.generativeai as genai
+from pinecone import Pinecone
+from google import genai
+from google.genai import types
 from pypdf import PdfReader
 from docx import Document
 
+# Shared batched embedding engine lives with the API server
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from embedding_engine import embed_and_upsert
+from embedding_store import EmbeddingStore, DEFAULT_STORE_PATH
+from vector_store import open_vector_store, DEFAULT_LOCAL_DIR
+from document_registry import DocumentRegistry, DEFAULT_REGISTRY_PATH, file_sha256
+from lexical_index import LexicalIndex, DEFAULT_LEXICAL_PATH
+
 
 # 0. Configuration
 
@@ -17,6 +29,8 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME")
 PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENVIRONMENT")
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone").lower()
+LOCAL_VECTOR_DIR = os.getenv("LOCAL_VECTOR_DIR") or DEFAULT_LOCAL_DIR
 
 
 PDF_DIRECTORY = "data"
@@ -25,18 +39,18 @@ CHUNK_OVERLAP = 200
 EMBEDDING_MODEL = "text-embedding-004"
 EMBEDDING_DIMENSION = 768
 BATCH_SIZE = 100
-
-if not all([GEMINI_API_KEY, PINECONE_API_KEY, PINECONE_ENVIRONMENT, PINECONE_INDEX_NAME]):
-    print("❌ Missing API keys in .env")
-    exit()
+EMBED_CONCURRENCY = 4
+PAGES_PER_TASK = 20   # Large PDFs are split into page ranges of this size
 
 
 # 1. Help functions
 
-def extract_text_from_pdf(file_path: str) -> str:
+def extract_text_from_pdf(file_path: str, start: int = 0, stop: int = None) -> str:
+    """Text of pages [start, stop) of a PDF; the whole document by default"""
     try:
         reader = PdfReader(file_path)
-        return "".join([page.extract_text() or "" for page in reader.pages])
+        pages = reader.pages[start:stop]
+        return "".join([page.extract_text() or "" for page in pages])
     except Exception as e:
         print(f"Error reading PDF {file_path}: {e}")
         return ""
@@ -59,104 +73,199 @@ def split_text(text: str) -> list[str]:
     return chunks
 
 
-# 2. Load ingested files log
-
-log_file = "ingested_files.json"
-if os.path.exists(log_file):
-    with open(log_file, "r") as f:
-        ingested_files = json.load(f)
-else:
-    ingested_files = []
-
-# 3. Initialize Pinecone & Gemini
-
-genai.configure(api_key=GEMINI_API_KEY)
-pc = Pinecone(api_key=PINECONE_API_KEY, environment=PINECONE_ENVIRONMENT)
+# 2. Parallel parsing
 
-# Auto-create index if missing
-if PINECONE_INDEX_NAME not in pc.list_indexes().names():
-    print(f"Creating index '{PINECONE_INDEX_NAME}'...")
-    pc.create_index(
-        name=PINECONE_INDEX_NAME,
-        dimension=EMBEDDING_DIMENSION,
-        metric="cosine",
-        spec=ServerlessSpec(cloud="aws", region=PINECONE_ENVIRONMENT)
+def count_pdf_pages(file_path: str) -> int:
+    try:
+        return len(PdfReader(file_path).pages)
+    except Exception as e:
+        print(f"Error reading PDF {file_path}: {e}")
+        return 0
+
+def plan_parse_tasks(files: list[str]) -> list[tuple]:
+    """
+    One (file_path, start, stop) task per DOCX and per PDF page range, in
+    file order, so joining the results in task order rebuilds each file.
+    """
+    tasks = []
+    for file_path in files:
+        if not file_path.lower().endswith(".pdf"):
+            tasks.append((file_path, 0, None))
+            continue
+        page_count = count_pdf_pages(file_path)
+        for start in range(0, max(page_count, 1), PAGES_PER_TASK):
+            tasks.append((file_path, start, start + PAGES_PER_TASK))
+    return tasks
+
+def parse_task(task: tuple) -> str:
+    """Runs in a worker process"""
+    file_path, start, stop = task
+    if file_path.lower().endswith(".pdf"):
+        return extract_text_from_pdf(file_path, start, stop)
+    return extract_text_from_docx(file_path)
+
+def parse_files(files: list[str], workers: int) -> dict:
+    """
+    Extract text from every file across a process pool (pypdf is CPU-bound
+    and holds the GIL). Returns {file_path: text} in the order of `files`.
+    """
+    tasks = plan_parse_tasks(files)
+    print(f"Parsing {len(files)} files as {len(tasks)} tasks on {workers} worker(s)...")
+
+    if workers <= 1 or len(tasks) <= 1:
+        results = [parse_task(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # map() yields results in submission order, whatever order they finish in
+            results = list(pool.map(parse_task, tasks))
+
+    texts = {file_path: "" for file_path in files}
+    for (file_path, _, _), text in zip(tasks, results):
+        texts[file_path] += text
+    return texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk ingest PDF/DOCX files from data/ into the KB index")
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1,
+        help="Parser processes (default: number of CPU cores)"
     )
-    while not pc.describe_index(PINECONE_INDEX_NAME).status['ready']:
-        time.sleep(1)
-    print("Index ready.")
-
-index = pc.Index(PINECONE_INDEX_NAME)
+    args = parser.parse_args()
 
+    if not all([GEMINI_API_KEY, PINECONE_INDEX_NAME]):
+        print("❌ Missing API keys in .env")
+        exit()
+    if VECTOR_BACKEND == "pinecone" and not all([PINECONE_API_KEY, PINECONE_ENVIRONMENT]):
+        print("❌ Missing Pinecone keys in .env")
+        exit()
 
-# 4. Process new files
+    # 2. Open the document registry (shared with the API server)
 
-files = glob.glob(os.path.join(PDF_DIRECTORY, "*.pdf")) + \
-        glob.glob(os.path.join(PDF_DIRECTORY, "*.docx"))
+    registry = DocumentRegistry(os.getenv("DOCUMENT_REGISTRY_PATH") or DEFAULT_REGISTRY_PATH)
 
-files_to_process = [f for f in files if os.path.basename(f) not in ingested_files]
+    # 3. Initialize vector store & Gemini
 
-if not files_to_process:
-    print("No new files to ingest. ✅")
-    exit()
+    client = genai.Client(api_key=GEMINI_API_KEY)
+    pc = Pinecone(api_key=PINECONE_API_KEY, environment=PINECONE_ENVIRONMENT) if VECTOR_BACKEND == "pinecone" else None
 
-all_chunks = []
-
-for file_path in files_to_process:
-    filename = os.path.basename(file_path)
-    print(f"Processing: {filename}")
-
-    raw_text = extract_text_from_pdf(file_path) if filename.lower().endswith(".pdf") else extract_text_from_docx(file_path)
-    if not raw_text.strip():
-        print(f"No text found in {filename}, skipping.")
-        continue
-
-    chunks = split_text(raw_text)
-    for i, chunk in enumerate(chunks):
-        all_chunks.append({
-            "id": f"{filename}-{i}",  # Unique per file
-            "text": chunk,
-            "filename": filename
-        })
-
-print(f"Total chunks to upload: {len(all_chunks)}")
+    # Auto-creates the index if missing
+    index = open_vector_store(
+        PINECONE_INDEX_NAME,
+        VECTOR_BACKEND,
+        dimension=EMBEDDING_DIMENSION,
+        pinecone_client=pc,
+        local_dir=LOCAL_VECTOR_DIR,
+        region=PINECONE_ENVIRONMENT,
+        wait_ready=True
+    )
 
 
-# 5. Generate embeddings and upsert
+    # 4. Process new files
+
+    files = sorted(glob.glob(os.path.join(PDF_DIRECTORY, "*.pdf")) +
+                   glob.glob(os.path.join(PDF_DIRECTORY, "*.docx")))
+
+    # One-off migration from the old ingested_files.json log
+    legacy_log = "ingested_files.json"
+    if os.path.exists(legacy_log):
+        with open(legacy_log, "r") as f:
+            legacy_files = set(json.load(f))
+        for file_path in files:
+            filename = os.path.basename(file_path)
+            if filename in legacy_files and registry.get(index.name, filename) is None:
+                registry.record(index.name, filename, None, file_sha256(file_path), os.path.getsize(file_path))
+
+    # New files, and files whose content changed since they were ingested
+    hashes = {f: file_sha256(f) for f in files}
+    files_to_process = []
+    for file_path in files:
+        known = registry.get(index.name, os.path.basename(file_path))
+        if known is None or known["content_hash"] != hashes[file_path]:
+            files_to_process.append(file_path)
+
+    if not files_to_process:
+        print("No new files to ingest. ✅")
+        exit()
+
+    texts = parse_files(files_to_process, args.workers)
+    all_chunks = []
+    chunk_counts = {}
+
+    for file_path in files_to_process:
+        filename = os.path.basename(file_path)
+        print(f"Processing: {filename}")
+
+        raw_text = texts[file_path]
+        if not raw_text.strip():
+            print(f"No text found in {filename}, skipping.")
+            continue
+
+        if registry.get(index.name, filename) is not None:
+            # Changed file: chunk ids are positional, so clear the old version first
+            print(f"Replacing previous version of {filename}")
+            index.delete(filter={"source": filename})
+
+        chunks = split_text(raw_text)
+        chunk_counts[file_path] = len(chunks)
+        for i, chunk in enumerate(chunks):
+            all_chunks.append({
+                "id": f"{filename}-{i}",  # Unique per file
+                "text": chunk,
+                "filename": filename
+            })
+
+    print(f"Total chunks to upload: {len(all_chunks)}")
+
+
+    # 5. Generate embeddings and upsert
+
+    def build_vector(chunk, vector):
+        return (chunk["id"], vector, {"text": chunk["text"], "source": chunk["filename"]})
+
+    # Batched embedding with bounded concurrency; upserts overlap embedding
+    upserted = asyncio.run(embed_and_upsert(
+        client,
+        EMBEDDING_MODEL,
+        index,
+        all_chunks,
+        build_vector,
+        batch_size=BATCH_SIZE,
+        concurrency=EMBED_CONCURRENCY,
+        store=EmbeddingStore(os.getenv("EMBED_STORE_PATH") or DEFAULT_STORE_PATH),
+        config=types.EmbedContentConfig(task_type="RETRIEVAL_DOCUMENT")
+    ))
 
-vectors_to_upsert = []
+    # Failed batches: leave the registry alone so these files are retried next run
+    if upserted < len(all_chunks):
+        print(f"❌ Only {upserted} of {len(all_chunks)} chunks were embedded; re-run to retry.")
+        sys.exit(1)
 
-for i, chunk in enumerate(all_chunks, 1):
-    embedding_resp = genai.embed_content(
-        model=EMBEDDING_MODEL,
-        content=chunk["text"],
-        task_type="RETRIEVAL_DOCUMENT"
-    )
-    vector = embedding_resp['embedding']
 
-    vectors_to_upsert.append((
-        chunk["id"],
-        vector,
-        {"text": chunk["text"], "source": chunk["filename"]}
-    ))
+    # 6. Mirror the chunk texts into the API server's BM25 index
 
-    # Upsert in batches
-    if len(vectors_to_upsert) >= BATCH_SIZE:
-        index.upsert(vectors=vectors_to_upsert)
-        vectors_to_upsert = []
-        time.sleep(0.5)
+    lexical = LexicalIndex(os.getenv("LEXICAL_INDEX_PATH") or DEFAULT_LEXICAL_PATH)
+    for file_path in chunk_counts:
+        lexical.apply(delete_source=os.path.basename(file_path))
+    lexical.apply(upserts=[
+        (c["id"], {"text": c["text"], "heading": None, "source": c["filename"]})
+        for c in all_chunks
+    ])
 
-# Upsert remaining vectors
-if vectors_to_upsert:
-    index.upsert(vectors=vectors_to_upsert)
 
+    # 7. Record the ingested files in the registry
 
-# 6. Update ingested log
+    for file_path, count in chunk_counts.items():
+        registry.record(
+            index.name,
+            os.path.basename(file_path),
+            count,
+            hashes[file_path],
+            os.path.getsize(file_path)
+        )
 
-for f in files_to_process:
-    ingested_files.append(os.path.basename(f))
+    print("✅ Ingestion complete. All new PDFs/DOCX added safely.")
 
-with open(log_file, "w") as f:
-    json.dump(ingested_files, f)
 
-print("✅ Ingestion complete. All new PDFs/DOCX added safely.")
+if __name__ == "__main__":
+    main()
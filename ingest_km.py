@@ -1,10 +1,19 @@
 import os
+import sys
 import json
 import time
-from pinecone import Pinecone, ServerlessSpec
+import asyncio
+from pinecone import Pinecone
 from google import genai
 from dotenv import load_dotenv
 
+# Shared batched embedding engine lives with the API server
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from embedding_engine import embed_and_upsert
+from embedding_store import EmbeddingStore, DEFAULT_STORE_PATH
+from vector_store import open_vector_store, DEFAULT_LOCAL_DIR
+from document_registry import DocumentRegistry, DEFAULT_REGISTRY_PATH, file_sha256
+
 # -----------------------------
 # CONFIG
 # -----------------------------
@@ -16,29 +25,28 @@ KM_INDEX_NAME = os.getenv("KNOWLEDGE_MAP_INDEX_NAME", "miv-knowledge-map-index")
 EMBED_MODEL_NAME = "text-embedding-004"
 EMBEDDING_DIMENSION = 768
 BATCH_SIZE = 100
+EMBED_CONCURRENCY = 4
 KM_FILE = "data/KnowledgeMapv2.json"
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone").lower()
+LOCAL_VECTOR_DIR = os.getenv("LOCAL_VECTOR_DIR") or DEFAULT_LOCAL_DIR
 
-if not all([GEMINI_API_KEY, PINECONE_API_KEY]):
+if not GEMINI_API_KEY or (VECTOR_BACKEND == "pinecone" and not PINECONE_API_KEY):
     raise ValueError("❌ Missing GEMINI_API_KEY or PINECONE_API_KEY in .env")
 
 # -----------------------------
 # CLIENTS
 # -----------------------------
 client = genai.Client(api_key=GEMINI_API_KEY)
-pc = Pinecone(api_key=PINECONE_API_KEY)
+pc = Pinecone(api_key=PINECONE_API_KEY) if VECTOR_BACKEND == "pinecone" else None
 
 # Ensure index exists
-existing_indexes = pc.list_indexes().names()
-if KM_INDEX_NAME not in existing_indexes:
-    print(f"⚙️ Creating Knowledge Map index '{KM_INDEX_NAME}'")
-    pc.create_index(
-        KM_INDEX_NAME,
-        dimension=EMBEDDING_DIMENSION,
-        metric="cosine",
-        spec=ServerlessSpec(cloud="aws", region="us-east-1")
-    )
-
-index_km = pc.Index(KM_INDEX_NAME)
+index_km = open_vector_store(
+    KM_INDEX_NAME,
+    VECTOR_BACKEND,
+    dimension=EMBEDDING_DIMENSION,
+    pinecone_client=pc,
+    local_dir=LOCAL_VECTOR_DIR
+)
 
 # -----------------------------
 # LOAD AND INGEST KM JSON
@@ -46,23 +54,21 @@ index_km = pc.Index(KM_INDEX_NAME)
 with open(KM_FILE, "r", encoding="utf-8") as f:
     km_data = json.load(f)
 
-vectors_to_upsert = []
 start_time = time.time()
 
+km_chunks = []
 for i, entry in enumerate(km_data):
     # Use text_to_embed ONLY for embedding
     text_for_embedding = entry.get("text_to_embed", "").strip()
     if not text_for_embedding:
         continue
+    km_chunks.append({"index": i, "text": text_for_embedding, "entry": entry})
 
-    embedding_response = client.models.embed_content(
-        model=EMBED_MODEL_NAME,
-        contents=text_for_embedding
-    )
-    vector = embedding_response.embeddings[0].values
+def build_vector(chunk, vector):
+    entry = chunk["entry"]
 
     # Pinecone vector ID (the ONLY ID)
-    chunk_id = f"km-{i}"
+    chunk_id = f"km-{chunk['index']}"
 
     # Clean metadata — no duplicates
     metadata = {
@@ -73,18 +79,34 @@ for i, entry in enumerate(km_data):
         "text": entry.get("text_to_embed", "")
     }
 
-    vectors_to_upsert.append((chunk_id, vector, metadata))
-
-
-    # Batch upsert
-    if len(vectors_to_upsert) >= BATCH_SIZE:
-        index_km.upsert(vectors=vectors_to_upsert)
-        vectors_to_upsert = []
-
-# Upsert remaining vectors
-if vectors_to_upsert:
-    index_km.upsert(vectors=vectors_to_upsert)
-
+    return (chunk_id, vector, metadata)
+
+# Batched embedding with bounded concurrency; upserts overlap embedding
+upserted = asyncio.run(embed_and_upsert(
+    client,
+    EMBED_MODEL_NAME,
+    index_km,
+    km_chunks,
+    build_vector,
+    batch_size=BATCH_SIZE,
+    concurrency=EMBED_CONCURRENCY,
+    store=EmbeddingStore(os.getenv("EMBED_STORE_PATH") or DEFAULT_STORE_PATH)
+))
+
+# Failed batches: leave the registry alone so the next run retries
+if upserted < len(km_chunks):
+    print(f"❌ Only {upserted} of {len(km_chunks)} KM entries were embedded; re-run to retry.")
+    sys.exit(1)
+
+
+# Record the Knowledge Map in the registry shared with the API server
+DocumentRegistry(os.getenv("DOCUMENT_REGISTRY_PATH") or DEFAULT_REGISTRY_PATH).record(
+    index_km.name,
+    "Knowledge Map",
+    len(km_chunks),
+    file_sha256(KM_FILE),
+    os.path.getsize(KM_FILE)
+)
 
 elapsed = time.time() - start_time
 print(f"✅ KM ingestion complete: {len(km_data)} entries in {elapsed:.2f}s")
@@ -103,26 +103,10 @@
 
             if (progressWrap) progressWrap.style.display = "block";
             if (progressBar) progressBar.style.width = "0%";
-            setKbStatus("Uploading & Processing... (This may take a minute)");
+            setKbStatus("Uploading...");
 
             if (kbBtn) kbBtn.disabled = true;
 
-            let currentProgress = 0;
-            const maxFakeProgress = 95;
-            const duration = 80000;
-            const intervalTime = 500;
-            const increment = maxFakeProgress / (duration / intervalTime);
-
-            const progressInterval = setInterval(() => {
-                currentProgress += increment;
-                if (currentProgress >= maxFakeProgress) {
-                    currentProgress = maxFakeProgress;
-                }
-                if (progressBar) {
-                    progressBar.style.width = Math.round(currentProgress) + "%";
-                }
-            }, intervalTime);
-
             const fd = new FormData();
             fd.append("action", "miv_kb_upload");
             fd.append("nonce", MIV_ADMIN.nonce);
@@ -135,9 +119,11 @@
                 });
 
                 const data = await res.json();
-                clearInterval(progressInterval);
 
                 if (data.success) {
+                    setKbStatus("Processing...");
+                    await waitForIngestJob(data.data.job_id, progressBar, setKbStatus);
+
                     if (progressBar) progressBar.style.width = "100%";
                     setKbStatus('<span style="color:green;">Upload complete ✅</span>');
                     kbFileInput.value = "";
@@ -148,9 +134,9 @@
                 }
 
             } catch (err) {
-                clearInterval(progressInterval);
                 console.error(err);
-                setKbStatus('<span style="color:red;">Upload failed due to a network error.</span>');
+                const msg = err.ingestFailure ? err.message : "Upload failed due to a network error.";
+                setKbStatus('<span style="color:red;">' + escapeHtml(msg) + '</span>');
                 if (progressBar) progressBar.style.width = "0%";
             } finally {
                 if (kbBtn) kbBtn.disabled = false;
@@ -264,26 +250,10 @@
 
             if (progressWrap) progressWrap.style.display = "block";
             if (progressBar) progressBar.style.width = "0%";
-            setKmStatus("Uploading & Processing... (This may take a minute)");
+            setKmStatus("Uploading...");
 
             if (kmBtn) kmBtn.disabled = true;
 
-            let currentProgress = 0;
-            const maxFakeProgress = 95;
-            const duration = 80000;
-            const intervalTime = 500;
-            const increment = maxFakeProgress / (duration / intervalTime);
-
-            const progressInterval = setInterval(() => {
-                currentProgress += increment;
-                if (currentProgress >= maxFakeProgress) {
-                    currentProgress = maxFakeProgress;
-                }
-                if (progressBar) {
-                    progressBar.style.width = Math.round(currentProgress) + "%";
-                }
-            }, intervalTime);
-
             const fd = new FormData();
             fd.append("action", "miv_km_upload");
             fd.append("nonce", MIV_ADMIN.nonce);
@@ -296,9 +266,11 @@
                 });
 
                 const data = await res.json();
-                clearInterval(progressInterval);
 
                 if (data.success) {
+                    setKmStatus("Processing...");
+                    await waitForIngestJob(data.data.job_id, progressBar, setKmStatus);
+
                     if (progressBar) progressBar.style.width = "100%";
                     setKmStatus('<span style="color:green;">Upload complete ✅</span>');
                     kmFileInput.value = "";
@@ -309,9 +281,9 @@
                 }
 
             } catch (err) {
-                clearInterval(progressInterval);
                 console.error(err);
-                setKmStatus('<span style="color:red;">Upload failed due to a network error.</span>');
+                const msg = err.ingestFailure ? err.message : "Upload failed due to a network error.";
+                setKmStatus('<span style="color:red;">' + escapeHtml(msg) + '</span>');
                 if (progressBar) progressBar.style.width = "0%";
             } finally {
                 if (kmBtn) kmBtn.disabled = false;
@@ -321,6 +293,65 @@
         refreshKmList();
     }
 
+    // ========================================
+    // INGEST JOB POLLING
+    // ========================================
+    // Uploads are processed in the background on the backend. Poll the job
+    // until it finishes and map its real progress onto the progress bar.
+    const INGEST_POLL_MS = 1500;
+
+    function ingestJobPercent(job) {
+        if (job.status === "succeeded") return 100;
+        if (job.stage === "embedding" && job.chunks_extracted > 0) {
+            const done = job.chunks_unchanged + job.chunks_upserted;
+            return 10 + Math.round((85 * Math.min(done, job.chunks_extracted)) / job.chunks_extracted);
+        }
+        if (job.stage === "deleting") return 97;
+        return job.stage === "queued" ? 2 : 5;
+    }
+
+    function describeIngestJob(job) {
+        if (job.stage === "queued") return "Waiting for an ingest worker...";
+        if (job.stage === "extracting") return "Extracting text...";
+        if (job.stage === "deleting") return "Removing outdated chunks...";
+        if (job.stage === "embedding") {
+            return "Embedding changed chunks... " + job.chunks_upserted + " / " +
+                (job.chunks_extracted - job.chunks_unchanged);
+        }
+        return "Processing...";
+    }
+
+    async function waitForIngestJob(jobId, progressBar, setStatus) {
+        while (true) {
+            await new Promise((resolve) => setTimeout(resolve, INGEST_POLL_MS));
+
+            const fd = new FormData();
+            fd.append("action", "miv_ingest_status");
+            fd.append("nonce", MIV_ADMIN.nonce);
+            fd.append("job_id", jobId);
+
+            const res = await fetch(MIV_ADMIN.ajaxUrl, { method: "POST", body: fd });
+            const data = await res.json();
+            if (!data.success) {
+                const err = new Error(data.data?.message || "Could not read ingestion status.");
+                err.ingestFailure = true;
+                throw err;
+            }
+
+            const job = data.data;
+            if (progressBar) progressBar.style.width = ingestJobPercent(job) + "%";
+
+            if (job.status === "succeeded") return job;
+            if (job.status === "failed") {
+                const err = new Error("Ingestion failed: " + (job.error || "unknown error"));
+                err.ingestFailure = true;
+                throw err;
+            }
+
+            setStatus(escapeHtml(describeIngestJob(job)));
+        }
+    }
+
     // ========================================
     // SHARED UTILITY
     // ========================================
@@ -462,6 +462,43 @@
         } catch {
             // ignore
         }
+        resetSession();
+    }
+
+    /* -----------------------------
+       Server-side session (follow-up questions keep their context)
+    ----------------------------- */
+    const SESSION_KEY = `miv_copilot_session_${storageVersion}`;
+
+    function newSessionId() {
+        if (window.crypto && window.crypto.randomUUID) return window.crypto.randomUUID();
+        return "s" + Date.now().toString(36) + Math.random().toString(36).slice(2, 12);
+    }
+
+    function getSessionId() {
+        try {
+            let id = localStorage.getItem(SESSION_KEY);
+            if (!id) {
+                id = newSessionId();
+                localStorage.setItem(SESSION_KEY, id);
+            }
+            return id;
+        } catch {
+            return null;
+        }
+    }
+
+    function resetSession() {
+        let oldId = null;
+        try {
+            oldId = localStorage.getItem(SESSION_KEY);
+            localStorage.removeItem(SESSION_KEY);
+        } catch {
+            // ignore
+        }
+        if (oldId) {
+            fetch(backendUrl + "/sessions/" + encodeURIComponent(oldId), { method: "DELETE" }).catch(() => {});
+        }
     }
 
     function pushToHistory(role, text) {
@@ -785,16 +822,12 @@
             wrapper.setAttribute("role", "alert");
             wrapper.setAttribute("aria-live", "assertive");
 
+            // Streaming replies are announced once, when they are complete
+            if (options.streaming) wrapper.setAttribute("aria-busy", "true");
+
             const contentDiv = document.createElement("div");
             contentDiv.className = "miv-message-parsed";
-            contentDiv.innerHTML = parseMarkdown(text);
-
-            // Ensure all links open in a new tab
-            const links = contentDiv.querySelectorAll("a");
-            links.forEach((link) => {
-                link.setAttribute("target", "_blank");
-                link.setAttribute("rel", "noopener noreferrer");
-            });
+            renderAssistantContent(contentDiv, text);
 
             wrapper.appendChild(contentDiv);
         } else {
@@ -827,6 +860,39 @@
                 messagesEl.scrollTop = 0;
             }
         }
+
+        return wrapper;
+    }
+
+    function renderAssistantContent(contentDiv, text) {
+        contentDiv.innerHTML = parseMarkdown(text);
+
+        // Ensure all links open in a new tab
+        const links = contentDiv.querySelectorAll("a");
+        links.forEach((link) => {
+            link.setAttribute("target", "_blank");
+            link.setAttribute("rel", "noopener noreferrer");
+        });
+    }
+
+    // Repaint at most once per animation frame while tokens arrive
+    function updateStreamingMessage(wrapper, text) {
+        wrapper._mivPendingText = text;
+        if (wrapper._mivFrame) return;
+        wrapper._mivFrame = requestAnimationFrame(() => {
+            wrapper._mivFrame = null;
+            renderAssistantContent(wrapper.querySelector(".miv-message-parsed"), wrapper._mivPendingText);
+        });
+    }
+
+    function finishStreamingMessage(wrapper, text) {
+        if (wrapper._mivFrame) {
+            cancelAnimationFrame(wrapper._mivFrame);
+            wrapper._mivFrame = null;
+        }
+        renderAssistantContent(wrapper.querySelector(".miv-message-parsed"), text);
+        wrapper.removeAttribute("aria-busy");
+        pushToHistory("assistant", text);
     }
 
     function addTypingIndicator() {
@@ -1026,6 +1092,105 @@
         closeChat();
     });
 
+    /* -----------------------------
+       Backend requests
+       (Streams /chat/stream over Server-Sent Events, JSON /chat as fallback)
+    ----------------------------- */
+    function parseSseFrame(frame) {
+        let event = "message";
+        let data = "";
+        frame.split("\n").forEach((line) => {
+            if (line.startsWith("event:")) event = line.slice(6).trim();
+            else if (line.startsWith("data:")) data += line.slice(5).trim();
+        });
+        try {
+            return { event, data: data ? JSON.parse(data) : {} };
+        } catch {
+            return { event, data: {} };
+        }
+    }
+
+    // Resolves with the full reply text; onText receives the text so far
+    async function requestChat(query, onText) {
+        const body = JSON.stringify({
+            query: query,
+            top_k: 3,
+            system_prompt: systemPrompt,
+            session_id: getSessionId()
+        });
+
+        if (!window.ReadableStream || !window.TextDecoder) {
+            const res = await fetch(backendUrl + "/chat", {
+                method: "POST",
+                headers: { "Content-Type": "application/json" },
+                body
+            });
+            const data = await res.json();
+            return (data && data.response) || "";
+        }
+
+        const res = await fetch(backendUrl + "/chat/stream", {
+            method: "POST",
+            headers: { "Content-Type": "application/json", Accept: "text/event-stream" },
+            body
+        });
+        if (!res.ok || !res.body) throw new Error("Chat request failed with status " + res.status);
+
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        let reply = "";
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+                const frame = parseSseFrame(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+
+                if (frame.event === "token") {
+                    reply += frame.data.text || "";
+                    onText(reply);
+                } else if (frame.event === "error") {
+                    throw new Error(frame.data.detail || "Streaming failed");
+                }
+            }
+        }
+
+        return reply;
+    }
+
+    // Shows the typing indicator until the first token, then renders progressively
+    async function streamAssistantReply(query, fallbackText, scrollOpts) {
+        let streamEl = null;
+
+        try {
+            const reply = await requestChat(query, (textSoFar) => {
+                if (!streamEl) {
+                    removeTypingIndicator();
+                    streamEl = addMessage("assistant", textSoFar, Object.assign({ skipSave: true, streaming: true }, scrollOpts));
+                } else {
+                    updateStreamingMessage(streamEl, textSoFar);
+                }
+            });
+
+            removeTypingIndicator();
+            const finalText = reply || fallbackText;
+            if (streamEl) {
+                finishStreamingMessage(streamEl, finalText);
+                if (scrollOpts.scrollToBottom) messagesEl.scrollTop = messagesEl.scrollHeight;
+            } else {
+                addMessage("assistant", finalText, scrollOpts);
+            }
+        } catch (err) {
+            if (streamEl) streamEl.remove();
+            throw err;
+        }
+    }
+
     async function sendMessage(text, opts = {}) {
         if (!text || isLoading) return;
         isLoading = true;
@@ -1044,22 +1209,9 @@
         addTypingIndicator();
 
         try {
-            const res = await fetch(backendUrl + "/chat", {
-                method: "POST",
-                headers: { "Content-Type": "application/json" },
-                body: JSON.stringify({
-                    query: text,
-                    top_k: 3,
-                    system_prompt: systemPrompt
-                })
-            });
-
-            const data = await res.json();
-            removeTypingIndicator();
-
-            addMessage(
-                "assistant",
-                (data && data.response) || "I couldn't generate a response just now.",
+            await streamAssistantReply(
+                text,
+                "I couldn't generate a response just now.",
                 { scrollToMessage: true }
             );
         } catch (err) {
@@ -1084,20 +1236,9 @@
         addTypingIndicator();
 
         try {
-            const res = await fetch(backendUrl + "/chat", {
-                method: "POST",
-                headers: { "Content-Type": "application/json" },
-                body: JSON.stringify({
-                    query: promptText,
-                    top_k: 3,
-                    system_prompt: systemPrompt
-                })
-            });
-            const data = await res.json();
-            removeTypingIndicator();
-            addMessage(
-                "assistant",
-                (data && data.response) || "I couldn't generate a summary just now.",
+            await streamAssistantReply(
+                promptText,
+                "I couldn't generate a summary just now.",
                 { scrollToBottom: true }
             );
         } catch (err) {
@@ -315,6 +315,15 @@ function miv_render_admin_page()
  * AJAX endpoints
  */
 
+// Ingest time from the backend's document registry, if it has one
+function miv_format_ingested_at($doc)
+{
+    if (empty($doc['ingested_at'])) {
+        return 'Recently';
+    }
+    return wp_date(get_option('date_format') . ' ' . get_option('time_format'), (int) $doc['ingested_at']);
+}
+
 // Knowledge Base List
 add_action('wp_ajax_miv_kb_list', 'miv_kb_list');
 function miv_kb_list()
@@ -349,7 +358,7 @@ function miv_kb_list()
     foreach ($data['documents'] as $doc) {
         $files[] = array(
             'filename' => $doc['filename'],
-            'uploaded' => 'Recently'
+            'uploaded' => miv_format_ingested_at($doc)
         );
     }
 
@@ -438,7 +447,7 @@ function miv_km_list()
     foreach ($data['knowledge_maps'] as $doc) {
         $files[] = array(
             'filename' => $doc['filename'],
-            'uploaded' => 'Recently'
+            'uploaded' => miv_format_ingested_at($doc)
         );
     }
 
@@ -493,3 +502,41 @@ function miv_km_upload()
         wp_send_json_error(array('message' => 'Ingestion failed: ' . $response));
     }
 }
+
+// Ingest Job Status (polled by the admin UI while an upload is processed)
+add_action('wp_ajax_miv_ingest_status', 'miv_ingest_status');
+function miv_ingest_status()
+{
+    if (!current_user_can('manage_options')) {
+        wp_send_json_error(array('message' => 'Forbidden'));
+    }
+    check_ajax_referer('miv_admin_nonce', 'nonce');
+
+    $job_id = isset($_POST['job_id']) ? sanitize_text_field(wp_unslash($_POST['job_id'])) : '';
+    if ($job_id === '' || !preg_match('/^[a-f0-9]+$/', $job_id)) {
+        wp_send_json_error(array('message' => 'Invalid job id'));
+    }
+
+    $backend_url = miv_get_backend_url();
+
+    $response = wp_remote_get($backend_url . '/ingest/jobs/' . $job_id, array(
+        'timeout' => 15
+    ));
+
+    if (is_wp_error($response)) {
+        wp_send_json_error(array(
+            'message' => 'Could not connect to backend: ' . $response->get_error_message()
+        ));
+        return;
+    }
+
+    $body = wp_remote_retrieve_body($response);
+    $data = json_decode($body, true);
+
+    if (!isset($data['success']) || !$data['success'] || !isset($data['job'])) {
+        wp_send_json_error(array('message' => 'Backend returned an error'));
+        return;
+    }
+
+    wp_send_json_success($data['job']);
+}